@@ -0,0 +1,108 @@
+"""
+请求准入控制
+
+- 令牌桶限速：每个请求方（API Key 或 IP）一个桶，超出时返回 429
+- 并发上限：上传（生成预览）和转换/打印各自限制同时处理的请求数，
+  槽位占满且短时间等不到时返回 503，避免请求在 CPU 上排长队
+两种拒绝都带 Retry-After 响应头
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+
+class RateLimiter:
+    """
+    按请求方的令牌桶限速
+
+    Args:
+        rate_per_minute: 每分钟补充的令牌数
+        burst: 桶容量（允许的突发请求数）
+        max_clients: 最多跟踪的请求方数量，超出时丢弃最久未访问的
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_clients: int = 10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client_id: str, cost: float = 1) -> Optional[float]:
+        """
+        取令牌
+
+        Returns:
+            None 表示允许；否则为需要等待的秒数
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = TokenBucket(self.burst)
+                self._buckets[client_id] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client_id)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return None
+            if self.rate <= 0:
+                return 60.0
+            return (cost - bucket.tokens) / self.rate
+
+
+class ConcurrencyLimiter:
+    """
+    并发槽位
+
+    Args:
+        limit: 同时处理的请求数，0为不限
+        wait: 槽位占满时最多等待的秒数
+    """
+
+    def __init__(self, limit: int, wait: float = 0):
+        self.limit = limit
+        self.wait = wait
+        self._semaphore = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if self._semaphore is None:
+            return True
+        if not self._semaphore.acquire(timeout=self.wait):
+            return False
+        with self._lock:
+            self._in_use += 1
+        return True
+
+    def release(self):
+        if self._semaphore is None:
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._semaphore.release()
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After 只接受整数秒"""
+    return str(max(1, math.ceil(seconds)))
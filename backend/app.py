@@ -2,44 +2,343 @@
 Flask主应用 - 远程打印服务
 """
 import os
+import re
 import uuid
+import hmac
+import hashlib
+import atexit
 import logging
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file, render_template, abort
+from functools import wraps
+from typing import Optional
+from flask import Flask, request, jsonify, render_template, abort, Response
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 
 from backend.config import (
-    SERVICE_HOST, SERVICE_PORT, DEBUG_MODE, CUPS_SERVER, CUPS_PORT,
+    SERVICE_HOST, SERVICE_PORT, DEBUG_MODE,
     CUPS_PRINTER_NAME, UPLOAD_FOLDER, MAX_CONTENT_LENGTH, ALLOWED_EXTENSIONS,
-    PREVIEW_WIDTH, PREVIEW_HEIGHT, DEFAULT_COPIES, LOG_FILE
+    PREVIEW_WIDTH, PREVIEW_HEIGHT, DEFAULT_COPIES, LOG_LEVEL, LOG_FILE, LOG_FORMAT,
+    LOG_MAX_MB, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN, LOG_QUEUE_SIZE,
+    JOB_POLL_INTERVAL, JOB_HISTORY_LIMIT, CHANGE_LOG_LIMIT, METRICS_ENABLED, TRACING_ENABLED,
+    OFFICE_CONVERTER, SOFFICE_BINARY, SOFFICE_POOL_SIZE, SOFFICE_BASE_PORT,
+    SOFFICE_MAX_JOBS, SOFFICE_TIMEOUT, RASTER_CACHE_ENABLED, RASTER_CACHE_DPI,
+    RASTER_CACHE_PRINTERS, RASTER_CACHE_MAX_MB, JANITOR_ENABLED, JANITOR_INTERVAL,
+    JANITOR_SCAN_BATCH, FILE_RETENTION_HOURS, STORAGE_MAX_MB, USER_QUOTA_MB,
+    STORAGE_LAYOUT, PREVIEW_CACHE_MAX_AGE, DOWNLOAD_CACHE_MAX_AGE, JSON_PROVIDER,
+    COMPRESS_ENABLED, API_KEY, REQUIRE_AUTH, RATE_LIMIT_ENABLED, RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST, UPLOAD_CONCURRENCY, CONVERT_CONCURRENCY, ADMISSION_WAIT,
+    OVERLOAD_RETRY_AFTER, TRUSTED_PROXIES, SANDBOX_ENABLED, SANDBOX_WORKERS, SANDBOX_MEMORY_MB,
+    SANDBOX_CPU_SECONDS, SANDBOX_TIMEOUT, SANDBOX_MAX_TASKS, STATE_BACKEND, STATE_DB,
+    INSTANCE_ID, LEADER_LEASE_TTL, DISPATCH_INTERVAL, OBJECT_STORAGE, OBJECT_STORAGE_DIR,
+    OBJECT_CACHE_MAX_MB, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_ACCESS_KEY, S3_SECRET_KEY,
+    S3_REGION, S3_PART_SIZE_MB, PREWARM_ENABLED, PREWARM_CPU_SHARE, PREWARM_INTERVAL,
+    PREWARM_HALF_LIFE, PREWARM_MAX_LOAD, POLL_ACTIVE_INTERVAL, POLL_IDLE_INTERVAL
 )
-from backend.cups_service import CupsService
-from backend.file_handler import FileHandler
+from backend.print_backend import create_print_backend
+from backend.file_handler import FileHandler, create_isolated_handler
+from backend.job_tracker import JobTracker
+from backend.soffice_pool import SofficePool
+from backend.raster_cache import RasterCache
+from backend.sandbox import Sandbox
+from backend.file_catalog import FileCatalog
+from backend.janitor import Janitor
+from backend.state_store import StateStore, Lease
+from backend.dispatcher import JobDispatcher
+from backend.prewarm import Prewarmer
+from backend.bulk_ops import BulkOperations, ACTIONS as BULK_ACTIONS
+from backend.storage_layout import StorageLayout
+from backend.object_storage import create_object_storage
+from backend.file_serving import configure as configure_file_serving, send_stored_file
+from backend.json_provider import configure as configure_json
+from backend.http_cache import make_etag, not_modified, set_validators, compress_response
+from backend.admission import RateLimiter, ConcurrencyLimiter, retry_after_header
+from backend.log_setup import configure_logging, job_context
 from backend.models import PrintJob, PrintJobStatus
+from backend import metrics, tracing
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
+configure_logging(
+    level=LOG_LEVEL,
+    log_file=LOG_FILE,
+    log_format=LOG_FORMAT,
+    max_bytes=LOG_MAX_MB * 1024 * 1024,
+    backup_count=LOG_BACKUP_COUNT,
+    rotate_when=LOG_ROTATE_WHEN,
+    queue_size=LOG_QUEUE_SIZE
 )
 logger = logging.getLogger(__name__)
 
 # 创建应用
 app = Flask(__name__, static_url_path='/static', static_folder='/app/frontend/static')
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+configure_file_serving(app)
+configure_json(app, JSON_PROVIDER)
+if TRUSTED_PROXIES > 0:
+    # 按 X-Forwarded-For 取得真实客户端IP，限速和配额才能区分请求方
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
 CORS(app)
 
 # 初始化服务
-cups_service = CupsService(server=CUPS_SERVER, port=CUPS_PORT)
-file_handler = FileHandler(UPLOAD_FOLDER, os.path.join(UPLOAD_FOLDER, 'previews'))
+print_backend = create_print_backend()
 
-# 存储打印任务
-print_jobs = {}
+def create_office_pool():
+    """按配置创建 LibreOffice 进程池，不可用时返回None"""
+    if OFFICE_CONVERTER != 'libreoffice':
+        return None
+    if not SofficePool.available(SOFFICE_BINARY):
+        logger.warning("未找到 soffice 或 python3-uno，使用内置Office转换")
+        return None
+    pool = SofficePool(
+        size=SOFFICE_POOL_SIZE,
+        binary=SOFFICE_BINARY,
+        base_port=SOFFICE_BASE_PORT,
+        max_jobs=SOFFICE_MAX_JOBS,
+        timeout=SOFFICE_TIMEOUT
+    )
+    pool.start()
+    atexit.register(pool.shutdown)
+    return pool
+
+# 上传文件和预览的目录布局
+storage_layout = StorageLayout(UPLOAD_FOLDER, sharded=STORAGE_LAYOUT == 'sharded')
+
+def create_sandbox():
+    """按配置创建预览/转换隔离进程池（首次使用时启动进程）"""
+    if not SANDBOX_ENABLED:
+        return None
+    sandbox = Sandbox(
+        create_isolated_handler,
+        (UPLOAD_FOLDER, storage_layout.preview_root, storage_layout.sharded,
+         storage_layout.depth, storage_layout.width),
+        size=SANDBOX_WORKERS,
+        memory_mb=SANDBOX_MEMORY_MB,
+        cpu_seconds=SANDBOX_CPU_SECONDS,
+        timeout=SANDBOX_TIMEOUT,
+        max_tasks=SANDBOX_MAX_TASKS
+    )
+    return sandbox
+
+# 对象存储，上传目录作为本地读穿缓存
+object_storage = create_object_storage(
+    OBJECT_STORAGE,
+    storage_layout,
+    cache_max_bytes=OBJECT_CACHE_MAX_MB * 1024 * 1024,
+    directory=OBJECT_STORAGE_DIR,
+    bucket=S3_BUCKET,
+    prefix=S3_PREFIX,
+    endpoint_url=S3_ENDPOINT_URL,
+    access_key=S3_ACCESS_KEY,
+    secret_key=S3_SECRET_KEY,
+    region=S3_REGION,
+    part_size=S3_PART_SIZE_MB * 1024 * 1024
+)
+
+file_handler = FileHandler(
+    UPLOAD_FOLDER,
+    storage_layout.preview_root,
+    office_pool=create_office_pool(),
+    layout=storage_layout,
+    sandbox=create_sandbox(),
+    storage=object_storage
+)
+
+# 打印栅格缓存
+raster_cache = None
+if RASTER_CACHE_ENABLED:
+    raster_cache = RasterCache(
+        os.path.join(UPLOAD_FOLDER, 'raster_cache'),
+        dpi=RASTER_CACHE_DPI,
+        printers=RASTER_CACHE_PRINTERS,
+        max_bytes=RASTER_CACHE_MAX_MB * 1024 * 1024,
+        sandbox=file_handler.sandbox
+    )
+    atexit.register(raster_cache.shutdown)
+
+# 多实例共享状态：任务和文件索引保存在共享的 SQLite 数据库中，
+# 只有持有 leader 租约的实例提交任务到CUPS、同步状态和执行清理
+state_store = None
+leader_lease = None
+if STATE_BACKEND == 'sqlite':
+    state_store = StateStore(STATE_DB, INSTANCE_ID)
+    leader_lease = Lease(state_store, 'leader', LEADER_LEASE_TTL)
+    logger.info("使用共享状态存储: %s (实例 %s)", STATE_DB, INSTANCE_ID)
+leader = leader_lease.held if leader_lease is not None else None
+
+# 打印任务跟踪
+job_tracker = JobTracker(
+    print_backend,
+    JOB_POLL_INTERVAL,
+    JOB_HISTORY_LIMIT,
+    CHANGE_LOG_LIMIT,
+    store=state_store,
+    leader=leader
+)
+metrics.QUEUE_DEPTH.set_function(job_tracker.queue_depth)
+
+job_dispatcher = None
+if leader_lease is not None:
+    job_dispatcher = JobDispatcher(job_tracker, print_backend, file_handler, leader_lease, DISPATCH_INTERVAL)
+    job_dispatcher.start()
+    atexit.register(job_dispatcher.stop)
+
+# 上传文件索引和后台清理
+file_catalog = FileCatalog(
+    UPLOAD_FOLDER,
+    storage_layout,
+    CHANGE_LOG_LIMIT,
+    store=state_store,
+    remote=object_storage
+)
+file_catalog.load()
+janitor = Janitor(
+    file_catalog,
+    file_handler,
+    retention_hours=FILE_RETENTION_HOURS,
+    max_bytes=STORAGE_MAX_MB * 1024 * 1024,
+    interval=JANITOR_INTERVAL,
+    batch_size=JANITOR_SCAN_BATCH,
+    in_use=job_tracker.active_files,
+    leader=leader,
+    temp_dirs=[raster_cache.cache_folder] if raster_cache is not None else ()
+)
+if JANITOR_ENABLED:
+    janitor.start()
+atexit.register(janitor.stop)
+
+# 文件批量操作
+bulk_ops = BulkOperations(
+    file_catalog,
+    file_handler,
+    (PREVIEW_WIDTH, PREVIEW_HEIGHT),
+    in_use=job_tracker.active_files
+)
+atexit.register(bulk_ops.shutdown)
+
+# 准入控制：按请求方限速，昂贵接口限制并发
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST) if RATE_LIMIT_ENABLED else None
+upload_slots = ConcurrencyLimiter(UPLOAD_CONCURRENCY, ADMISSION_WAIT)
+convert_slots = ConcurrencyLimiter(CONVERT_CONCURRENCY, ADMISSION_WAIT)
+
+# 预览预热：空闲时为热门文件补齐预览和转换结果
+prewarmer = Prewarmer(
+    file_catalog,
+    file_handler,
+    (PREVIEW_WIDTH, PREVIEW_HEIGHT),
+    cpu_share=PREWARM_CPU_SHARE,
+    interval=PREWARM_INTERVAL,
+    half_life=PREWARM_HALF_LIFE,
+    max_load=PREWARM_MAX_LOAD,
+    idle=lambda: upload_slots.in_use == 0 and convert_slots.in_use == 0,
+    leader=leader
+)
+if PREWARM_ENABLED:
+    prewarmer.start()
+atexit.register(prewarmer.stop)
+
+if REQUIRE_AUTH and not API_KEY:
+    logger.error("REQUIRE_AUTH 已开启但未设置 API_KEY，所有 API 请求都会被拒绝")
+
+@app.before_request
+def begin_request_trace():
+    """为每个请求开始跟踪"""
+    tracing.start_trace(request.method, request.path, request.headers.get('X-Request-ID'))
+
+@app.after_request
+def end_request_trace(response):
+    """结束请求跟踪并回传请求ID"""
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        response.headers['X-Request-ID'] = trace_id
+    tracing.finish_trace(response.status_code)
+    return response
+
+@app.after_request
+def compress(response):
+    """压缩较大的JSON响应"""
+    if COMPRESS_ENABLED:
+        return compress_response(response)
+    return response
+
+# 网页端定时轮询的接口
+POLLED_ENDPOINTS = {'get_jobs', 'get_printer_status'}
+
+@app.after_request
+def poll_hint(response):
+    """建议的轮询间隔：有未结束任务时加快，否则放慢"""
+    if request.endpoint in POLLED_ENDPOINTS:
+        interval = POLL_ACTIVE_INTERVAL if job_tracker.queue_depth() else POLL_IDLE_INTERVAL
+        response.headers['X-Poll-Interval'] = f"{interval:g}"
+    return response
+
+@app.teardown_request
+def discard_request_trace(exc):
+    """请求异常中断时也要结束跟踪"""
+    tracing.finish_trace(500 if exc else None)
+
+@app.before_request
+def check_api_key():
+    """REQUIRE_AUTH 开启时 /api/ 下的接口（健康检查除外）需要正确的 X-API-Key"""
+    if not REQUIRE_AUTH or not request.path.startswith('/api/') or request.endpoint == 'health':
+        return None
+    if api_key_valid():
+        return None
+    return unauthorized()
+
+def api_key_valid() -> bool:
+    """请求带有正确的 X-API-Key（未配置 API_KEY 时始终为 False）"""
+    api_key = request.headers.get('X-API-Key', '')
+    return bool(API_KEY) and hmac.compare_digest(api_key.encode('utf-8'), API_KEY.encode('utf-8'))
+
+def unauthorized():
+    metrics.REJECTED_REQUESTS.inc(endpoint=request.endpoint or '', reason='unauthorized')
+    return jsonify({'success': False, 'error': '缺少或错误的 API Key'}), 401
+
+def get_client_id() -> str:
+    """
+    请求方标识（配额归属、限速计数、批量操作的 mine 条件共用）
+
+    只有 REQUIRE_AUTH 开启、API Key 已在 check_api_key 中校验过时才按 Key（取哈希，
+    不保存原文）区分；否则按客户端IP，避免每次换用随机 Key 绕过配额和限速
+    """
+    if REQUIRE_AUTH:
+        api_key = request.headers.get('X-API-Key')
+        if api_key:
+            return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    return request.remote_addr or 'anonymous'
+
+def reject(status: int, reason: str, error: str, retry_after: float):
+    metrics.REJECTED_REQUESTS.inc(endpoint=request.endpoint or '', reason=reason)
+    logger.warning("拒绝请求 %s %s: %s (%s)", request.method, request.path, reason, get_client_id())
+    response = jsonify({'success': False, 'error': error})
+    response.status_code = status
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+def admission(slots: ConcurrencyLimiter = None):
+    """
+    准入控制装饰器
+
+    先按请求方取令牌（超出返回429），再占用并发槽位（占满返回503）
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if rate_limiter is not None:
+                wait = rate_limiter.acquire(get_client_id())
+                if wait is not None:
+                    return reject(429, 'rate_limit', '请求过于频繁，请稍后重试', wait)
+            
+            if slots is not None and not slots.acquire():
+                return reject(503, 'overloaded', '服务繁忙，请稍后重试', OVERLOAD_RETRY_AFTER)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if slots is not None:
+                    slots.release()
+        return wrapper
+    return decorator
 
 def get_printer_name() -> str:
     """获取配置的打印机名称"""
@@ -60,17 +359,36 @@ def health():
         'printer': get_printer_name()
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus 指标"""
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/traces')
+def debug_traces():
+    """最近的慢请求跟踪（含请求路径和性能分析结果，不论 REQUIRE_AUTH 都需要 API Key）"""
+    if not TRACING_ENABLED or not API_KEY:
+        abort(404)
+    if not api_key_valid():
+        return unauthorized()
+    return jsonify({
+        'success': True,
+        'traces': tracing.recent_slow_traces()
+    })
+
 @app.route('/api/printers', methods=['GET'])
 def get_printers():
     """获取可用打印机列表"""
     try:
-        printers = cups_service.get_printers()
+        printers = print_backend.get_printers()
         return jsonify({
             'success': True,
             'printers': [p.to_dict() for p in printers]
         })
     except Exception as e:
-        logger.error(f"获取打印机列表失败: {e}")
+        logger.error("获取打印机列表失败: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -81,20 +399,21 @@ def get_printer_status():
     """获取打印机状态"""
     try:
         printer_name = request.args.get('printer', get_printer_name())
-        status = cups_service.get_printer_status(printer_name)
+        status = print_backend.get_printer_status(printer_name)
         return jsonify({
             'success': True,
             'printer': printer_name,
             'status': status
         })
     except Exception as e:
-        logger.error(f"获取打印机状态失败: {e}")
+        logger.error("获取打印机状态失败: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @app.route('/api/upload', methods=['POST'])
+@admission(upload_slots)
 def upload_file():
     """上传文件"""
     try:
@@ -107,21 +426,32 @@ def upload_file():
             return jsonify({'success': False, 'error': '没有选择文件'}), 400
         
         if file and file_handler.allowed_file(file.filename, ALLOWED_EXTENSIONS):
+            owner = get_client_id()
+            quota = USER_QUOTA_MB * 1024 * 1024
+            if quota and file_catalog.usage(owner) + (request.content_length or 0) > quota:
+                return jsonify({'success': False, 'error': '存储配额已用完，请删除部分文件'}), 413
+            
             # 生成唯一文件名
             original_filename = secure_filename(file.filename)
             unique_filename = f"{uuid.uuid4().hex}_{original_filename}"
-            file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-            file.save(file_path)
+            file_path = storage_layout.upload_path(unique_filename, create=True)
+            with metrics.stage_timer('upload'):
+                sha256 = file_handler.save_upload(file.stream, file_path)
+                file_handler.persist(file_path)
             
-            logger.info(f"文件已上传: {file_path}")
+            file_catalog.add(file_path, owner=owner, sha256=sha256)
+            prewarmer.record(os.path.splitext(unique_filename)[0], 'upload')
+            logger.info("文件已上传: %s", file_path)
             
             # 获取文件信息
             file_info = {
                 'filename': original_filename,
                 'saved_path': file_path,
                 'file_type': file_handler.get_file_type(file_path),
-                'size': os.path.getsize(file_path)
+                'size': os.path.getsize(file_path),
+                'sha256': sha256
             }
+            metrics.UPLOAD_BYTES.inc(file_info['size'])
             
             # 尝试生成预览
             preview_name = os.path.splitext(unique_filename)[0]
@@ -133,10 +463,11 @@ def upload_file():
             )
             
             if preview_path:
-                logger.info(f"预览已生成: {preview_path}")
+                logger.info("预览已生成: %s", preview_path)
                 file_info['preview_path'] = preview_path
+                file_catalog.touch(unique_filename)
             else:
-                logger.warning(f"预览生成失败或不支持: {original_filename}")
+                logger.warning("预览生成失败或不支持: %s", original_filename)
             
             return jsonify({
                 'success': True,
@@ -146,44 +477,79 @@ def upload_file():
         return jsonify({'success': False, 'error': '不支持的文件类型'}), 400
     
     except Exception as e:
-        logger.error(f"文件上传失败: {e}")
+        logger.error("文件上传失败: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# (索引版本, 文件列表)
+_file_list_cache = (None, None)
+
+def build_file_item(f: dict) -> dict:
+    preview_name = os.path.splitext(f['filename'])[0]
+    has_preview = storage_layout.resolve_preview(preview_name) is not None
+    preview_path = f"/previews/{preview_name}.png" if has_preview else None
+    
+    return {
+        'filename': f['filename'],
+        'path': f['path'],
+        'size': file_handler.format_file_size(f['size']),
+        'size_bytes': f['size'],
+        'created': f['created'].isoformat(),
+        'preview_path': preview_path
+    }
+
+def build_file_list() -> list:
+    files = file_catalog.list_files()
+    logger.info("列出文件: 共 %s 个文件", len(files))
+    return [build_file_item(f) for f in files]
+
 @app.route('/api/files', methods=['GET'])
 def list_files():
-    """列出已上传的文件"""
+    """
+    列出已上传的文件（索引没有变化时返回304）
+    
+    带 ?since=<token> 时只返回令牌之后新增/变化/删除的文件
+    """
+    global _file_list_cache
     try:
-        files = file_handler.list_files(UPLOAD_FOLDER)
-        logger.info(f"列出文件: 共 {len(files)} 个文件")
-        file_list = []
-        
-        for f in files:
-            preview_name = os.path.splitext(f['filename'])[0]
-            preview_file = os.path.join(UPLOAD_FOLDER, 'previews', f'{preview_name}.png')
-            has_preview = os.path.exists(preview_file)
-            preview_path = f"/previews/{preview_name}.png" if has_preview else None
-            
-            if has_preview:
-                logger.debug(f"  - {f['filename']}: 有预览")
-            else:
-                logger.debug(f"  - {f['filename']}: 无预览")
-            
-            file_list.append({
-                'filename': f['filename'],
-                'path': f['path'],
-                'size': file_handler.format_file_size(f['size']),
-                'size_bytes': f['size'],
-                'created': f['created'].isoformat(),
-                'preview_path': preview_path
+        # 先取令牌再取列表，列表只会比令牌新，客户端不会漏掉变化
+        file_catalog.sync()
+        token = file_catalog.token
+        version = file_catalog.version
+        changed_at = file_catalog.changed_at
+        etag = make_etag('files', token)
+        cached = not_modified(etag, changed_at)
+        if cached is not None:
+            return cached
+        
+        since = request.args.get('since')
+        changes = file_catalog.changes_since(since) if since else None
+        if changes is not None:
+            updated, deleted, token = changes
+            response = jsonify({
+                'success': True,
+                'delta': True,
+                'token': token,
+                'updated': [build_file_item(f) for f in updated],
+                'deleted': deleted
             })
+            return set_validators(response, etag, changed_at)
         
-        return jsonify({
+        # 同一版本的列表只构建一次
+        cached_version, file_list = _file_list_cache
+        if cached_version != version:
+            file_list = build_file_list()
+            _file_list_cache = (version, file_list)
+        
+        response = jsonify({
             'success': True,
+            'delta': False,
+            'token': token,
             'files': file_list
         })
+        return set_validators(response, etag, changed_at)
     
     except Exception as e:
-        logger.error(f"列出文件失败: {e}")
+        logger.error("列出文件失败: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -193,56 +559,161 @@ def list_files():
 def delete_file(filename):
     """删除文件"""
     try:
-        # 查找文件
-        files = file_handler.list_files(UPLOAD_FOLDER)
-        target_file = None
-        
-        for f in files:
-            if f['filename'] == filename:
-                target_file = f
-                break
-        
-        if not target_file:
+        if not file_catalog.get(filename):
             return jsonify({'success': False, 'error': '文件不存在'}), 404
         
-        # 删除文件
-        if file_handler.delete_file(target_file['path']):
+        # 删除文件（连同预览和转换生成的PDF）
+        if janitor.remove_upload(filename):
             return jsonify({'success': True})
         
         return jsonify({'success': False, 'error': '删除失败'}), 500
     
     except Exception as e:
-        logger.error(f"删除文件失败: {e}")
+        logger.error("删除文件失败: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# 单次查询的哈希数上限
+MAX_HASH_LOOKUP = 500
+SHA256_PATTERN = re.compile(r'[0-9a-fA-F]{64}')
+
+@app.route('/api/files/exists', methods=['POST'])
+def files_exist():
+    """
+    按内容哈希查询文件是否已上传过，客户端据此跳过重复上传
+    
+    只查询内存中的索引，与 /api/files 一样不占用上传的限速令牌
+    
+    请求体: {"hashes": ["<sha256>", ...]}
+    返回每个哈希对应的已有文件（与 /api/files 的条目格式一致），没有时为 null
+    """
+    try:
+        hashes = (request.json or {}).get('hashes')
+        if not isinstance(hashes, list) or len(hashes) > MAX_HASH_LOOKUP:
+            return jsonify({'success': False, 'error': f"hashes 必须是不超过 {MAX_HASH_LOOKUP} 项的列表"}), 400
+        
+        file_catalog.sync()
+        files = {}
+        for sha256 in hashes:
+            if not isinstance(sha256, str) or not SHA256_PATTERN.fullmatch(sha256):
+                return jsonify({'success': False, 'error': f"无效的哈希: {sha256}"}), 400
+            entry = file_catalog.find_by_hash(sha256.lower())
+            files[sha256] = build_file_item(entry.to_dict()) if entry is not None else None
+        
+        return jsonify({'success': True, 'files': files})
+    
+    except Exception as e:
+        logger.error("查询文件哈希失败: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/files/bulk', methods=['POST'])
+@admission()
+def bulk_files():
+    """
+    批量删除/转换/重新生成预览
+    
+    请求体: {"action": "delete|convert|preview", "filenames": [...],
+             "filter": {"extensions": [...], "older_than_hours": 24,
+                        "name_contains": "...", "mine": true}}
+    filenames 和 filter 至少提供一个有效条件（空的 filter 会被拒绝），同时提供时取交集
+    删除时跳过正在打印的文件
+    """
+    try:
+        data = request.json or {}
+        action = data.get('action')
+        filenames = data.get('filenames')
+        filters = data.get('filter') or {}
+        
+        if action not in BULK_ACTIONS:
+            return jsonify({'success': False, 'error': f"action 必须是 {', '.join(BULK_ACTIONS)}"}), 400
+        
+        try:
+            selected = bulk_ops.select(
+                filenames=filenames,
+                extensions=filters.get('extensions'),
+                older_than_hours=filters.get('older_than_hours'),
+                owner=get_client_id() if filters.get('mine') else None,
+                name_contains=filters.get('name_contains')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        batch = bulk_ops.submit(action, selected)
+        
+        return jsonify({'success': True, 'batch': batch.to_dict()}), 202
+    
+    except Exception as e:
+        logger.error("批量操作失败: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/files/bulk/<batch_id>', methods=['GET'])
+def bulk_progress(batch_id):
+    """批量操作进度"""
+    batch = bulk_ops.get(batch_id)
+    if batch is None:
+        return jsonify({'success': False, 'error': '批次不存在'}), 404
+    return jsonify({'success': True, 'batch': batch.to_dict()})
+
+def find_preview(preview_name: str) -> Optional[str]:
+    """
+    预览图路径；不存在时按需生成，并发请求只生成一次
+    
+    先查文件索引，没有对应上传文件的名称直接返回None，不访问磁盘和对象存储
+    """
+    entry = file_catalog.find_preview_source(preview_name)
+    if entry is None:
+        return None
+    
+    preview_path = storage_layout.resolve_preview(preview_name)
+    if preview_path:
+        return preview_path
+    
+    # 本地缓存已淘汰时从对象存储取回
+    if file_handler.storage is not None and file_handler.fetch(storage_layout.preview_path(preview_name)):
+        return storage_layout.preview_path(preview_name)
+    
+    source_path = entry.path
+    if file_handler.generate_preview(
+        source_path,
+        preview_name,
+        PREVIEW_WIDTH,
+        PREVIEW_HEIGHT
+    ):
+        # 原文件和转换得到的PDF共用同一张预览
+        file_catalog.touch(os.path.basename(source_path))
+        file_catalog.touch(f"{preview_name}.pdf")
+    return storage_layout.resolve_preview(preview_name)
+
 @app.route('/previews/<path:filename>')
 def serve_preview(filename):
     """提供预览图片访问"""
     try:
-        preview_path = os.path.join(UPLOAD_FOLDER, 'previews', filename)
-        if os.path.exists(preview_path):
-            return send_file(preview_path, mimetype='image/png')
+        preview_name, extension = os.path.splitext(filename)
+        preview_path = find_preview(preview_name) if extension == '.png' else None
+        if preview_path:
+            prewarmer.record(preview_name, 'preview')
+            return send_stored_file(preview_path, UPLOAD_FOLDER, 'image/png', PREVIEW_CACHE_MAX_AGE)
         return jsonify({'error': '预览不存在'}), 404
     except Exception as e:
-        logger.error(f"提供预览失败: {e}")
+        logger.error("提供预览失败: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/preview/<filename>')
 def get_preview(filename):
     """获取文件预览"""
     try:
-        preview_path = os.path.join(UPLOAD_FOLDER, 'previews', f"{filename}.png")
+        preview_path = find_preview(filename)
         
-        if os.path.exists(preview_path):
-            return send_file(preview_path, mimetype='image/png')
+        if preview_path:
+            prewarmer.record(filename, 'preview')
+            return send_stored_file(preview_path, UPLOAD_FOLDER, 'image/png', PREVIEW_CACHE_MAX_AGE)
         
         return jsonify({'error': '预览不存在'}), 404
     
     except Exception as e:
-        logger.error(f"获取预览失败: {e}")
+        logger.error("获取预览失败: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/print', methods=['POST'])
+@admission(convert_slots)
 def print_file():
     """打印文件"""
     try:
@@ -257,32 +728,40 @@ def print_file():
             return jsonify({'success': False, 'error': '缺少文件名'}), 400
         
         # 查找文件
-        files = file_handler.list_files(UPLOAD_FOLDER)
-        target_file = None
-        
-        for f in files:
-            if f['filename'] == filename:
-                target_file = f
-                break
+        with tracing.span('find_file'):
+            target_file = file_catalog.get(filename)
         
         if not target_file:
             return jsonify({'success': False, 'error': '文件不存在'}), 404
         
+        prewarmer.record(os.path.splitext(filename)[0], 'print')
         file_path = target_file['path']
+        if not file_handler.fetch(file_path):
+            return jsonify({'success': False, 'error': '文件不存在'}), 404
         file_type = file_handler.get_file_type(file_path)
         extension = file_handler.get_file_extension(filename).lower()
         
         # Office 文档需要转换为 PDF
         print_file_path = file_path
         if extension in ['doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx']:
-            logger.info(f"Office文档需转换为PDF: {filename}")
+            logger.info("Office文档需转换为PDF: %s", filename)
             pdf_path = file_handler.convert_to_pdf(file_path)
             if pdf_path and pdf_path != file_path:
+                file_catalog.add(pdf_path, source=filename)
                 print_file_path = pdf_path
-                logger.info(f"已转换为PDF: {pdf_path}")
+                logger.info("已转换为PDF: %s", pdf_path)
             else:
                 return jsonify({'success': False, 'error': '文档转换PDF失败'}), 500
         
+        # 重复打印时提交预先栅格化的结果
+        if raster_cache is not None and raster_cache.enabled_for(printer_name, print_file_path):
+            with tracing.span('raster_cache'):
+                print_file_path = raster_cache.get_print_file(
+                    print_file_path,
+                    printer_name,
+                    print_backend.get_printer_options(printer_name)
+                )
+        
         # 创建打印任务
         job_id = str(uuid.uuid4())[:8]
         job = PrintJob(
@@ -296,61 +775,93 @@ def print_file():
             status=PrintJobStatus.PENDING
         )
         
-        print_jobs[job_id] = job
-        
-        logger.info(f"创建打印任务: {job_id}, 文件: {filename}")
-        
-        # 执行打印
-        try:
-            cups_job_id = cups_service.print_file(
-                printer_name=printer_name,
-                file_path=print_file_path,
-                job_name=f"RemotePrint-{job_id}",
-                copies=copies,
-                page_range=page_range
-            )
+        # 打印过程中的日志都带上任务ID
+        with job_context(job_id):
+            job_tracker.add(job)
             
-            job.status = PrintJobStatus.PRINTING
-            job.cups_job_id = cups_job_id
+            logger.info("创建打印任务: %s, 文件: %s", job_id, filename)
             
-            return jsonify({
-                'success': True,
-                'job': job.to_dict(),
-                'cups_job_id': cups_job_id
-            })
-        
-        except Exception as print_error:
-            job.status = PrintJobStatus.FAILED
-            job.error_message = str(print_error)
+            # 多实例部署时由 leader 实例提交到CUPS
+            if job_dispatcher is not None:
+                return jsonify({
+                    'success': True,
+                    'queued': True,
+                    'job': job.to_dict()
+                }), 202
             
-            return jsonify({
-                'success': False,
-                'error': str(print_error),
-                'job': job.to_dict()
-            }), 500
+            # 执行打印
+            try:
+                cups_job_id = print_backend.print_file(
+                    printer_name=printer_name,
+                    file_path=print_file_path,
+                    job_name=f"RemotePrint-{job_id}",
+                    copies=copies,
+                    page_range=page_range
+                )
+                
+                if not job_tracker.bind_cups_job(job, cups_job_id):
+                    # 提交期间任务已被取消
+                    print_backend.cancel_job(cups_job_id)
+                    job = job_tracker.get(job_id) or job
+                
+                return jsonify({
+                    'success': True,
+                    'job': job.to_dict(),
+                    'cups_job_id': cups_job_id
+                })
+            
+            except Exception as print_error:
+                job_tracker.mark_failed(job, str(print_error))
+                
+                return jsonify({
+                    'success': False,
+                    'error': str(print_error),
+                    'job': job.to_dict()
+                }), 500
     
     except Exception as e:
-        logger.error(f"打印失败: {e}")
+        logger.error("打印失败: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/jobs', methods=['GET'])
 def get_jobs():
-    """获取打印任务列表"""
+    """
+    获取打印任务列表（没有变化时返回304）
+    
+    带 ?since=<token> 时只返回令牌之后新增/变化/删除的任务
+    """
     try:
-        # 获取本地任务
-        local_jobs = [job.to_dict() for job in print_jobs.values()]
-        
-        # 获取CUPS任务
-        cups_jobs = cups_service.get_jobs()
+        job_tracker.refresh()
+        token = job_tracker.token
+        changed_at = job_tracker.changed_at
+        etag = make_etag('jobs', token)
+        cached = not_modified(etag, changed_at)
+        if cached is not None:
+            return cached
+        
+        since = request.args.get('since')
+        changes = job_tracker.changes_since(since) if since else None
+        if changes is not None:
+            updated, deleted, token = changes
+            response = jsonify({
+                'success': True,
+                'delta': True,
+                'token': token,
+                'updated': updated,
+                'deleted': deleted
+            })
+            return set_validators(response, etag, changed_at)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'local_jobs': local_jobs,
-            'cups_jobs': cups_jobs
+            'delta': False,
+            'token': token,
+            'jobs': job_tracker.list_jobs()
         })
+        return set_validators(response, etag, changed_at)
     
     except Exception as e:
-        logger.error(f"获取任务列表失败: {e}")
+        logger.error("获取任务列表失败: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -360,22 +871,28 @@ def get_jobs():
 def cancel_job(job_id):
     """取消打印任务"""
     try:
-        if job_id in print_jobs:
-            job = print_jobs[job_id]
+        # 多实例部署时任务可能正被 leader 提交，状态变化后按最新状态重试
+        for _ in range(3):
+            job = job_tracker.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'error': '任务不存在'}), 404
+            if job.is_finished():
+                return jsonify({'success': False, 'error': '任务已结束'}), 400
             
-            if hasattr(job, 'cups_job_id') and job.cups_job_id:
-                cups_service.cancel_job(job.cups_job_id)
+            if job.cups_job_id:
+                print_backend.cancel_job(job.cups_job_id)
             
-            job.status = PrintJobStatus.CANCELLED
-            return jsonify({'success': True, 'job': job.to_dict()})
+            if job_tracker.mark_cancelled(job):
+                return jsonify({'success': True, 'job': job.to_dict()})
         
-        return jsonify({'success': False, 'error': '任务不存在'}), 404
+        return jsonify({'success': False, 'error': '任务状态正在变化，请重试'}), 409
     
     except Exception as e:
-        logger.error(f"取消任务失败: {e}")
+        logger.error("取消任务失败: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/convert', methods=['POST'])
+@admission(convert_slots)
 def convert_file():
     """转换文件为PDF"""
     try:
@@ -386,13 +903,7 @@ def convert_file():
             return jsonify({'success': False, 'error': '缺少文件名'}), 400
         
         # 查找文件
-        files = file_handler.list_files(UPLOAD_FOLDER)
-        target_file = None
-        
-        for f in files:
-            if f['filename'] == filename:
-                target_file = f
-                break
+        target_file = file_catalog.get(filename)
         
         if not target_file:
             return jsonify({'success': False, 'error': '文件不存在'}), 404
@@ -401,6 +912,7 @@ def convert_file():
         pdf_path = file_handler.convert_to_pdf(target_file['path'])
         
         if pdf_path and pdf_path != target_file['path']:
+            file_catalog.add(pdf_path, source=filename)
             pdf_filename = os.path.basename(pdf_path)
             
             return jsonify({
@@ -416,21 +928,29 @@ def convert_file():
         }), 400
     
     except Exception as e:
-        logger.error(f"文件转换失败: {e}")
+        logger.error("文件转换失败: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/uploads/<path:filename>')
 def serve_uploaded_file(filename):
     """提供上传文件的访问"""
+    file_path = storage_layout.resolve_upload(filename)
+    if not file_path and file_handler.storage is not None:
+        # 本地缓存已淘汰，按索引中的路径从对象存储取回
+        entry = file_catalog.get_entry(filename)
+        if entry is not None and file_handler.fetch(entry.path):
+            file_path = entry.path
+    if not file_path:
+        abort(404)
     try:
-        return send_file(os.path.join(UPLOAD_FOLDER, filename))
+        return send_stored_file(file_path, UPLOAD_FOLDER, max_age=DOWNLOAD_CACHE_MAX_AGE)
     except Exception as e:
-        logger.error(f"提供文件失败: {e}")
+        logger.error("提供文件失败: %s", e)
         abort(404)
 
 if __name__ == '__main__':
-    logger.info(f"启动远程打印服务: {SERVICE_HOST}:{SERVICE_PORT}")
-    logger.info(f"使用打印机: {get_printer_name()}")
+    logger.info("启动远程打印服务: %s:%s", SERVICE_HOST, SERVICE_PORT)
+    logger.info("使用打印机: %s", get_printer_name())
     
     app.run(
         host=SERVICE_HOST,
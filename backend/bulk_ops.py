@@ -0,0 +1,235 @@
+"""
+文件批量操作
+
+批量删除、转换PDF、重新生成预览在后台线程中按批次执行，接口立即返回
+批次ID，客户端轮询进度。删除时一次性从索引中移除全部条目，再逐个删除
+文件，不会对每个文件重复扫描目录
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from backend.file_catalog import FileCatalog
+from backend.file_handler import FileHandler
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('delete', 'convert', 'preview')
+
+# 每个批次最多保留的错误信息条数
+MAX_ERRORS = 50
+
+
+class BulkBatch:
+    def __init__(self, batch_id: str, action: str, filenames: List[str]):
+        self.batch_id = batch_id
+        self.action = action
+        self.filenames = filenames
+        self.total = len(filenames)
+        self.done = 0
+        self.failed = 0
+        self.errors = []
+        self.status = 'pending'
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def record(self, filename: str, error: str = None):
+        self.done += 1
+        if error:
+            self.failed += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append({'filename': filename, 'error': error})
+
+    def to_dict(self):
+        return {
+            'batch_id': self.batch_id,
+            'action': self.action,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'errors': list(self.errors),
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class BulkOperations:
+    def __init__(
+        self,
+        catalog: FileCatalog,
+        file_handler: FileHandler,
+        preview_size: tuple = (800, 1000),
+        history_limit: int = 50,
+        in_use: Callable[[], Iterable[str]] = None
+    ):
+        self.catalog = catalog
+        self.file_handler = file_handler
+        self.preview_size = preview_size
+        self.history_limit = history_limit
+        # 返回正在使用（打印中）的文件路径，删除时跳过
+        self.in_use = in_use or (lambda: ())
+        # 批次依次执行，避免与请求线程争抢磁盘和CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk')
+        self._batches: 'OrderedDict[str, BulkBatch]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def select(
+        self,
+        filenames: List[str] = None,
+        extensions: List[str] = None,
+        older_than_hours: float = None,
+        owner: str = None,
+        name_contains: str = None
+    ) -> List[str]:
+        """
+        按文件名列表或过滤条件选出上传文件（不含转换生成的PDF）
+
+        同时给出文件名和条件时取两者的交集
+
+        Raises:
+            ValueError: 没有任何有效的选择条件（避免误选全部文件）
+        """
+        wanted = set(filenames) if filenames is not None else None
+        extensions = {ext.lower().lstrip('.') for ext in extensions} if extensions else None
+        cutoff = time.time() - older_than_hours * 3600 if older_than_hours else None
+        if wanted is None and not (extensions or cutoff is not None or owner is not None or name_contains):
+            raise ValueError('缺少有效的 filenames 或 filter 条件')
+
+        selected = []
+        for entry in self.catalog.entries():
+            if entry.source is not None:
+                continue
+            if wanted is not None and entry.filename not in wanted:
+                continue
+            if extensions and self.file_handler.get_file_extension(entry.filename) not in extensions:
+                continue
+            if cutoff is not None and entry.created >= cutoff:
+                continue
+            if owner is not None and entry.owner != owner:
+                continue
+            if name_contains and name_contains.lower() not in entry.filename.lower():
+                continue
+            selected.append(entry.filename)
+        return selected
+
+    def submit(self, action: str, filenames: List[str]) -> BulkBatch:
+        if action not in ACTIONS:
+            raise ValueError(f"不支持的批量操作: {action}")
+
+        batch = BulkBatch(uuid.uuid4().hex[:12], action, filenames)
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+            while len(self._batches) > self.history_limit:
+                oldest_id, oldest = next(iter(self._batches.items()))
+                if oldest.status not in ('completed', 'failed'):
+                    break
+                del self._batches[oldest_id]
+
+        self._executor.submit(self._run, batch)
+        logger.info("批量操作已提交: %s %s, %s 个文件", batch.batch_id, action, batch.total)
+        return batch
+
+    def get(self, batch_id: str) -> Optional[BulkBatch]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def _run(self, batch: BulkBatch):
+        batch.status = 'running'
+        try:
+            if batch.action == 'delete':
+                self._delete(batch)
+            elif batch.action == 'convert':
+                self._convert(batch)
+            else:
+                self._regenerate_previews(batch)
+            batch.status = 'completed'
+        except Exception as e:
+            logger.error("批量操作失败: %s: %s", batch.batch_id, e)
+            batch.status = 'failed'
+        finally:
+            batch.finished_at = time.time()
+            self.catalog.save()
+            logger.info("批量操作结束: %s, 成功 %s, 失败 %s", batch.batch_id, batch.done - batch.failed, batch.failed)
+
+    def _delete(self, batch: BulkBatch):
+        """一次性移除索引条目，再删除文件、转换PDF和预览；正在打印的文件跳过"""
+        busy = self._busy_sources()
+        removed = self.catalog.remove_many([name for name in batch.filenames if name not in busy])
+        by_source = {}
+        for entry in removed:
+            by_source.setdefault(entry.source or entry.filename, []).append(entry)
+
+        layout = self.file_handler.layout
+        for filename in batch.filenames:
+            if filename in busy:
+                batch.record(filename, '文件正在打印')
+                continue
+            entries = by_source.get(filename)
+            if not entries:
+                batch.record(filename, '文件不存在')
+                continue
+
+            error = None
+            paths = [entry.path for entry in entries]
+            preview_path = layout.resolve_preview(os.path.splitext(filename)[0])
+            if preview_path:
+                paths.append(preview_path)
+            if self.file_handler.storage is not None:
+                self.file_handler.storage.delete(
+                    set(paths) | {layout.preview_path(os.path.splitext(filename)[0])}
+                )
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    error = str(e)
+            batch.record(filename, error)
+
+    def _busy_sources(self) -> set:
+        """未结束任务使用的上传文件名（任务打印的是转换PDF时取其原文件）"""
+        busy = set()
+        for path in self.in_use():
+            filename = os.path.basename(path)
+            entry = self.catalog.get_entry(filename)
+            busy.add((entry.source or filename) if entry is not None else filename)
+        return busy
+
+    def _convert(self, batch: BulkBatch):
+        for filename in batch.filenames:
+            entry = self.catalog.get_entry(filename)
+            if entry is None:
+                batch.record(filename, '文件不存在')
+                continue
+            pdf_path = self.file_handler.convert_to_pdf(entry.path)
+            if not pdf_path:
+                batch.record(filename, '转换失败')
+                continue
+            if pdf_path != entry.path:
+                self.catalog.add(pdf_path, source=filename)
+            batch.record(filename)
+
+    def _regenerate_previews(self, batch: BulkBatch):
+        width, height = self.preview_size
+        for filename in batch.filenames:
+            entry = self.catalog.get_entry(filename)
+            if entry is None:
+                batch.record(filename, '文件不存在')
+                continue
+            # 新预览原子替换旧文件，生成期间旧预览仍可访问
+            preview_name = os.path.splitext(filename)[0]
+            if self.file_handler.generate_preview(entry.path, preview_name, width, height):
+                self.catalog.touch(filename)
+                batch.record(filename)
+            else:
+                batch.record(filename, '预览生成失败')
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
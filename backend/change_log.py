@@ -0,0 +1,104 @@
+"""
+变更日志
+
+记录每次变化的 (版本号, 键, 是否删除)，客户端带上次的版本令牌即可只取得
+之后新增/更新/删除的条目。日志有保留上限，令牌太旧或来自重启前的进程时
+返回 None，调用方退回完整列表
+
+共享模式（传入 StateStore）下版本以共享存储的变更序号为准，令牌和 ETag
+在所有实例上含义相同；增量变化直接从存储的 changes 表查询，请求落到
+哪个实例都能校验
+
+不加锁，由持有者（文件索引、任务跟踪器）在自己的锁内调用
+"""
+import time
+from collections import deque
+from typing import Hashable, Optional, Set, Tuple
+
+from backend.http_cache import BOOT_ID
+
+
+SHARED_PREFIX = 's'
+
+
+class ChangeLog:
+    """
+    Args:
+        limit: 本地保留的变更条数
+        store: 共享模式下的 StateStore
+        kind: 共享存储中的变更类型（'file' / 'job'）
+    """
+
+    def __init__(self, limit: int = 1000, store=None, kind: str = None):
+        self.version = 0
+        self.changed_at = time.time()
+        self.store = store
+        self.kind = kind
+        # 已合并的共享存储变更序号
+        self.store_seq = 0
+        # 本实例有修改尚未从共享存储取得序号，令牌需要先同步一次
+        self.unsynced = False
+        self._entries = deque(maxlen=limit)
+
+    def record(self, key: Hashable, deleted: bool = False):
+        self.version += 1
+        self.changed_at = time.time()
+        self._entries.append((self.version, key, deleted))
+        if self.store is not None:
+            self.unsynced = True
+
+    def synced(self, seq: int):
+        """（共享模式）序号 seq 及之前的共享变更都已合并到本地"""
+        self.store_seq = seq
+        self.unsynced = False
+
+    def bump(self):
+        """变化无法对应到单个条目时只递增版本，之前的令牌全部失效"""
+        self.version += 1
+        self.changed_at = time.time()
+        self._entries.clear()
+
+    @property
+    def token(self) -> str:
+        if self.store is not None:
+            return f"{SHARED_PREFIX}-{self.store_seq}"
+        return f"{BOOT_ID}-{self.version}"
+
+    def changes_since(self, token: str) -> Optional[Tuple[Set[Hashable], Set[Hashable]]]:
+        """
+        令牌之后的变化
+
+        Returns:
+            (更新的键, 删除的键)；无法增量同步时返回 None。共享模式下
+            删除的键也在更新的键中，由调用方按本地是否还有该条目区分
+        """
+        if self.store is not None:
+            seq = parse_token(token, SHARED_PREFIX)
+            keys = None if seq is None else self.store.changed_keys(self.kind, seq)
+            return None if keys is None else (set(keys), set())
+
+        version = parse_token(token)
+        if version is None or version > self.version:
+            return None
+        if version == self.version:
+            return set(), set()
+        # 日志中最早的版本必须紧接在令牌之后，否则中间有变化已被丢弃
+        if not self._entries or self._entries[0][0] > version + 1:
+            return None
+
+        updated, deleted = set(), set()
+        for entry_version, key, is_deleted in reversed(self._entries):
+            if entry_version <= version:
+                break
+            if key in updated or key in deleted:
+                continue
+            (deleted if is_deleted else updated).add(key)
+        return updated, deleted
+
+
+def parse_token(token: str, prefix: str = BOOT_ID) -> Optional[int]:
+    """解析版本令牌，不是本进程（共享模式下为共享存储）发出的令牌返回 None"""
+    boot_id, _, version = (token or '').rpartition('-')
+    if boot_id != prefix or not version.isdigit():
+        return None
+    return int(version)
@@ -2,6 +2,7 @@
 配置文件
 """
 import os
+import socket
 
 # 服务配置
 SERVICE_HOST = os.getenv('SERVICE_HOST', '0.0.0.0')
@@ -13,8 +14,21 @@ CUPS_SERVER = os.getenv('CUPS_SERVER', 'localhost')
 CUPS_PORT = int(os.getenv('CUPS_PORT', 631))
 CUPS_PRINTER_NAME = os.getenv('CUPS_PRINTER_NAME', 'HP_DeskJet_4900')
 
+# 打印后端: cups / simulated（模拟打印机，用于压测和离线开发）
+PRINT_BACKEND = os.getenv('PRINT_BACKEND', 'cups')
+
+# 模拟打印后端配置
+SIM_PRINTERS = [name.strip() for name in os.getenv('SIM_PRINTERS', CUPS_PRINTER_NAME).split(',') if name.strip()]
+SIM_PAGES_PER_MINUTE = float(os.getenv('SIM_PAGES_PER_MINUTE', 20))
+SIM_SPEEDUP = float(os.getenv('SIM_SPEEDUP', 1))  # 时间加速倍数
+SIM_JOB_FAILURE_RATE = float(os.getenv('SIM_JOB_FAILURE_RATE', 0))
+SIM_SUBMIT_FAILURE_RATE = float(os.getenv('SIM_SUBMIT_FAILURE_RATE', 0))
+SIM_SUBMIT_LATENCY_MS = float(os.getenv('SIM_SUBMIT_LATENCY_MS', 0))
+SIM_SEED = int(os.getenv('SIM_SEED')) if os.getenv('SIM_SEED') else None
+
 # 文件配置
 UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/app/uploads')
+STORAGE_LAYOUT = os.getenv('STORAGE_LAYOUT', 'sharded')  # sharded（哈希前缀子目录）/ flat
 MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))  # 50MB
 ALLOWED_EXTENSIONS = {
     'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
@@ -22,18 +36,126 @@ ALLOWED_EXTENSIONS = {
     'html', 'htm', 'csv'
 }
 
+# 存储清理配置
+JANITOR_ENABLED = os.getenv('JANITOR_ENABLED', 'true').lower() == 'true'
+JANITOR_INTERVAL = float(os.getenv('JANITOR_INTERVAL', 300))  # 秒
+JANITOR_SCAN_BATCH = int(os.getenv('JANITOR_SCAN_BATCH', 500))  # 每批扫描的目录项数
+FILE_RETENTION_HOURS = float(os.getenv('FILE_RETENTION_HOURS', 0))  # 上传文件保留时长，0为永久保留
+STORAGE_MAX_MB = int(os.getenv('STORAGE_MAX_MB', 0))  # 上传目录总大小上限，0为不限
+USER_QUOTA_MB = int(os.getenv('USER_QUOTA_MB', 0))  # 每个用户（API Key或IP）的配额，0为不限
+
+# 文件下载配置
+FILE_SERVE_MODE = os.getenv('FILE_SERVE_MODE', 'direct')  # direct / x-accel (nginx) / x-sendfile
+X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '/protected-uploads')  # nginx internal location，指向 UPLOAD_FOLDER
+PREVIEW_CACHE_MAX_AGE = int(os.getenv('PREVIEW_CACHE_MAX_AGE', 86400))  # 秒
+DOWNLOAD_CACHE_MAX_AGE = int(os.getenv('DOWNLOAD_CACHE_MAX_AGE', 0))
+
 # 预览配置
 PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', 800))
 PREVIEW_HEIGHT = int(os.getenv('PREVIEW_HEIGHT', 1000))
 
+# 文档转换配置
+DOCX_SECTION_CHARS = int(os.getenv('DOCX_SECTION_CHARS', 200000))  # 单个渲染分段的HTML字符数
+DOCX_RENDER_WORKERS = int(os.getenv('DOCX_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Office转换器: builtin（python-docx等提取内容后渲染）/ libreoffice（常驻soffice进程池）
+OFFICE_CONVERTER = os.getenv('OFFICE_CONVERTER', 'builtin')
+SOFFICE_BINARY = os.getenv('SOFFICE_BINARY', 'soffice')
+SOFFICE_POOL_SIZE = int(os.getenv('SOFFICE_POOL_SIZE', 2))
+SOFFICE_BASE_PORT = int(os.getenv('SOFFICE_BASE_PORT', 2002))
+SOFFICE_MAX_JOBS = int(os.getenv('SOFFICE_MAX_JOBS', 50))  # 每个进程处理多少文档后回收
+SOFFICE_TIMEOUT = float(os.getenv('SOFFICE_TIMEOUT', 120))
+
 # 打印配置
 DEFAULT_COPIES = int(os.getenv('DEFAULT_COPIES', 1))
 DEFAULT_PAGE_RANGE = os.getenv('DEFAULT_PAGE_RANGE', None)
+PRINT_DPI = int(os.getenv('PRINT_DPI', 300))  # 图片转PDF时的目标分辨率
+PAPER_SIZE = os.getenv('PAPER_SIZE', 'A4')  # A3 / A4 / A5 / B5 / Letter / Legal
+PAGE_MARGIN_MM = float(os.getenv('PAGE_MARGIN_MM', 5))
+
+# 打印栅格缓存：按打印机分辨率预先渲染PDF，重复打印时提交缓存结果
+RASTER_CACHE_ENABLED = os.getenv('RASTER_CACHE_ENABLED', 'false').lower() == 'true'
+RASTER_CACHE_DPI = int(os.getenv('RASTER_CACHE_DPI', 300))  # 打印机未报告分辨率时使用
+RASTER_CACHE_PRINTERS = [p.strip() for p in os.getenv('RASTER_CACHE_PRINTERS', '').split(',') if p.strip()]  # 为空时对所有打印机启用
+RASTER_CACHE_MAX_MB = int(os.getenv('RASTER_CACHE_MAX_MB', 2048))
+
+# 任务跟踪配置
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))  # 秒，CUPS状态同步最小间隔
+JOB_HISTORY_LIMIT = int(os.getenv('JOB_HISTORY_LIMIT', 500))
+CHANGE_LOG_LIMIT = int(os.getenv('CHANGE_LOG_LIMIT', 1000))  # 增量同步保留的变更条数
+POLL_ACTIVE_INTERVAL = float(os.getenv('POLL_ACTIVE_INTERVAL', 2))  # 秒，有未结束任务时建议的网页轮询间隔
+POLL_IDLE_INTERVAL = float(os.getenv('POLL_IDLE_INTERVAL', 30))  # 秒，没有未结束任务时建议的轮询间隔
+
+# API 响应配置
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')  # auto（已安装 orjson 时使用）/ orjson / stdlib
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # 小于此字节数的响应不压缩
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))  # gzip 压缩级别 1~9
+
+# 对象存储配置：上传文件和派生文件保存到共享目录或 S3 兼容服务，UPLOAD_FOLDER 作为本地缓存
+OBJECT_STORAGE = os.getenv('OBJECT_STORAGE', 'local')  # local（只存本地）/ directory / s3
+OBJECT_STORAGE_DIR = os.getenv('OBJECT_STORAGE_DIR', '/mnt/print-storage')  # directory 模式的目标目录
+OBJECT_CACHE_MAX_MB = int(os.getenv('OBJECT_CACHE_MAX_MB', 2048))  # 本地缓存上限，0为不淘汰
+S3_BUCKET = os.getenv('S3_BUCKET', 'print-service')
+S3_PREFIX = os.getenv('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', '')  # MinIO 等 S3 兼容服务的地址，如 http://minio:9000
+S3_ACCESS_KEY = os.getenv('S3_ACCESS_KEY', '')
+S3_SECRET_KEY = os.getenv('S3_SECRET_KEY', '')
+S3_REGION = os.getenv('S3_REGION', '')
+S3_PART_SIZE_MB = int(os.getenv('S3_PART_SIZE_MB', 8))  # 分段上传的分段大小
+
+# 多实例共享状态配置
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')  # memory（单实例）/ sqlite（多实例共享）
+STATE_DB = os.getenv('STATE_DB', os.path.join(UPLOAD_FOLDER, '.state.db'))  # 需位于各实例共享的同一主机卷
+INSTANCE_ID = os.getenv('INSTANCE_ID', f"{socket.gethostname()}-{os.getpid()}")
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 15))  # 秒，leader 失联多久后由其他实例接管
+DISPATCH_INTERVAL = float(os.getenv('DISPATCH_INTERVAL', 1))  # 秒，leader 领取待提交任务的间隔
+
+# 预览预热配置：后台为热门文件补齐预览和转换结果
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'true').lower() == 'true'
+PREWARM_CPU_SHARE = float(os.getenv('PREWARM_CPU_SHARE', 0.25))  # 预热工作允许占用的时间比例
+PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', 5))  # 秒，空闲检查间隔
+PREWARM_HALF_LIFE = float(os.getenv('PREWARM_HALF_LIFE', 3600))  # 秒，访问热度的半衰期
+PREWARM_MAX_LOAD = float(os.getenv('PREWARM_MAX_LOAD', 0.7))  # 每核平均负载超过此值时暂停
+
+# 转换隔离配置
+SANDBOX_ENABLED = os.getenv('SANDBOX_ENABLED', 'true').lower() == 'true'
+SANDBOX_WORKERS = int(os.getenv('SANDBOX_WORKERS', 2))
+SANDBOX_MEMORY_MB = int(os.getenv('SANDBOX_MEMORY_MB', 1024))  # 每个工作进程的内存上限，0为不限
+SANDBOX_CPU_SECONDS = int(os.getenv('SANDBOX_CPU_SECONDS', 300))  # 每个任务的CPU时间上限，0为不限
+SANDBOX_TIMEOUT = float(os.getenv('SANDBOX_TIMEOUT', 120))  # 秒，单个预览/转换任务超时
+SANDBOX_MAX_TASKS = int(os.getenv('SANDBOX_MAX_TASKS', 100))  # 每个工作进程处理多少任务后回收
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 50000000))  # 允许打开的图片最大像素数，0为不限
 
 # 日志配置
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE = os.getenv('LOG_FILE', '/app/logs/app.log')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text / json
+LOG_MAX_MB = int(os.getenv('LOG_MAX_MB', 50))  # 按大小轮转的阈值
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')  # 按时间轮转，如 midnight；为空时按大小轮转
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # 日志队列长度，满时丢弃
+
+# 指标配置
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# 请求跟踪配置
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+TRACE_SLOW_THRESHOLD_MS = float(os.getenv('TRACE_SLOW_THRESHOLD_MS', 2000))
+TRACE_PROFILE_SAMPLE_RATE = float(os.getenv('TRACE_PROFILE_SAMPLE_RATE', 0))  # 0~1，做 profile 的请求比例
+TRACE_PROFILER = os.getenv('TRACE_PROFILER', 'cprofile')  # cprofile / pyinstrument
+TRACE_RECENT_LIMIT = int(os.getenv('TRACE_RECENT_LIMIT', 50))
 
 # 安全配置
 API_KEY = os.getenv('API_KEY', '')
 REQUIRE_AUTH = os.getenv('REQUIRE_AUTH', 'false').lower() == 'true'
+
+# 准入控制配置
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'false').lower() == 'true'  # 默认关闭，公开部署时开启
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', 60))  # 上传/打印/转换每分钟请求数
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 100))  # 允许的突发请求数，需容纳网页端一次拖入的文件数
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 4))  # 同时处理的上传数，0为不限
+CONVERT_CONCURRENCY = int(os.getenv('CONVERT_CONCURRENCY', 2))  # 同时处理的打印/转换数，0为不限
+ADMISSION_WAIT = float(os.getenv('ADMISSION_WAIT', 2))  # 秒，并发已满时的最长等待
+OVERLOAD_RETRY_AFTER = int(os.getenv('OVERLOAD_RETRY_AFTER', 5))  # 秒，服务繁忙时建议的重试间隔
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))  # 前置反向代理层数，用于取得真实客户端IP
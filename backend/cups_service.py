@@ -6,10 +6,30 @@ import logging
 import os
 from typing import List, Optional
 from backend.models import Printer, PrintJobStatus
+from backend.metrics import timed
+from backend.print_backend import PrintBackend
 
 logger = logging.getLogger(__name__)
 
-class CupsService:
+# 增量查询作业时请求的属性
+JOB_UPDATE_ATTRIBUTES = [
+    'job-id',
+    'job-state',
+    'job-printer-state-message',
+    'time-at-processing',
+    'time-at-completed'
+]
+
+# 影响栅格化结果的打印机属性
+RASTER_OPTION_ATTRIBUTES = [
+    'printer-resolution-default',
+    'print-color-mode-default',
+    'media-default',
+    'print-quality-default',
+    'printer-make-and-model'
+]
+
+class CupsService(PrintBackend):
     def __init__(self, server: str = 'localhost', port: int = 631):
         self.server = server
         self.port = port
@@ -23,10 +43,10 @@ class CupsService:
                 logger.debug("通过本地 socket 连接到 CUPS")
                 return cups.Connection()
             else:
-                logger.debug(f"通过 TCP 连接到 CUPS: {self.server}:{self.port}")
+                logger.debug("通过 TCP 连接到 CUPS: %s:%s", self.server, self.port)
                 return cups.Connection(host=self.server, port=self.port)
         except Exception as e:
-            logger.error(f"创建CUPS连接失败: {e}")
+            logger.error("创建CUPS连接失败: %s", e)
             raise
     
     def connect(self) -> bool:
@@ -36,7 +56,7 @@ class CupsService:
             logger.info("CUPS连接已建立")
             return True
         except Exception as e:
-            logger.error(f"CUPS连接失败: {e}")
+            logger.error("CUPS连接失败: %s", e)
             return False
     
     def _ensure_connection(self):
@@ -48,7 +68,7 @@ class CupsService:
                 self._connection.getPrinters()
                 return self._connection
         except Exception as e:
-            logger.warning(f"CUPS连接已失效，重新连接: {e}")
+            logger.warning("CUPS连接已失效，重新连接: %s", e)
         
         # 重新创建连接
         self._connection = self._create_connection()
@@ -72,11 +92,11 @@ class CupsService:
                 )
                 printer_list.append(printer)
             
-            logger.info(f"找到 {len(printer_list)} 个打印机")
+            logger.info("找到 %s 个打印机", len(printer_list))
             return printer_list
         
         except Exception as e:
-            logger.error(f"获取打印机列表失败: {e}")
+            logger.error("获取打印机列表失败: %s", e)
             return []
     
     def get_printer(self, printer_name: str) -> Optional[Printer]:
@@ -93,9 +113,23 @@ class CupsService:
             )
         
         except Exception as e:
-            logger.error(f"获取打印机 {printer_name} 信息失败: {e}")
+            logger.error("获取打印机 %s 信息失败: %s", printer_name, e)
             return None
     
+    def get_printer_options(self, printer_name: str) -> dict:
+        """获取打印机分辨率等默认选项"""
+        try:
+            conn = self._ensure_connection()
+            attrs = conn.getPrinterAttributes(
+                printer_name,
+                requested_attributes=RASTER_OPTION_ATTRIBUTES
+            )
+            return {name: attrs[name] for name in RASTER_OPTION_ATTRIBUTES if name in attrs}
+        
+        except Exception as e:
+            logger.error("获取打印机 %s 选项失败: %s", printer_name, e)
+            return {}
+    
     def get_printer_status(self, printer_name: str) -> str:
         """获取打印机状态"""
         try:
@@ -111,9 +145,10 @@ class CupsService:
             return state_map.get(state, "unknown")
         
         except Exception as e:
-            logger.error(f"获取打印机状态失败: {e}")
+            logger.error("获取打印机状态失败: %s", e)
             return "error"
     
+    @timed('cups_submit')
     def print_file(
         self,
         printer_name: str,
@@ -152,11 +187,11 @@ class CupsService:
                 options
             )
             
-            logger.info(f"打印作业已提交: 作业ID={job_id}, 打印机={printer_name}, 文件={os.path.basename(file_path)}")
+            logger.info("打印作业已提交: 作业ID=%s, 打印机=%s, 文件=%s", job_id, printer_name, os.path.basename(file_path))
             return job_id
         
         except Exception as e:
-            logger.error(f"打印文件失败: {e}")
+            logger.error("打印文件失败: %s", e)
             raise Exception(f"打印失败: {e}")
     
     def get_jobs(self, printer_name: str = None) -> List[dict]:
@@ -180,19 +215,57 @@ class CupsService:
             return job_list
         
         except Exception as e:
-            logger.error(f"获取作业列表失败: {e}")
+            logger.error("获取作业列表失败: %s", e)
             return []
     
+    @timed('cups_poll')
+    def get_job_updates(self, first_job_id: int) -> List[dict]:
+        """
+        增量获取作业状态
+
+        只查询ID不小于 first_job_id 的作业（包括已完成的），并且只请求
+        状态相关的属性，避免每次拉取整张作业表
+
+        Args:
+            first_job_id: 最早的未结束作业ID
+
+        Returns:
+            作业状态列表，时间字段为Unix时间戳（未发生时为None）
+        """
+        try:
+            conn = self._ensure_connection()
+            jobs = conn.getJobs(
+                which_jobs='all',
+                first_job_id=first_job_id,
+                requested_attributes=JOB_UPDATE_ATTRIBUTES
+            )
+            updates = []
+
+            for job_id, attrs in jobs.items():
+                updates.append({
+                    'job_id': job_id,
+                    'state': attrs.get('job-state', 0),
+                    'time_at_processing': attrs.get('time-at-processing') or None,
+                    'time_at_completed': attrs.get('time-at-completed') or None,
+                    'message': attrs.get('job-printer-state-message', '')
+                })
+
+            return updates
+
+        except Exception as e:
+            logger.error("获取作业增量状态失败: %s", e)
+            return []
+
     def cancel_job(self, job_id: int) -> bool:
         """取消打印作业"""
         try:
             conn = self._ensure_connection()
             conn.cancelJob(job_id, purge_job=False)
-            logger.info(f"已取消作业: {job_id}")
+            logger.info("已取消作业: %s", job_id)
             return True
         
         except Exception as e:
-            logger.error(f"取消作业失败: {e}")
+            logger.error("取消作业失败: %s", e)
             return False
     
     def get_job_status(self, job_id: int) -> dict:
@@ -211,7 +284,7 @@ class CupsService:
             return None
         
         except Exception as e:
-            logger.error(f"获取作业状态失败: {e}")
+            logger.error("获取作业状态失败: %s", e)
             return None
     
     def add_printer(
@@ -230,9 +303,9 @@ class CupsService:
                 info=info,
                 sharing=is_shared
             )
-            logger.info(f"已添加打印机: {name}")
+            logger.info("已添加打印机: %s", name)
             return True
         
         except Exception as e:
-            logger.error(f"添加打印机失败: {e}")
+            logger.error("添加打印机失败: %s", e)
             return False
@@ -0,0 +1,108 @@
+"""
+多实例任务分发
+
+STATE_BACKEND=sqlite 时，接收打印请求的实例只把任务写入共享存储
+（pending），由持有 leader 租约的实例领取并提交到CUPS。领取在共享存储中
+原子完成，同一任务只会提交一次；leader 退出后租约过期，由其他实例接管
+"""
+import logging
+import threading
+from typing import Optional
+
+from backend.file_handler import FileHandler
+from backend.job_tracker import JobTracker
+from backend.log_setup import job_context
+from backend.state_store import Lease
+
+logger = logging.getLogger(__name__)
+
+# 共享存储保留的变更条数，足够各实例在几轮同步间隔内追上
+CHANGES_KEEP = 10000
+
+
+class JobDispatcher:
+    """
+    Args:
+        job_tracker: 使用共享存储的任务跟踪器
+        print_backend: 打印后端
+        file_handler: 文件处理服务，文件可能由其他实例接收，提交前按需从对象存储取回
+        lease: leader 租约
+        interval: 领取待提交任务的间隔（秒）
+        batch_size: 每次最多领取的任务数
+    """
+
+    def __init__(
+        self,
+        job_tracker: JobTracker,
+        print_backend,
+        file_handler: FileHandler,
+        lease: Lease,
+        interval: float = 1.0,
+        batch_size: int = 10
+    ):
+        self.job_tracker = job_tracker
+        self.print_backend = print_backend
+        self.file_handler = file_handler
+        self.lease = lease
+        self.interval = interval
+        self.batch_size = batch_size
+        # 领取后超过此时间仍未提交完成，视为领取的实例已退出
+        self.stale_after = max(lease.ttl * 4, 60)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='job-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info("任务分发已启动: 实例 %s", self.lease.store.instance_id)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.lease.release()
+
+    def _loop(self):
+        rounds = 0
+        while not self._stop.is_set():
+            try:
+                if self.lease.held():
+                    self.dispatch_once()
+                    rounds += 1
+                    if rounds % 600 == 0:
+                        self.job_tracker.store.trim_changes(CHANGES_KEEP)
+            except Exception as e:
+                logger.error("任务分发失败: %s", e)
+            self._stop.wait(self.interval)
+
+    def dispatch_once(self) -> int:
+        """领取并提交一批待提交任务，返回提交数"""
+        self.job_tracker.fail_stale_claims(self.stale_after)
+
+        submitted = 0
+        for job in self.job_tracker.claim_pending(self.batch_size):
+            with job_context(job.job_id):
+                try:
+                    if not self.file_handler.fetch(job.file_path):
+                        raise FileNotFoundError(f"文件不存在: {job.file_path}")
+                    cups_job_id = self.print_backend.print_file(
+                        printer_name=job.printer_name,
+                        file_path=job.file_path,
+                        job_name=f"RemotePrint-{job.job_id}",
+                        copies=job.copies,
+                        page_range=job.page_range
+                    )
+                    if not self.job_tracker.bind_cups_job(job, cups_job_id):
+                        # 提交期间用户在其他实例取消了任务
+                        logger.info("任务 %s 已取消，撤回CUPS作业 %s", job.job_id, cups_job_id)
+                        self.print_backend.cancel_job(cups_job_id)
+                        continue
+                    logger.info("任务已提交到CUPS: %s -> %s", job.job_id, cups_job_id)
+                    submitted += 1
+                except Exception as e:
+                    logger.error("提交打印任务失败: %s", e)
+                    self.job_tracker.mark_failed(job, str(e))
+
+        # 同步CUPS作业状态，其他实例从共享存储读取
+        self.job_tracker.refresh()
+        return submitted
@@ -0,0 +1,274 @@
+"""
+DOCX 转 PDF
+
+按文档正文顺序流式遍历段落、表格和内嵌图片，生成有大小上限的 HTML 分段；
+各分段在进程池中并行交给 WeasyPrint 渲染，最后用 pdfunite 拼接。
+单个分段的 HTML 和渲染内存与文档总长度无关，转换耗时随长度线性增长
+
+分段边界处会另起一页，因此优先在文档自带的分页符处切分
+"""
+import os
+import html
+import base64
+import shutil
+import logging
+import tempfile
+import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from backend.config import DOCX_SECTION_CHARS, DOCX_RENDER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+STYLESHEET = """
+<style>
+body { font-family: 'DejaVu Sans', sans-serif; font-size: 11pt; }
+table { border-collapse: collapse; width: 100%; margin: 6pt 0; }
+td, th { border: 1px solid #999; padding: 2pt 4pt; vertical-align: top; }
+img { max-width: 100%; }
+</style>
+"""
+
+# EMU 与 CSS 像素换算（914400 EMU/英寸，96 px/英寸）
+EMU_PER_PX = 9525
+
+_executor = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """共享的渲染进程池（forkserver，避免在多线程的 Web 进程中 fork）"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=DOCX_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('forkserver')
+        )
+    return _executor
+
+
+def _render_section(section_html: str, output_path: str) -> str:
+    """进程池任务: 渲染一个 HTML 分段"""
+    from weasyprint import HTML
+    HTML(string=section_html).write_pdf(output_path)
+    return output_path
+
+
+def _wrap(body_parts: List[str]) -> str:
+    return "<html><head><meta charset='utf-8'>" + STYLESHEET + "</head><body>" + \
+        ''.join(body_parts) + "</body></html>"
+
+
+class DocxHtmlStreamer:
+    """把 DOCX 正文转换为 HTML 分段"""
+
+    def __init__(self, doc, section_chars: int = DOCX_SECTION_CHARS):
+        from docx.oxml.ns import qn
+
+        self.doc = doc
+        self.section_chars = section_chars
+        self._qn = qn
+        self._image_cache = {}
+
+    def sections(self) -> Iterator[str]:
+        """
+        逐个产出 HTML 分段
+
+        超过 section_chars 后在下一个分页符处切分；超过两倍仍没有分页符
+        时在块级元素之间强制切分
+        """
+        parts = []
+        size = 0
+
+        for block_html, page_break in self._blocks():
+            parts.append(block_html)
+            size += len(block_html)
+
+            if (page_break and size >= self.section_chars) or size >= self.section_chars * 2:
+                yield _wrap(parts)
+                parts = []
+                size = 0
+
+        if parts:
+            yield _wrap(parts)
+
+    def _blocks(self) -> Iterator[Tuple[str, bool]]:
+        """按正文顺序产出 (块HTML, 块后是否有分页符)"""
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+
+        p_tag = self._qn('w:p')
+        tbl_tag = self._qn('w:tbl')
+
+        for element in self.doc.element.body.iterchildren():
+            if element.tag == p_tag:
+                paragraph = Paragraph(element, self.doc)
+                yield self._paragraph_html(paragraph), self._has_page_break(element)
+            elif element.tag == tbl_tag:
+                yield self._table_html(Table(element, self.doc)), False
+
+    def _has_page_break(self, element) -> bool:
+        br = self._qn('w:br')
+        br_type = self._qn('w:type')
+        for node in element.iter(br):
+            if node.get(br_type) == 'page':
+                return True
+        return False
+
+    def _paragraph_html(self, paragraph) -> str:
+        content = self._runs_html(paragraph)
+        if not content.strip():
+            return ''
+
+        style_name = paragraph.style.name if paragraph.style is not None else ''
+        if style_name == 'Title':
+            return f"<h1>{content}</h1>"
+        if style_name.startswith('Heading'):
+            level = style_name.replace('Heading', '').strip()
+            level = int(level) if level.isdigit() else 2
+            level = min(max(level, 1), 6)
+            return f"<h{level}>{content}</h{level}>"
+
+        alignment = paragraph.alignment
+        style = f" style='text-align: {_ALIGNMENTS[int(alignment)]}'" \
+            if alignment is not None and int(alignment) in _ALIGNMENTS else ''
+        return f"<p{style}>{content}</p>"
+
+    def _runs_html(self, paragraph) -> str:
+        parts = []
+        for run in paragraph.runs:
+            text = html.escape(run.text)
+            if text:
+                if run.bold:
+                    text = f"<strong>{text}</strong>"
+                if run.italic:
+                    text = f"<em>{text}</em>"
+                if run.underline:
+                    text = f"<u>{text}</u>"
+                parts.append(text)
+
+            for image_html in self._run_images(run):
+                parts.append(image_html)
+        return ''.join(parts)
+
+    def _run_images(self, run) -> Iterator[str]:
+        """run 中的内嵌图片（转为 data URI）"""
+        blip_tag = self._qn('a:blip')
+        embed_attr = self._qn('r:embed')
+        extent_tag = self._qn('wp:extent')
+
+        for drawing in run.element.iter(self._qn('w:drawing')):
+            extent = next(drawing.iter(extent_tag), None)
+            size_style = ''
+            if extent is not None:
+                width = int(extent.get('cx', 0)) // EMU_PER_PX
+                height = int(extent.get('cy', 0)) // EMU_PER_PX
+                if width and height:
+                    size_style = f" style='width: {width}px; height: {height}px'"
+
+            for blip in drawing.iter(blip_tag):
+                rel_id = blip.get(embed_attr)
+                uri = self._image_uri(rel_id)
+                if uri:
+                    yield f"<img src='{uri}'{size_style}>"
+
+    def _image_uri(self, rel_id: str) -> str:
+        if rel_id in self._image_cache:
+            return self._image_cache[rel_id]
+
+        uri = None
+        part = self.doc.part.related_parts.get(rel_id)
+        if part is not None:
+            encoded = base64.b64encode(part.blob).decode('ascii')
+            uri = f"data:{part.content_type};base64,{encoded}"
+        # 同一图片多次出现时只编码一次；只保留较小的图片，避免缓存过大
+        if uri and len(uri) < 256 * 1024:
+            self._image_cache[rel_id] = uri
+        return uri
+
+    def _table_html(self, table) -> str:
+        tc_tag = self._qn('w:tc')
+        span_tag = self._qn('w:gridSpan')
+        val_attr = self._qn('w:val')
+
+        rows = []
+        for tr in table._tbl.tr_lst:
+            cells = []
+            for tc in tr.iterchildren(tc_tag):
+                span = next(tc.iter(span_tag), None)
+                colspan = f" colspan='{span.get(val_attr)}'" if span is not None else ''
+                texts = []
+                for p in tc.iter(self._qn('w:p')):
+                    text = ''.join(t.text or '' for t in p.iter(self._qn('w:t')))
+                    if text:
+                        texts.append(html.escape(text))
+                cells.append(f"<td{colspan}>{'<br>'.join(texts)}</td>")
+            rows.append(f"<tr>{''.join(cells)}</tr>")
+        return f"<table>{''.join(rows)}</table>"
+
+
+# WD_ALIGN_PARAGRAPH 取值
+_ALIGNMENTS = {0: 'left', 1: 'center', 2: 'right', 3: 'justify'}
+
+
+def docx_to_pdf(file_path: str, output_path: str) -> str:
+    """
+    DOCX 转 PDF
+
+    Returns:
+        output_path，失败时抛出异常
+    """
+    from docx import Document
+
+    doc = Document(file_path)
+    streamer = DocxHtmlStreamer(doc)
+
+    # 没有 pdfunite 时无法拼接，退化为单个分段
+    if not shutil.which('pdfunite'):
+        streamer.section_chars = float('inf')
+
+    workdir = tempfile.mkdtemp(prefix='docx2pdf_', dir=os.path.dirname(output_path) or None)
+    try:
+        section_paths = _render_sections(streamer.sections(), workdir)
+        if not section_paths:
+            raise ValueError("文档没有内容")
+
+        if len(section_paths) == 1:
+            os.replace(section_paths[0], output_path)
+        else:
+            subprocess.run(
+                ['pdfunite', *section_paths, output_path],
+                check=True,
+                capture_output=True
+            )
+        logger.info("DOCX转PDF: %s 个分段 -> %s", len(section_paths), output_path)
+        return output_path
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _render_sections(sections: Iterator[str], workdir: str) -> List[str]:
+    """并行渲染分段，同时在途的分段数有上限，保证内存有界"""
+    executor = _get_executor()
+    max_in_flight = DOCX_RENDER_WORKERS * 2
+    pending = deque()
+    paths = []
+
+    try:
+        for index, section_html in enumerate(sections):
+            path = os.path.join(workdir, f"section_{index:05d}.pdf")
+            paths.append(path)
+            pending.append(executor.submit(_render_section, section_html, path))
+            if len(pending) >= max_in_flight:
+                pending.popleft().result()
+
+        while pending:
+            pending.popleft().result()
+    except Exception:
+        for future in pending:
+            future.cancel()
+        raise
+
+    return paths
@@ -0,0 +1,444 @@
+"""
+上传文件目录
+
+在内存中维护上传目录的索引，列表和按文件名查找不再需要扫描目录；
+记录每个文件的上传者、派生关系（转换生成的PDF指向原文件）和内容哈希，
+供配额、清理和上传去重使用。这些信息保存在上传目录下的 .catalog.json；多实例
+部署时（传入 StateStore）条目保存在共享存储中，各实例合并彼此的修改。
+使用对象存储时本地副本可能已被淘汰，索引保存完整条目，对象存储中仍有
+的文件不会因为本地不存在而移除
+
+目录可能被其他途径修改，后台清理任务会分批增量扫描与磁盘同步
+"""
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backend.change_log import ChangeLog
+from backend.singleflight import atomic_output
+from backend.storage_layout import StorageLayout
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = '.catalog.json'
+
+
+class CatalogEntry:
+    __slots__ = ('filename', 'path', 'size', 'created', 'modified', 'owner', 'source', 'sha256')
+
+    def __init__(
+        self,
+        filename: str,
+        path: str,
+        size: int,
+        created: float,
+        modified: float,
+        owner: str = None,
+        source: str = None,
+        sha256: str = None
+    ):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.created = created
+        self.modified = modified
+        # 上传者标识
+        self.owner = owner
+        # 派生文件的原文件名，上传的文件为None
+        self.source = source
+        # 上传时计算的内容哈希，文件在磁盘上被修改后失效
+        self.sha256 = sha256
+
+    def to_record(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'CatalogEntry':
+        return cls(**record)
+
+    def to_dict(self):
+        """与 FileHandler.list_files 的条目格式一致"""
+        return {
+            'filename': self.filename,
+            'path': self.path,
+            'size': self.size,
+            'created': datetime.fromtimestamp(self.created),
+            'modified': datetime.fromtimestamp(self.modified)
+        }
+
+
+class FileCatalog:
+    def __init__(
+        self,
+        folder: str,
+        layout: StorageLayout = None,
+        change_log_limit: int = 1000,
+        store=None,
+        sync_interval: float = 1.0,
+        remote=None
+    ):
+        self.folder = folder
+        self.store = store
+        # 可选的对象存储（CachedStorage）
+        self.remote = remote
+        self.sync_interval = sync_interval
+        self.layout = layout or StorageLayout(folder, sharded=False)
+        self.index_path = os.path.join(folder, INDEX_FILENAME)
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._lock = threading.RLock()
+        self._dirty = False
+        # 版本号和变更记录，用于列表接口的 ETag 和增量同步
+        self._changes = ChangeLog(change_log_limit, store, 'file')
+        # 已合并的共享存储变更序号
+        self._store_seq = 0
+        self._last_sync = 0.0
+        # 预览名（不含扩展名的文件名）到条目的索引，索引版本变化后重建
+        self._by_stem: Dict[str, List[CatalogEntry]] = {}
+        self._by_stem_version = None
+
+    def load(self):
+        """读取索引并与磁盘完整同步一次"""
+        metadata = {}
+        if self.store is not None:
+            self._load_from_store()
+        else:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error("读取文件索引失败: %s", e)
+            if self.remote is not None:
+                # 本地副本已淘汰的文件，是否仍在对象存储中由扫描确认
+                for record in metadata.values():
+                    if 'path' in record and not os.path.exists(record['path']):
+                        entry = CatalogEntry.from_record(record)
+                        self._entries[entry.filename] = entry
+
+        for _ in self.scan(metadata=metadata):
+            pass
+        logger.info("文件索引已加载: %s 个文件", len(self._entries))
+
+    def save(self):
+        """保存上传者和派生关系（有变化时）；共享存储每次修改即写入，无需保存"""
+        if self.store is not None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.remote is not None:
+                metadata = {entry.filename: entry.to_record() for entry in self._entries.values()}
+            else:
+                metadata = {
+                    entry.filename: {'owner': entry.owner, 'source': entry.source, 'sha256': entry.sha256}
+                    for entry in self._entries.values()
+                    if entry.owner or entry.source or entry.sha256
+                }
+            self._dirty = False
+
+        try:
+            with atomic_output(self.index_path) as temp_path:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, ensure_ascii=False)
+        except Exception as e:
+            logger.error("保存文件索引失败: %s", e)
+            with self._lock:
+                self._dirty = True
+
+    def add(
+        self,
+        path: str,
+        owner: str = None,
+        source: str = None,
+        sha256: str = None
+    ) -> Optional[CatalogEntry]:
+        """登记新写入的文件"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        filename = os.path.basename(path)
+        entry = CatalogEntry(filename, path, stat.st_size, stat.st_ctime, stat.st_mtime, owner, source, sha256)
+        with self._lock:
+            self._entries[filename] = entry
+            self._dirty = True
+            self._changes.record(filename)
+            self._store_put([entry])
+        return entry
+
+    def remove(self, filename: str) -> List[CatalogEntry]:
+        """移除文件及其派生文件的条目，返回被移除的条目"""
+        with self._lock:
+            removed = [self._entries.pop(filename)] if filename in self._entries else []
+            for derived in [e for e in self._entries.values() if e.source == filename]:
+                removed.append(self._entries.pop(derived.filename))
+            for entry in removed:
+                self._dirty = True
+                self._changes.record(entry.filename, deleted=True)
+            self._store_delete(removed)
+            return removed
+
+    def remove_many(self, filenames: List[str]) -> List[CatalogEntry]:
+        """一次移除多个文件及其派生文件的条目"""
+        names = set(filenames)
+        with self._lock:
+            removed = [
+                entry for entry in self._entries.values()
+                if entry.filename in names or entry.source in names
+            ]
+            for entry in removed:
+                del self._entries[entry.filename]
+                self._dirty = True
+                self._changes.record(entry.filename, deleted=True)
+            self._store_delete(removed)
+            return removed
+
+    def touch(self, filename: str):
+        """文件内容以外的变化（如预览已生成）也需要让客户端刷新该条目"""
+        with self._lock:
+            if filename in self._entries:
+                self._changes.record(filename)
+                if self.store is not None:
+                    self.store.touch_file(filename)
+
+    @property
+    def version(self) -> int:
+        return self._changes.version
+
+    @property
+    def changed_at(self) -> float:
+        return self._changes.changed_at
+
+    def changes_since(self, token: str) -> Optional[Tuple[List[dict], List[str], str]]:
+        """
+        令牌之后的变化
+
+        Returns:
+            (更新的条目, 删除的文件名, 新令牌)；令牌无效或过旧时返回 None
+        """
+        with self._lock:
+            changes = self._changes.changes_since(token)
+            if changes is None:
+                return None
+            updated, deleted = changes
+            entries = []
+            for filename in updated:
+                entry = self._entries.get(filename)
+                if entry is None:
+                    deleted.add(filename)
+                else:
+                    entries.append(entry.to_dict())
+            entries.sort(key=lambda e: e['created'], reverse=True)
+            return entries, sorted(deleted), self.token
+
+    @property
+    def token(self) -> str:
+        with self._lock:
+            if self._changes.unsynced:
+                # 本实例的修改要取得共享序号后才能反映到令牌
+                self.sync(force=True)
+            return self._changes.token
+
+    def get(self, filename: str) -> Optional[dict]:
+        entry = self.get_entry(filename)
+        return entry.to_dict() if entry else None
+
+    def get_entry(self, filename: str) -> Optional[CatalogEntry]:
+        with self._lock:
+            entry = self._entries.get(filename)
+        if entry is None and self.store is not None:
+            # 可能刚由其他实例上传
+            self.sync(force=True)
+            with self._lock:
+                entry = self._entries.get(filename)
+        return entry
+
+    def find_preview_source(self, preview_name: str) -> Optional[CatalogEntry]:
+        """
+        预览名对应的文件条目
+
+        转换生成的PDF与原文件同名，同时存在时取原文件
+        """
+        self.sync()
+        with self._lock:
+            if self._by_stem_version != self.version:
+                index = {}
+                for entry in self._entries.values():
+                    index.setdefault(os.path.splitext(entry.filename)[0], []).append(entry)
+                self._by_stem = index
+                self._by_stem_version = self.version
+            candidates = list(self._by_stem.get(preview_name, ()))
+        candidates.sort(key=lambda entry: entry.source is not None)
+        return candidates[0] if candidates else None
+
+    def list_files(self) -> List[dict]:
+        """按创建时间倒序列出文件"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.created, reverse=True)
+            return [entry.to_dict() for entry in entries]
+
+    def entries(self) -> List[CatalogEntry]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def usage(self, owner: str) -> int:
+        """上传者占用的字节数（含派生文件）"""
+        with self._lock:
+            total = 0
+            for entry in self._entries.values():
+                source = self._entries.get(entry.source) if entry.source else entry
+                if source is not None and source.owner == owner:
+                    total += entry.size
+            return total
+
+    def find_by_hash(self, sha256: str) -> Optional[CatalogEntry]:
+        """内容相同的已上传文件（不含派生文件），有多个时取最新的"""
+        with self._lock:
+            matches = [
+                entry for entry in self._entries.values()
+                if entry.sha256 == sha256 and entry.source is None
+            ]
+        return max(matches, key=lambda e: e.created) if matches else None
+
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def scan(self, batch_size: int = 500, metadata: dict = None) -> Iterator[int]:
+        """
+        分批与磁盘同步，每批结束时产出已处理的文件数
+
+        每批只短暂持有锁，调用方可以在批之间让出CPU
+        """
+        metadata = metadata or {}
+        seen = set()
+        batch = []
+        processed = 0
+
+        # 布局只产出普通文件，跳过索引和正在写入的临时文件
+        for dir_entry in self.layout.iter_uploads():
+            seen.add(dir_entry.name)
+            batch.append(dir_entry)
+            if len(batch) >= batch_size:
+                self._sync_batch(batch, metadata)
+                processed += len(batch)
+                batch = []
+                yield processed
+
+        if batch:
+            self._sync_batch(batch, metadata)
+            processed += len(batch)
+
+        with self._lock:
+            candidates = [e for e in self._entries.values() if e.filename not in seen]
+        stored = set()
+        if self.remote is not None and candidates:
+            try:
+                stored = self.remote.stored_paths()
+            except Exception as e:
+                logger.error("列出对象存储失败，跳过移除: %s", e)
+                candidates = []
+
+        with self._lock:
+            # 扫描期间新登记的文件不在 seen 中，确认已不存在才移除
+            missing = [
+                e for e in candidates
+                if e.path not in stored and not os.path.exists(e.path)
+                and self._entries.get(e.filename) is e
+            ]
+            for entry in missing:
+                del self._entries[entry.filename]
+                self._dirty = True
+                self._changes.record(entry.filename, deleted=True)
+            self._store_delete(missing)
+        yield processed
+
+    def _sync_batch(self, batch: list, metadata: dict):
+        stats = []
+        for dir_entry in batch:
+            try:
+                stats.append((dir_entry, dir_entry.stat()))
+            except OSError:
+                continue
+
+        with self._lock:
+            changed = []
+            for dir_entry, stat in stats:
+                entry = self._entries.get(dir_entry.name)
+                if entry is not None:
+                    if (entry.path, entry.size, entry.modified) != (dir_entry.path, stat.st_size, stat.st_mtime):
+                        # 迁移到分片目录后路径会变化
+                        entry.path = dir_entry.path
+                        entry.size = stat.st_size
+                        if entry.modified != stat.st_mtime:
+                            # 内容可能已变化，哈希作废
+                            entry.sha256 = None
+                        entry.modified = stat.st_mtime
+                        self._changes.record(entry.filename)
+                        changed.append(entry)
+                    continue
+
+                info = metadata.get(dir_entry.name, {})
+                entry = CatalogEntry(
+                    dir_entry.name,
+                    dir_entry.path,
+                    stat.st_size,
+                    stat.st_ctime,
+                    stat.st_mtime,
+                    owner=info.get('owner'),
+                    source=info.get('source'),
+                    sha256=info.get('sha256')
+                )
+                self._entries[dir_entry.name] = entry
+                self._changes.record(dir_entry.name)
+                changed.append(entry)
+            self._store_put(changed)
+
+    def sync(self, force: bool = False):
+        """（共享模式）合并其他实例的修改，按 sync_interval 限制频率"""
+        if self.store is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_sync < self.sync_interval:
+                return
+            self._last_sync = now
+
+            result = self.store.changes_since('file', self._store_seq)
+            if result is None:
+                self._load_from_store()
+                return
+            self._store_seq, filenames = result
+            for filename in filenames:
+                record = self.store.get_file(filename)
+                if record is None:
+                    if self._entries.pop(filename, None) is not None:
+                        self._changes.record(filename, deleted=True)
+                else:
+                    self._entries[filename] = CatalogEntry.from_record(record)
+                    self._changes.record(filename)
+            self._changes.synced(self._store_seq)
+
+    def _load_from_store(self):
+        with self._lock:
+            self._store_seq = self.store.last_seq()
+            self._entries = {
+                record['filename']: CatalogEntry.from_record(record)
+                for record in self.store.load_files()
+            }
+            self._changes.bump()
+            self._changes.synced(self._store_seq)
+
+    def _store_put(self, entries: List[CatalogEntry]):
+        if self.store is not None and entries:
+            self.store.put_files([entry.to_record() for entry in entries])
+
+    def _store_delete(self, entries: List[CatalogEntry]):
+        if self.store is not None and entries:
+            self.store.delete_files([entry.filename for entry in entries])
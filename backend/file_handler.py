@@ -3,18 +3,69 @@
 """
 import os
 import magic
+import hashlib
 import logging
 from datetime import datetime
+from functools import partial
 from typing import Optional
-from PIL import Image
+from PIL import Image, ImageOps, ImageSequence
 from pathlib import Path
 
+from backend.config import PRINT_DPI, PAPER_SIZE, PAGE_MARGIN_MM, MAX_IMAGE_PIXELS
+from backend.metrics import timed, cache_result
+from backend.pdf_writer import StreamingPdfWriter, paper_size_pt, mm_to_pt
+from backend.raster_cache import rasterize_pdf
+from backend.sandbox import SandboxError
+from backend.singleflight import SingleFlight, atomic_output, temp_path_for
+from backend.storage_layout import StorageLayout
+
 logger = logging.getLogger(__name__)
 
+# EXIF 方向标签
+EXIF_ORIENTATION = 0x0112
+
+# convert_to_pdf 会实际转换的扩展名
+CONVERTIBLE_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'bmp',
+    'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
+    'txt'
+}
+
+def open_upload_image(file_path: str):
+    """
+    打开上传的图片，像素数超过 MAX_IMAGE_PIXELS 时视为解压炸弹拒绝
+
+    只读取文件头判断尺寸；服务自己渲染的高分辨率栅格不受此限制
+    """
+    img = Image.open(file_path)
+    if MAX_IMAGE_PIXELS > 0 and img.width * img.height > MAX_IMAGE_PIXELS:
+        img.close()
+        raise ValueError(f"图片像素数超出限制: {img.width}x{img.height}")
+    return img
+
+
 class FileHandler:
-    def __init__(self, upload_folder: str, preview_folder: str):
+    def __init__(
+        self,
+        upload_folder: str,
+        preview_folder: str,
+        office_pool=None,
+        layout: StorageLayout = None,
+        sandbox=None,
+        storage=None
+    ):
         self.upload_folder = upload_folder
         self.preview_folder = preview_folder
+        # 文件和预览的目录布局，默认平铺
+        self.layout = layout or StorageLayout(upload_folder, preview_folder, sharded=False)
+        # 可选的 LibreOffice 进程池（SofficePool），优先用于Office文档转换
+        self.office_pool = office_pool
+        # 可选的隔离进程池（Sandbox），预览生成和内置转换在其中执行
+        self.sandbox = sandbox
+        # 可选的对象存储（CachedStorage），上传目录作为它的本地缓存
+        self.storage = storage
+        # 同一预览/转换同时只生成一次
+        self._flights = SingleFlight()
         self._ensure_directories()
     
     def _ensure_directories(self):
@@ -27,6 +78,7 @@ class FileHandler:
         return '.' in filename and \
             filename.rsplit('.', 1)[1].lower() in allowed_extensions
     
+    @timed('detect_type')
     def get_file_type(self, file_path: str) -> str:
         """获取文件的MIME类型"""
         try:
@@ -34,7 +86,7 @@ class FileHandler:
             file_type = mime.from_file(file_path)
             return file_type
         except Exception as e:
-            logger.warning(f"无法检测文件类型: {e}")
+            logger.warning("无法检测文件类型: %s", e)
             return 'application/octet-stream'
     
     def get_file_extension(self, filename: str) -> str:
@@ -49,6 +101,7 @@ class FileHandler:
             size_in_bytes /= 1024
         return f"{size_in_bytes:.2f} TB"
     
+    @timed('preview')
     def generate_preview(
         self,
         file_path: str,
@@ -60,7 +113,54 @@ class FileHandler:
         生成文件预览图
         
         支持: PDF, 图片, 文本, Office文档(通过转换)
+        同一预览被并发请求时只生成一次，其余请求等待同一结果
         """
+        if not self.fetch(file_path):
+            return None
+        preview_path = self._flights.do(
+            ('preview', file_path, output_name, width, height),
+            self._run_isolated,
+            '_generate_preview', file_path, output_name, width, height
+        )
+        if preview_path:
+            # 返回值是预览的URL路径，按布局取得本地文件
+            self.persist(self.layout.preview_path(output_name))
+        return preview_path
+    
+    def save_upload(self, stream, file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """分块写入上传的文件，同时计算内容哈希，返回 sha256 十六进制串"""
+        digest = hashlib.sha256()
+        with open(file_path, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest()
+    
+    def fetch(self, file_path: str) -> bool:
+        """确保文件在本地可用（使用对象存储时按需下载）"""
+        if self.storage is None:
+            return os.path.exists(file_path)
+        return self.storage.fetch(file_path)
+    
+    def persist(self, file_path: str):
+        """新写入的文件同时保存到对象存储"""
+        if self.storage is not None:
+            self.storage.persist(file_path)
+    
+    def _run_isolated(self, method: str, *args):
+        """有隔离进程池时在工作进程中执行 method，失败或超时视为生成失败"""
+        if self.sandbox is None:
+            return getattr(self, method)(*args)
+        try:
+            return self.sandbox.run(method, *args)
+        except SandboxError as e:
+            logger.error("隔离进程执行 %s 失败: %s: %s", method, args[0], e)
+            return None
+    
+    def _generate_preview(self, file_path: str, output_name: str, width: int, height: int) -> Optional[str]:
         try:
             file_type = self.get_file_type(file_path)
             extension = self.get_file_extension(file_path)
@@ -83,11 +183,11 @@ class FileHandler:
             
             # 暂时不支持其他格式的预览
             else:
-                logger.info(f"文件类型 {file_type} 暂不支持预览生成")
+                logger.info("文件类型 %s 暂不支持预览生成", file_type)
                 return None
         
         except Exception as e:
-            logger.error(f"生成预览失败: {e}")
+            logger.error("生成预览失败: %s", e)
             return None
     
     def _generate_office_preview(
@@ -136,10 +236,10 @@ class FileHandler:
             return None
             
         except ImportError as e:
-            logger.warning(f"Office库未安装: {e}")
+            logger.warning("Office库未安装: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Office预览生成失败: {e}")
+            logger.error("Office预览生成失败: %s", e)
             return None
     
     def _text_to_preview_image(
@@ -182,9 +282,13 @@ class FileHandler:
             draw.text((20, y), line.strip()[:100], fill='#666', font=font)
             y += 16
         
-        output_path = os.path.join(self.preview_folder, f"{output_name}.png")
-        img.save(output_path, 'PNG')
-        
+        return self._save_preview(img, output_name)
+    
+    def _save_preview(self, img, output_name: str) -> str:
+        """原子写入预览图，返回访问URL"""
+        output_path = self.layout.preview_path(output_name, create=True)
+        with atomic_output(output_path) as temp_path:
+            img.save(temp_path, 'PNG')
         return f"/previews/{output_name}.png"
     
     def _generate_image_preview(
@@ -195,14 +299,10 @@ class FileHandler:
         height: int
     ) -> str:
         """生成图片预览"""
-        with Image.open(file_path) as img:
+        with open_upload_image(file_path) as img:
             # 保持宽高比缩放
             img.thumbnail((width, height))
-            
-            output_path = os.path.join(self.preview_folder, f"{output_name}.png")
-            img.save(output_path, 'PNG')
-        
-        return f"/previews/{output_name}.png"
+            return self._save_preview(img, output_name)
     
     def _generate_pdf_preview(self, file_path: str, output_name: str, width: int, height: int) -> str:
         """
@@ -216,15 +316,13 @@ class FileHandler:
             images = convert_from_path(file_path, dpi=72, first_page=1, last_page=1)
             
             if images:
-                output_path = os.path.join(self.preview_folder, f"{output_name}.png")
                 images[0].thumbnail((width, height))
-                images[0].save(output_path, 'PNG')
-                return f"/previews/{output_name}.png"
+                return self._save_preview(images[0], output_name)
         
         except ImportError:
             logger.warning("pdf2image未安装，无法生成PDF预览")
         except Exception as e:
-            logger.error(f"PDF预览生成失败: {e}")
+            logger.error("PDF预览生成失败: %s", e)
         
         return None
     
@@ -271,72 +369,172 @@ class FileHandler:
                 draw.text((20, y_position), line, fill='black', font=font)
                 y_position += 20
             
-            output_path = os.path.join(self.preview_folder, f"{output_name}.png")
-            img.save(output_path, 'PNG')
-            
-            return f"/previews/{output_name}.png"
+            return self._save_preview(img, output_name)
         
         except Exception as e:
-            logger.error(f"文本预览生成失败: {e}")
+            logger.error("文本预览生成失败: %s", e)
             return None
     
+    @timed('convert')
     def convert_to_pdf(self, file_path: str) -> Optional[str]:
         """
         将文件转换为PDF格式
         
         支持: Office文档, 图片, 文本
+        同一文件被并发转换时只转换一次，结果原子写入
         """
+        output_path = os.path.splitext(file_path)[0] + '.pdf'
+        if not self.fetch(file_path):
+            return None
+        if output_path != file_path:
+            # 之前的转换结果可能只在对象存储中
+            self.fetch(output_path)
+        return self._flights.do(('pdf', output_path), self._convert_to_pdf, file_path, output_path)
+    
+    def _convert_to_pdf(self, file_path: str, output_path: str) -> Optional[str]:
         try:
             extension = self.get_file_extension(file_path)
-            output_path = os.path.splitext(file_path)[0] + '.pdf'
+            
+            # 已有比源文件新的转换结果时直接复用
+            if extension.lower() in CONVERTIBLE_EXTENSIONS:
+                fresh = self._is_fresh(output_path, file_path)
+                cache_result('conversion', fresh)
+                if fresh:
+                    return output_path
             
             # 图片转PDF
             if extension.lower() in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-                return self._image_to_pdf(file_path, output_path)
+                return self._convert_atomic(
+                    partial(self._run_isolated, '_image_to_pdf'), file_path, output_path
+                )
             
             # Office文档转PDF
             elif extension.lower() in ['doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx']:
-                return self._office_to_pdf(file_path, output_path)
+                return self._convert_atomic(self._office_to_pdf, file_path, output_path)
             
             # 文本转PDF
             elif extension.lower() == 'txt':
-                return self._text_to_pdf(file_path, output_path)
+                return self._convert_atomic(
+                    partial(self._run_isolated, '_text_to_pdf'), file_path, output_path
+                )
             
             return file_path  # 已经是PDF或其他格式
         
         except Exception as e:
-            logger.error(f"文件转换失败: {e}")
+            logger.error("文件转换失败: %s", e)
             return None
     
+    def _convert_atomic(self, converter, file_path: str, output_path: str) -> Optional[str]:
+        """转换器写入临时文件，成功后替换为 output_path"""
+        temp_path = temp_path_for(output_path)
+        try:
+            result = converter(file_path, temp_path)
+            if result != temp_path:
+                return result
+            os.replace(temp_path, output_path)
+            self.persist(output_path)
+            return output_path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def _is_fresh(self, derived_path: str, source_path: str) -> bool:
+        """派生文件存在且不早于源文件"""
+        try:
+            return os.path.getmtime(derived_path) >= os.path.getmtime(source_path)
+        except OSError:
+            return False
+    
     def _image_to_pdf(self, file_path: str, output_path: str) -> str:
-        """图片转PDF"""
-        images = []
+        """
+        图片转PDF
+        
+        逐张处理并立即写入PDF，内存中只保留当前一张图片；按打印分辨率
+        和纸张尺寸缩小，JPEG 解码时直接按目标尺寸降采样(draft)
+        """
         extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp']
         
         if '*' in file_path or '?' in file_path:
             from glob import glob
-            files = sorted(glob(file_path))
-            for f in files:
-                if self.get_file_extension(f) in extensions:
-                    images.append(Image.open(f))
+            files = [f for f in sorted(glob(file_path)) if self.get_file_extension(f) in extensions]
         else:
-            images.append(Image.open(file_path))
+            files = [file_path]
         
-        if images:
-            images[0].save(
-                output_path,
-                save_all=True,
-                append_images=images[1:]
-            )
-            return output_path
+        if not files:
+            return file_path
+        
+        page_width, page_height = paper_size_pt(PAPER_SIZE)
+        margin = mm_to_pt(PAGE_MARGIN_MM)
+        
+        with open(output_path, 'wb') as f:
+            writer = StreamingPdfWriter(f)
+            for image_file in files:
+                with open_upload_image(image_file) as img:
+                    for frame in ImageSequence.Iterator(img):
+                        self._add_image_page(writer, frame, page_width, page_height, margin)
+            writer.close()
+        
+        return output_path
+    
+    def _add_image_page(self, writer, img, page_width: float, page_height: float, margin: float):
+        """把一帧图片缩放到打印分辨率后写入一页（横图使用横向页面）"""
+        # EXIF 方向 5~8 表示旋转90度，按旋转后的尺寸判断横竖
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+        width, height = (img.height, img.width) if rotated else (img.width, img.height)
+        landscape = width > height
+        if landscape:
+            page_width, page_height = page_height, page_width
+        
+        # 可打印区域在打印分辨率下的像素尺寸
+        target = (
+            max(1, int((page_width - 2 * margin) / 72 * PRINT_DPI)),
+            max(1, int((page_height - 2 * margin) / 72 * PRINT_DPI))
+        )
+        
+        # 线稿/灰度图无损编码，照片用JPEG
+        lossless = img.mode in ('1', 'L', 'LA', 'P', 'I', 'I;16')
+        target_mode = 'L' if img.mode in ('1', 'L', 'LA', 'I', 'I;16') else 'RGB'
+        
+        if img.format == 'JPEG':
+            # draft 作用于旋转前的图像
+            img.draft(target_mode, target[::-1] if rotated else target)
+        img = ImageOps.exif_transpose(img)
         
-        return file_path
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, 'white')
+            background.paste(img, mask=img.getchannel('A'))
+            img = background if target_mode == 'RGB' else background.convert('L')
+        elif img.mode != target_mode:
+            img = img.convert(target_mode)
+        
+        img.thumbnail(target, reducing_gap=2.0)
+        writer.add_image_page(
+            img,
+            (page_width, page_height),
+            margin,
+            encoding='flate' if lossless else 'jpeg'
+        )
     
     def _office_to_pdf(self, file_path: str, output_path: str) -> str:
         """Office文档转PDF"""
         extension = self.get_file_extension(file_path).lower()
-        logger.info(f"开始转换Office文档: {file_path} -> {output_path}")
+        logger.info("开始转换Office文档: %s -> %s", file_path, output_path)
+        
+        if self.office_pool and self.office_pool.supports(extension):
+            result = self.office_pool.convert(file_path, output_path)
+            if result:
+                logger.info("LibreOffice转PDF成功: %s", output_path)
+                return result
+            logger.warning("LibreOffice转换失败，使用内置转换: %s", file_path)
         
+        # soffice 已在独立进程中运行，内置转换放到隔离进程中
+        result = self._run_isolated('_builtin_office_to_pdf', file_path, output_path)
+        return result or file_path
+    
+    def _builtin_office_to_pdf(self, file_path: str, output_path: str) -> str:
+        """使用 python-docx/openpyxl/python-pptx 的内置转换"""
+        extension = self.get_file_extension(file_path).lower()
         try:
             # DOCX 转 PDF
             if extension in ['doc', 'docx']:
@@ -356,40 +554,24 @@ class FileHandler:
                 if result != file_path:
                     return result
             
-            logger.error(f"Office文档转换失败: {file_path}")
+            logger.error("Office文档转换失败: %s", file_path)
             return file_path
             
         except Exception as e:
-            logger.error(f"Office文档转换异常: {e}")
+            logger.error("Office文档转换异常: %s", e)
             return file_path
     
     def _docx_to_pdf(self, file_path: str, output_path: str) -> str:
-        """DOCX转PDF"""
+        """DOCX转PDF（段落、表格、图片，分段并行渲染）"""
         try:
-            from docx import Document
-            from weasyprint import HTML
-            
-            doc = Document(file_path)
-            
-            # 创建HTML（保留基本格式）
-            html_content = "<html><head><meta charset='utf-8'></head><body>"
-            for para in doc.paragraphs:
-                text = para.text.strip()
-                if text:
-                    # 检测标题样式
-                    if para.style.name.startswith('Heading'):
-                        level = int(para.style.name.replace('Heading', '')) or 2
-                        html_content += f"<h{level}>{text}</h{level}>"
-                    else:
-                        html_content += f"<p>{text}</p>"
-            html_content += "</body></html>"
+            from backend.docx_converter import docx_to_pdf
             
-            HTML(string=html_content).write_pdf(output_path)
-            logger.info(f"DOCX转PDF成功: {output_path}")
+            docx_to_pdf(file_path, output_path)
+            logger.info("DOCX转PDF成功: %s", output_path)
             return output_path
             
         except Exception as e:
-            logger.error(f"DOCX转PDF失败: {e}")
+            logger.error("DOCX转PDF失败: %s", e)
             return file_path
     
     def _xlsx_to_pdf(self, file_path: str, output_path: str) -> str:
@@ -426,11 +608,11 @@ class FileHandler:
             html_content += "</table></body></html>"
             
             HTML(string=html_content).write_pdf(output_path)
-            logger.info(f"XLSX转PDF成功: {output_path}")
+            logger.info("XLSX转PDF成功: %s", output_path)
             return output_path
             
         except Exception as e:
-            logger.error(f"XLSX转PDF失败: {e}")
+            logger.error("XLSX转PDF失败: %s", e)
             return file_path
     
     def _pptx_to_pdf(self, file_path: str, output_path: str) -> str:
@@ -471,13 +653,13 @@ class FileHandler:
             
             if images:
                 images[0].save(output_path, save_all=True, append_images=images[1:])
-                logger.info(f"PPTX转PDF成功: {output_path}")
+                logger.info("PPTX转PDF成功: %s", output_path)
                 return output_path
             
             return file_path
             
         except Exception as e:
-            logger.error(f"PPTX转PDF失败: {e}")
+            logger.error("PPTX转PDF失败: %s", e)
             return file_path
     
     def _text_to_pdf(self, file_path: str, output_path: str) -> str:
@@ -501,27 +683,47 @@ class FileHandler:
             return output_path
         
         except Exception as e:
-            logger.error(f"文本转PDF失败: {e}")
+            logger.error("文本转PDF失败: %s", e)
             return file_path
     
+    def rasterize_pdf(self, file_path: str, output_path: str, dpi: int) -> str:
+        """打印栅格缓存的渲染（在隔离进程中由 RasterCache 调用）"""
+        return rasterize_pdf(file_path, output_path, dpi)
+    
     def delete_file(self, file_path: str) -> bool:
-        """删除文件及其预览"""
+        """删除文件及其预览和转换生成的PDF（包括对象存储中的副本）"""
         try:
+            preview_name = os.path.splitext(os.path.basename(file_path))[0]
+            pdf_path = None
+            if self.get_file_extension(file_path) in CONVERTIBLE_EXTENSIONS:
+                pdf_path = os.path.splitext(file_path)[0] + '.pdf'
+            
+            # 本地副本可能已淘汰，只在对象存储中
+            deleted = self.storage is not None
+            if self.storage is not None:
+                paths = [file_path, self.layout.preview_path(preview_name)]
+                self.storage.delete(paths + ([pdf_path] if pdf_path else []))
+            
             if os.path.exists(file_path):
                 os.remove(file_path)
-                logger.info(f"已删除文件: {file_path}")
-                
+                logger.info("已删除文件: %s", file_path)
+                deleted = True
+            
+            if deleted:
                 # 同时删除预览文件
-                preview_name = os.path.splitext(os.path.basename(file_path))[0]
-                preview_path = os.path.join(self.preview_folder, f"{preview_name}.png")
-                if os.path.exists(preview_path):
+                preview_path = self.layout.resolve_preview(preview_name)
+                if preview_path:
                     os.remove(preview_path)
-                    logger.info(f"已删除预览: {preview_path}")
+                    logger.info("已删除预览: %s", preview_path)
                 
-                return True
-            return False
+                # convert_to_pdf 生成的PDF
+                if pdf_path and os.path.exists(pdf_path):
+                    os.remove(pdf_path)
+                    logger.info("已删除转换文件: %s", pdf_path)
+            
+            return deleted
         except Exception as e:
-            logger.error(f"删除文件失败: {e}")
+            logger.error("删除文件失败: %s", e)
             return False
     
     def list_files(self, folder: str = None) -> list:
@@ -531,6 +733,9 @@ class FileHandler:
         
         try:
             for filename in os.listdir(folder):
+                # 跳过正在写入的临时文件
+                if filename.startswith('.'):
+                    continue
                 file_path = os.path.join(folder, filename)
                 if os.path.isfile(file_path):
                     stat = os.stat(file_path)
@@ -543,6 +748,18 @@ class FileHandler:
                     })
         
         except Exception as e:
-            logger.error(f"列出文件失败: {e}")
+            logger.error("列出文件失败: %s", e)
         
         return sorted(files, key=lambda x: x['created'], reverse=True)
+
+
+def create_isolated_handler(
+    upload_folder: str,
+    preview_folder: str,
+    sharded: bool,
+    depth: int,
+    width: int
+) -> FileHandler:
+    """隔离进程中的 FileHandler（Sandbox 的 factory），目录布局与主进程一致"""
+    layout = StorageLayout(upload_folder, preview_folder, sharded, depth, width)
+    return FileHandler(upload_folder, preview_folder, layout=layout)
@@ -0,0 +1,57 @@
+"""
+上传文件和预览的下载
+
+FILE_SERVE_MODE:
+- direct: 由应用发送。支持 Range、If-None-Match/If-Modified-Since，文件按块
+  流式发送；WSGI 服务器提供 wsgi.file_wrapper 时（如 gunicorn）使用内核
+  sendfile，不经过 Python 缓冲区
+- x-accel: 只返回 X-Accel-Redirect 头，由 nginx 从 X_ACCEL_PREFIX 对应的
+  internal location 发送文件（Range、缓存校验都由 nginx 处理）
+- x-sendfile: 返回 X-Sendfile 头，适用于 Apache mod_xsendfile / lighttpd
+"""
+import os
+import mimetypes
+from typing import Optional
+
+from flask import Response, send_file
+
+from backend.config import FILE_SERVE_MODE, X_ACCEL_PREFIX
+
+
+def configure(app):
+    """按配置设置 Flask（x-sendfile 模式由 send_file 输出 X-Sendfile 头）"""
+    app.config['USE_X_SENDFILE'] = FILE_SERVE_MODE == 'x-sendfile'
+
+
+def send_stored_file(
+    file_path: str,
+    root: str,
+    mimetype: Optional[str] = None,
+    max_age: int = 0
+) -> Response:
+    """
+    发送上传目录中的文件
+
+    Args:
+        file_path: 文件绝对路径，必须位于 root 之下
+        root: 上传目录，x-accel 模式下用于计算内部跳转路径
+        max_age: Cache-Control 的 max-age（秒），0 表示每次都需要校验
+    """
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+    if FILE_SERVE_MODE == 'x-accel':
+        relative_path = os.path.relpath(file_path, root).replace(os.sep, '/')
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{X_ACCEL_PREFIX.rstrip('/')}/{relative_path}"
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response
+
+    return send_file(
+        file_path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=True,
+        max_age=max_age
+    )
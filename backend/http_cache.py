@@ -0,0 +1,107 @@
+"""
+列表接口的条件请求和响应压缩
+
+文件索引和任务跟踪器各自维护版本令牌（进程启动标识和版本号，共享模式下
+为共享存储的变更序号），ETag 由令牌生成，不需要序列化响应就能判断客户端
+缓存是否有效；没有变化时返回 304。
+较大的 JSON 响应按 Accept-Encoding 使用 brotli（可选依赖）或 gzip 压缩
+"""
+import gzip
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from flask import Response, request
+
+from backend.config import COMPRESS_MIN_SIZE, COMPRESS_LEVEL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 进程重启后版本号从头计数，ETag 加上启动标识避免与旧的版本号混淆
+BOOT_ID = uuid.uuid4().hex[:8]
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def make_etag(name: str, token: str) -> str:
+    return f"{name}-{token}"
+
+
+def not_modified(etag: str, changed_at: float) -> Optional[Response]:
+    """
+    客户端缓存仍然有效时返回 304 响应，否则返回None
+
+    有 If-None-Match 时只比较 ETag；If-Modified-Since 只有秒级精度，
+    最近一次变化还在当前这一秒内时不据此返回 304
+    """
+    if request.if_none_match:
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif (
+        request.if_modified_since is None
+        or _within_current_second(changed_at)
+        or request.if_modified_since < _http_time(changed_at)
+    ):
+        return None
+
+    response = Response(status=304)
+    set_validators(response, etag, changed_at)
+    return response
+
+
+def set_validators(response: Response, etag: str, changed_at: float) -> Response:
+    # 响应可能被压缩，使用弱 ETag
+    response.set_etag(etag, weak=True)
+    # 同一秒内可能还有变化，此时的 Last-Modified 无法区分前后两个版本，不发送
+    if not _within_current_second(changed_at):
+        response.last_modified = _http_time(changed_at)
+    response.cache_control.no_cache = True
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """按 Accept-Encoding 压缩较大的文本/JSON响应"""
+    if (
+        response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or not response.mimetype.startswith(COMPRESSIBLE_TYPES)
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        encoding = 'br'
+    elif accept['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        # brotli 质量 0~11，默认级别 6 对应质量 4，速度与 gzip 相近
+        data = brotli.compress(data, quality=min(11, max(0, COMPRESS_LEVEL - 2)))
+    else:
+        data = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _http_time(timestamp: float) -> datetime:
+    # HTTP 日期精确到秒
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
+
+
+def _within_current_second(timestamp: float) -> bool:
+    return int(timestamp) >= int(time.time())
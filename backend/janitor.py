@@ -0,0 +1,225 @@
+"""
+上传目录后台清理
+
+按 schedule 周期运行:
+- 分批增量扫描上传目录，同步文件索引
+- 删除超过保留期限的上传文件（连同预览和转换生成的PDF）
+- 总占用超过上限时从最旧的文件开始删除
+- 删除原文件已不存在的预览图和转换PDF
+- 删除中断遗留的临时文件和转换工作目录
+- 使用对象存储时，本地缓存超过上限则移除最久未访问的本地副本
+
+正在打印的文件不会被删除
+"""
+import os
+import time
+import shutil
+import itertools
+import logging
+import threading
+from typing import Callable, Iterable, Optional
+
+import schedule
+
+from backend.file_catalog import FileCatalog
+from backend.file_handler import FileHandler
+
+logger = logging.getLogger(__name__)
+
+# 新文件的预览/转换可能尚未登记，清理孤立文件前等待的时间（秒）
+ORPHAN_GRACE_SECONDS = 10 * 60
+# 临时文件和转换工作目录超过此时间视为中断遗留（秒）
+STALE_TEMP_SECONDS = 60 * 60
+
+
+class Janitor:
+    def __init__(
+        self,
+        catalog: FileCatalog,
+        file_handler: FileHandler,
+        retention_hours: float = 0,
+        max_bytes: int = 0,
+        interval: float = 300,
+        batch_size: int = 500,
+        in_use: Callable[[], Iterable[str]] = None,
+        leader: Callable[[], bool] = None,
+        temp_dirs: Iterable[str] = ()
+    ):
+        """
+        Args:
+            retention_hours: 上传文件保留时长，0为不限
+            max_bytes: 上传目录总大小上限，0为不限
+            interval: 运行间隔（秒）
+            batch_size: 每批扫描的目录项数，批之间让出CPU
+            in_use: 返回正在使用（打印中）的文件路径
+            leader: 多实例部署时返回本实例是否负责清理，为空时总是执行
+            temp_dirs: 上传和预览目录之外还要清理中断临时文件的目录（如栅格缓存）
+        """
+        self.catalog = catalog
+        self.file_handler = file_handler
+        self.retention_hours = retention_hours
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.in_use = in_use or (lambda: ())
+        self.leader = leader
+        self.temp_dirs = list(temp_dirs)
+        self._scheduler = schedule.Scheduler()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._scheduler.every(self.interval).seconds.do(self.run_once)
+        self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+        self._thread.start()
+        logger.info("文件清理任务已启动: 每 %s 秒", self.interval)
+
+    def stop(self):
+        self._stop.set()
+        self.catalog.save()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._scheduler.run_pending()
+            self._stop.wait(min(self.interval, 1))
+
+    def run_once(self):
+        """
+        执行一轮清理
+
+        过期和超限删除作用于共享的文件索引，多实例部署时只由 leader 执行；
+        中断遗留的临时文件和对象存储的本地缓存属于各实例自己，每个实例都清理
+        """
+        try:
+            if self.leader is None or self.leader():
+                for _ in self.catalog.scan(self.batch_size):
+                    # 批之间让出GIL，避免阻塞请求线程
+                    time.sleep(0)
+
+                busy = set(self.in_use())
+                removed = self._expire(busy)
+                removed += self._enforce_size_limit(busy)
+                removed += self._remove_orphaned_derived(busy)
+                removed += self._remove_orphaned_previews()
+                self.catalog.save()
+
+                if removed:
+                    logger.info("文件清理完成: 删除 %s 个文件", removed)
+            else:
+                busy = set(self.in_use())
+
+            self._remove_stale_temp()
+            if self.file_handler.storage is not None:
+                self.file_handler.storage.trim(busy)
+        except Exception as e:
+            logger.error("文件清理失败: %s", e)
+
+    def remove_upload(self, filename: str) -> bool:
+        """删除上传文件、预览和转换生成的PDF，并移除索引条目"""
+        entry = self.catalog.get_entry(filename)
+        if entry is None:
+            return False
+        deleted = self.file_handler.delete_file(entry.path)
+        derived = [removed.path for removed in self.catalog.remove(filename) if removed.path != entry.path]
+        if self.file_handler.storage is not None:
+            self.file_handler.storage.delete(derived)
+        for path in derived:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error("删除派生文件失败: %s", e)
+        return deleted
+
+    def _uploads(self):
+        return [entry for entry in self.catalog.entries() if entry.source is None]
+
+    def _is_busy(self, entry, busy: set) -> bool:
+        if entry.path in busy:
+            return True
+        stem = os.path.splitext(entry.path)[0]
+        return f"{stem}.pdf" in busy
+
+    def _expire(self, busy: set) -> int:
+        if not self.retention_hours:
+            return 0
+        cutoff = time.time() - self.retention_hours * 3600
+        removed = 0
+        for entry in self._uploads():
+            if entry.created < cutoff and not self._is_busy(entry, busy):
+                logger.info("文件超过保留期限: %s", entry.filename)
+                removed += self.remove_upload(entry.filename)
+        return removed
+
+    def _enforce_size_limit(self, busy: set) -> int:
+        if not self.max_bytes:
+            return 0
+        total = self.catalog.total_size()
+        removed = 0
+        for entry in sorted(self._uploads(), key=lambda e: e.created):
+            if total <= self.max_bytes:
+                break
+            if self._is_busy(entry, busy):
+                continue
+            freed = entry.size + sum(
+                e.size for e in self.catalog.entries() if e.source == entry.filename
+            )
+            logger.info("上传目录超过容量上限，删除: %s", entry.filename)
+            if self.remove_upload(entry.filename):
+                total -= freed
+                removed += 1
+        return removed
+
+    def _remove_orphaned_derived(self, busy: set) -> int:
+        """原文件已删除的转换PDF"""
+        removed = 0
+        for entry in self.catalog.entries():
+            if entry.source is None or entry.path in busy:
+                continue
+            if self.catalog.get_entry(entry.source) is None:
+                logger.info("删除孤立的转换文件: %s", entry.filename)
+                removed += self.file_handler.delete_file(entry.path)
+                self.catalog.remove(entry.filename)
+        return removed
+
+    def _remove_orphaned_previews(self) -> int:
+        """没有对应上传文件的预览图"""
+        stems = {os.path.splitext(entry.filename)[0] for entry in self.catalog.entries()}
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        removed = 0
+
+        for index, dir_entry in enumerate(self.file_handler.layout.iter_previews()):
+            if index % self.batch_size == 0:
+                time.sleep(0)
+            name, ext = os.path.splitext(dir_entry.name)
+            if ext != '.png' or name in stems:
+                continue
+            try:
+                if dir_entry.stat().st_mtime < cutoff:
+                    os.remove(dir_entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def _remove_stale_temp(self):
+        """中断遗留的临时文件和DOCX转换工作目录"""
+        cutoff = time.time() - STALE_TEMP_SECONDS
+        layout = self.file_handler.layout
+        for folder in itertools.chain(layout.upload_dirs(), layout.preview_dirs(), self.temp_dirs):
+            time.sleep(0)
+            with os.scandir(folder) as it:
+                for dir_entry in it:
+                    is_temp = dir_entry.name.startswith('.') and '.tmp' in dir_entry.name
+                    is_workdir = dir_entry.name.startswith('docx2pdf_') and dir_entry.is_dir()
+                    if not (is_temp or is_workdir):
+                        continue
+                    try:
+                        if dir_entry.stat().st_mtime >= cutoff:
+                            continue
+                        if is_workdir:
+                            shutil.rmtree(dir_entry.path, ignore_errors=True)
+                        else:
+                            os.remove(dir_entry.path)
+                    except OSError:
+                        continue
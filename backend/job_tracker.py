@@ -0,0 +1,358 @@
+"""
+打印任务跟踪
+
+维护本地 PrintJob 与 CUPS 作业的对应关系，增量同步 CUPS 作业状态，
+对外提供合并后的任务视图
+"""
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.change_log import ChangeLog
+from backend.models import PrintJob, PrintJobStatus
+from backend.metrics import JOB_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+# CUPS job-state (RFC 8011) -> 本地任务状态
+CUPS_STATE_MAP = {
+    3: PrintJobStatus.PRINTING,   # pending
+    4: PrintJobStatus.PRINTING,   # pending-held
+    5: PrintJobStatus.PRINTING,   # processing
+    6: PrintJobStatus.PRINTING,   # processing-stopped
+    7: PrintJobStatus.CANCELLED,  # canceled
+    8: PrintJobStatus.FAILED,     # aborted
+    9: PrintJobStatus.COMPLETED   # completed
+}
+
+FINISHED_STATUSES = (PrintJobStatus.COMPLETED, PrintJobStatus.FAILED, PrintJobStatus.CANCELLED)
+
+
+class JobTracker:
+    """
+    打印任务跟踪器
+
+    print_backend 为任意 PrintBackend（CUPS或模拟后端）
+
+    只对尚未结束的作业做增量查询：以最早的未结束 cups_job_id 为起点
+    向CUPS请求状态，并且按 poll_interval 限制查询频率，多个客户端同时
+    轮询 /api/jobs 时只会触发一次CUPS查询
+
+    传入 store（StateStore）时任务同时写入共享存储，并在每次 refresh 时
+    合并其他实例的修改；leader 返回 False 的实例不查询CUPS，任务状态
+    由持有租约的实例同步。状态变化以原状态为条件写入存储，条件不满足
+    （其他实例已修改，如已取消）时以存储中的记录为准，修改方法返回 False
+    """
+
+    def __init__(
+        self,
+        print_backend,
+        poll_interval: float = 2.0,
+        history_limit: int = 500,
+        change_log_limit: int = 1000,
+        store=None,
+        leader: Callable[[], bool] = None
+    ):
+        self.print_backend = print_backend
+        self.poll_interval = poll_interval
+        self.history_limit = history_limit
+        self.store = store
+        self.leader = leader
+        self._jobs: Dict[str, PrintJob] = {}
+        # 未结束的 cups_job_id -> 本地 job_id
+        self._active: Dict[int, str] = {}
+        self._lock = threading.RLock()
+        self._last_poll = 0.0
+        # 版本号和变更记录，用于 /api/jobs 的 ETag 和增量同步
+        self._changes = ChangeLog(change_log_limit, store, 'job')
+        # 已合并的共享存储变更序号
+        self._store_seq = 0
+        if store is not None:
+            self._load_from_store()
+
+    def add(self, job: PrintJob):
+        """登记新任务"""
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._record(job)
+            self._trim_history()
+
+    def get(self, job_id: str) -> Optional[PrintJob]:
+        """获取任务（共享模式下本地没有时先合并其他实例的修改）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None and self.store is not None:
+                self._sync_store()
+                job = self._jobs.get(job_id)
+            return job
+
+    def bind_cups_job(self, job: PrintJob, cups_job_id: int) -> bool:
+        """
+        记录任务已提交到CUPS
+
+        Returns:
+            任务在提交期间已被取消（或已结束）时返回 False，调用方应取消CUPS作业
+        """
+        with self._lock:
+            if job.is_finished():
+                return False
+            expected = job.status
+            job.cups_job_id = cups_job_id
+            job.status = PrintJobStatus.PRINTING
+            if not self._record(job, expected):
+                return False
+            self._active[cups_job_id] = job.job_id
+            return True
+
+    def mark_failed(self, job: PrintJob, error_message: str) -> bool:
+        """标记任务失败，任务已结束或被其他实例修改时返回 False"""
+        with self._lock:
+            if job.is_finished():
+                return False
+            expected = job.status
+            self._finish(job, PrintJobStatus.FAILED)
+            job.error_message = error_message
+            return self._record(job, expected)
+
+    def mark_cancelled(self, job: PrintJob) -> bool:
+        """标记任务已取消，任务已结束或被其他实例修改时返回 False"""
+        with self._lock:
+            if job.is_finished():
+                return False
+            expected = job.status
+            self._finish(job, PrintJobStatus.CANCELLED)
+            return self._record(job, expected)
+
+    def refresh(self, force: bool = False):
+        """
+        从CUPS同步未结束任务的状态
+
+        Args:
+            force: 忽略查询频率限制
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_poll < self.poll_interval:
+                return
+            self._last_poll = now
+            self._sync_store()
+
+            if not self._active or (self.leader is not None and not self.leader()):
+                return
+            first_job_id = min(self._active)
+
+        updates = self.print_backend.get_job_updates(first_job_id)
+
+        with self._lock:
+            for update in updates:
+                job_id = self._active.get(update['job_id'])
+                if job_id is None:
+                    continue
+
+                job = self._jobs.get(job_id)
+                if job is None:
+                    self._active.pop(update['job_id'], None)
+                    continue
+
+                self._apply_update(job, update)
+
+    @property
+    def version(self) -> int:
+        return self._changes.version
+
+    @property
+    def changed_at(self) -> float:
+        return self._changes.changed_at
+
+    @property
+    def token(self) -> str:
+        with self._lock:
+            if self._changes.unsynced:
+                # 本实例的修改要取得共享序号后才能反映到令牌
+                self._sync_store()
+            return self._changes.token
+
+    def changes_since(self, token: str) -> Optional[Tuple[List[dict], List[str], str]]:
+        """
+        令牌之后的任务变化
+
+        Returns:
+            (更新的任务, 删除的任务ID, 新令牌)；令牌无效或过旧时返回 None
+        """
+        with self._lock:
+            changes = self._changes.changes_since(token)
+            if changes is None:
+                return None
+            updated, deleted = changes
+            jobs = []
+            for job_id in updated:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    deleted.add(job_id)
+                else:
+                    jobs.append(job)
+            jobs.sort(key=lambda j: j.created_at, reverse=True)
+            return [job.to_dict() for job in jobs], sorted(deleted), self.token
+
+    def list_jobs(self) -> List[dict]:
+        """获取合并后的任务列表（按创建时间倒序）"""
+        self.refresh()
+
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+            return [job.to_dict() for job in jobs]
+
+    def active_files(self) -> List[str]:
+        """未结束任务正在使用的文件"""
+        with self._lock:
+            return [job.file_path for job in self._jobs.values() if not job.is_finished()]
+
+    def queue_depth(self) -> Dict[tuple, int]:
+        """各打印机未结束的任务数（供指标抓取）"""
+        depth = {}
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.is_finished():
+                    key = (job.printer_name or '',)
+                    depth[key] = depth.get(key, 0) + 1
+        return depth
+
+    def _apply_update(self, job: PrintJob, update: dict):
+        """将CUPS作业状态应用到本地任务"""
+        expected = job.status
+        state = update['state']
+        changed = False
+        if job.cups_state != state:
+            job.cups_state = state
+            changed = True
+
+        if update.get('time_at_processing') and job.started_at is None:
+            job.started_at = datetime.fromtimestamp(update['time_at_processing'])
+            changed = True
+
+        status = CUPS_STATE_MAP.get(state)
+        if status is not None and status != job.status:
+            changed = True
+            if status == PrintJobStatus.PRINTING:
+                job.status = status
+            else:
+                if update.get('time_at_completed'):
+                    job.completed_at = datetime.fromtimestamp(update['time_at_completed'])
+                if status == PrintJobStatus.FAILED and update.get('message'):
+                    job.error_message = update['message']
+
+                self._finish(job, status)
+                logger.info(
+                    "任务 %s (CUPS作业 %s) 状态: %s", job.job_id, job.cups_job_id, status.value,
+                    extra={'job_id': job.job_id}
+                )
+
+        if changed:
+            self._record(job, expected)
+
+    def _finish(self, job: PrintJob, status: PrintJobStatus):
+        """结束任务并停止跟踪（结果计入指标由 _record 在写入成功后完成）"""
+        job.status = status
+        if job.completed_at is None:
+            job.completed_at = datetime.now()
+        if job.cups_job_id is not None:
+            self._active.pop(job.cups_job_id, None)
+
+    def _trim_history(self):
+        """超出历史上限时丢弃最早的已结束任务"""
+        overflow = len(self._jobs) - self.history_limit
+        if overflow <= 0:
+            return
+
+        finished = sorted(
+            (job for job in self._jobs.values() if job.is_finished()),
+            key=lambda j: j.created_at
+        )
+        for job in finished[:overflow]:
+            del self._jobs[job.job_id]
+            self._changes.record(job.job_id, deleted=True)
+        if self.store is not None:
+            self.store.delete_jobs([job.job_id for job in finished[:overflow]])
+
+    def _record(self, job: PrintJob, expected: PrintJobStatus = None) -> bool:
+        """
+        记录任务变化，共享模式下同时写入存储
+
+        Args:
+            expected: 修改前的状态；共享模式下存储中的状态已不是它时放弃写入，
+                改用存储中的记录并返回 False。新任务为 None
+        """
+        if self.store is not None:
+            if expected is None:
+                self.store.put_job(job.to_record())
+            elif not self.store.update_job(job.to_record(), expected.value):
+                logger.info("任务 %s 已被其他实例修改，以共享存储为准", job.job_id,
+                            extra={'job_id': job.job_id})
+                self._merge_record(job.job_id, self.store.get_job(job.job_id))
+                return False
+        self._changes.record(job.job_id)
+        if job.is_finished() and expected is not None and expected not in FINISHED_STATUSES:
+            JOB_OUTCOMES.inc(status=job.status.value)
+        return True
+
+    def claim_pending(self, limit: int = 10) -> List[PrintJob]:
+        """（共享模式）领取其他实例登记的待提交任务"""
+        records = self.store.claim_pending_jobs(limit)
+        with self._lock:
+            return [self._merge_record(record['job_id'], record) for record in records]
+
+    def fail_stale_claims(self, older_than: float):
+        """
+        领取后长时间没有提交结果的任务标记为失败
+
+        领取的实例可能在提交过程中退出，无法确定CUPS是否已收到作业，
+        为避免重复打印不自动重新提交
+        """
+        for record in self.store.stale_claims(older_than):
+            with self._lock:
+                job = self._merge_record(record['job_id'], record)
+            logger.warning("任务 %s 提交中断，标记为失败", job.job_id, extra={'job_id': job.job_id})
+            self.mark_failed(job, '提交过程中服务实例退出，请重新打印')
+
+    def _load_from_store(self):
+        with self._lock:
+            self._store_seq = self.store.last_seq()
+            self._jobs.clear()
+            self._active.clear()
+            for record in self.store.load_jobs():
+                self._merge_record(record['job_id'], record)
+            self._changes.bump()
+            self._changes.synced(self._store_seq)
+
+    def _sync_store(self):
+        """合并其他实例对任务的修改"""
+        if self.store is None:
+            return
+        result = self.store.changes_since('job', self._store_seq)
+        if result is None:
+            self._load_from_store()
+            return
+        self._store_seq, job_ids = result
+        for job_id in job_ids:
+            self._merge_record(job_id, self.store.get_job(job_id))
+        self._changes.synced(self._store_seq)
+
+    def _merge_record(self, job_id: str, record: Optional[dict]) -> Optional[PrintJob]:
+        """用存储中的记录替换本地任务（记录为None表示已删除）"""
+        old = self._jobs.pop(job_id, None)
+        if old is not None and old.cups_job_id is not None:
+            self._active.pop(old.cups_job_id, None)
+
+        if record is None:
+            if old is not None:
+                self._changes.record(job_id, deleted=True)
+            return None
+
+        job = PrintJob.from_record(record)
+        self._jobs[job_id] = job
+        if job.cups_job_id is not None and not job.is_finished():
+            self._active[job.cups_job_id] = job_id
+        self._changes.record(job_id)
+        return job
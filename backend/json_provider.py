@@ -0,0 +1,54 @@
+"""
+基于 orjson 的 Flask JSON 序列化
+
+orjson 的编码速度是标准库 json 的数倍，原生支持 datetime 和 Enum，
+大列表接口（/api/jobs、/api/files）受益明显。orjson 是可选依赖，
+JSON_PROVIDER=auto 时已安装就启用
+"""
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """dumps/response 使用 orjson，无法编码的类型交给 Flask 默认处理"""
+
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self._encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+    def _encode(self, obj) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=self.option)
+
+
+def configure(app, provider: str = 'auto'):
+    """
+    按配置设置 app.json
+
+    Args:
+        provider: auto（有 orjson 就用）/ orjson / stdlib
+    """
+    if provider == 'stdlib':
+        return
+    if orjson is None:
+        if provider == 'orjson':
+            logger.warning("未安装 orjson，使用标准库 json")
+        return
+    app.json_provider_class = OrjsonProvider
+    app.json = OrjsonProvider(app)
+    logger.info("JSON 序列化使用 orjson")
@@ -0,0 +1,195 @@
+"""
+日志配置
+
+请求线程只把日志记录放入内存队列，由后台 QueueListener 线程写文件和
+标准输出，磁盘变慢时不会阻塞请求。日志文件按大小或时间轮转；
+LOG_FORMAT=json 时每行一个 JSON 对象，带上请求ID和任务ID便于检索
+"""
+import os
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Optional
+
+from backend import tracing
+
+_current_job_id: ContextVar[Optional[str]] = ContextVar('current_job_id', default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s%(context)s'
+
+_listener: Optional[QueueListener] = None
+
+# 在请求线程中把异常格式化为文本（堆栈帧不放入队列）
+_exc_formatter = logging.Formatter()
+
+
+@contextmanager
+def job_context(job_id: str):
+    """在此范围内记录的日志都带上任务ID"""
+    token = _current_job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job_id.reset(token)
+
+
+def _current_request_id() -> Optional[str]:
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        return trace_id
+    # 关闭请求跟踪时使用客户端传入的请求ID
+    from flask import has_request_context, request
+    if has_request_context():
+        return request.headers.get('X-Request-ID')
+    return None
+
+
+class ContextFilter(logging.Filter):
+    """在记录日志的线程中取出请求ID和任务ID（上下文变量不会跨线程）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = _current_request_id()
+        if getattr(record, 'job_id', None) is None:
+            record.job_id = _current_job_id.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃日志并计数，不阻塞调用方"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        只合并消息参数，异常堆栈放在 exc_text 中交给后台线程的格式化器
+
+        默认实现会把堆栈并入消息并清空异常信息，JSON 格式就无法单独输出 exc_info
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        context = []
+        if getattr(record, 'request_id', None):
+            context.append(f"req={record.request_id}")
+        if getattr(record, 'job_id', None):
+            context.append(f"job={record.job_id}")
+        record.context = f" [{' '.join(context)}]" if context else ''
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            data['request_id'] = request_id
+        job_id = getattr(record, 'job_id', None)
+        if job_id:
+            data['job_id'] = job_id
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def configure_logging(
+    level: str = 'INFO',
+    log_file: str = None,
+    log_format: str = 'text',
+    max_bytes: int = 50 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: str = '',
+    queue_size: int = 10000
+) -> QueueListener:
+    """
+    配置根日志器
+
+    Args:
+        level: 日志级别名称
+        log_file: 日志文件路径，为空时只输出到标准输出
+        log_format: text / json
+        max_bytes: 按大小轮转的阈值，rotate_when 非空时不使用
+        backup_count: 保留的轮转文件数
+        rotate_when: 按时间轮转（如 midnight、H），为空时按大小轮转
+        queue_size: 内存队列长度，0为不限
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if log_format == 'json' else TextFormatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        if rotate_when:
+            handlers.append(TimedRotatingFileHandler(
+                log_file, when=rotate_when, backupCount=backup_count, encoding='utf-8'
+            ))
+        else:
+            handlers.append(RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=max(0, queue_size))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _listener = QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
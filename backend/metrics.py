@@ -0,0 +1,259 @@
+"""
+运行指标（Prometheus 文本格式）
+
+轻量实现，不依赖 prometheus_client。METRICS_ENABLED 关闭时所有记录操作
+在第一行直接返回，对请求路径几乎没有开销
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Tuple
+
+from backend import tracing
+from backend.config import METRICS_ENABLED, TRACING_ENABLED
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """格式化标签: {a="1",b="2"}"""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def collect(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        lines.extend(self.collect())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    瞬时值
+
+    可以通过 set_function 注册回调，在抓取时才计算取值（回调返回
+    {标签值元组: 数值}），避免在请求路径上维护
+    """
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Callable[[], Dict[Tuple[str, ...], float]] = None
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        self._function = function
+
+    def collect(self) -> list:
+        if self._function is not None:
+            items = list(self._function().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    metric_type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # 标签值 -> [各桶计数..., 总和, 次数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块耗时"""
+        if not METRICS_ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> list:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+STAGE_DURATION = registry.register(Histogram(
+    'print_service_stage_duration_seconds',
+    '各处理阶段耗时（上传、类型检测、预览、转换、CUPS提交）',
+    ('stage',)
+))
+CACHE_REQUESTS = registry.register(Counter(
+    'print_service_cache_requests_total',
+    '缓存查询次数',
+    ('cache', 'result')
+))
+JOB_OUTCOMES = registry.register(Counter(
+    'print_service_jobs_total',
+    '打印任务结束状态计数',
+    ('status',)
+))
+QUEUE_DEPTH = registry.register(Gauge(
+    'print_service_queue_depth',
+    '各打印机未结束的任务数',
+    ('printer',)
+))
+UPLOAD_BYTES = registry.register(Counter(
+    'print_service_upload_bytes_total',
+    '累计上传字节数'
+))
+PREWARM_TASKS = registry.register(Counter(
+    'print_service_prewarm_tasks_total',
+    '后台预热的预览/转换次数',
+    ('kind', 'result')
+))
+REJECTED_REQUESTS = registry.register(Counter(
+    'print_service_rejected_requests_total',
+    '被准入控制拒绝的请求数',
+    ('endpoint', 'reason')
+))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """统计处理阶段耗时，同时记录为当前请求的跟踪 span"""
+    with tracing.span(stage), STAGE_DURATION.time(stage=stage):
+        yield
+
+
+def timed(stage: str):
+    """统计函数耗时的装饰器"""
+    def decorator(func):
+        if not METRICS_ENABLED and not TRACING_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_result(cache: str, hit: bool):
+    """记录一次缓存命中/未命中"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
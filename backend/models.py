@@ -1,6 +1,7 @@
 """
 数据模型
 """
+from abc import ABC, abstractmethod
 from datetime import datetime
 from typing import Optional, List
 from enum import Enum
@@ -13,7 +14,38 @@ class PrintJobStatus(Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
-class PrintJob:
+class _Model(ABC):
+    """
+    模型基类：使用 __slots__，缓存 to_dict() 的结果
+
+    任何属性赋值都会让缓存失效；to_dict() 返回的字典是共享的，调用方
+    不要修改
+    """
+    __slots__ = ('_dict',)
+    
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != '_dict':
+            object.__setattr__(self, '_dict', None)
+    
+    def to_dict(self) -> dict:
+        cached = getattr(self, '_dict', None)
+        if cached is None:
+            cached = self._build_dict()
+            object.__setattr__(self, '_dict', cached)
+        return cached
+    
+    @abstractmethod
+    def _build_dict(self) -> dict:
+        """构建 to_dict() 返回的字典"""
+
+class PrintJob(_Model):
+    __slots__ = (
+        'job_id', 'filename', 'file_path', 'file_type', 'copies', 'page_range',
+        'status', 'printer_name', 'created_at', 'completed_at', 'error_message',
+        'cups_job_id', 'cups_state', 'started_at'
+    )
+    
     def __init__(
         self,
         job_id: str,
@@ -26,7 +58,10 @@ class PrintJob:
         printer_name: str = None,
         created_at: datetime = None,
         completed_at: datetime = None,
-        error_message: str = None
+        error_message: str = None,
+        cups_job_id: int = None,
+        cups_state: int = None,
+        started_at: datetime = None
     ):
         self.job_id = job_id
         self.filename = filename
@@ -39,8 +74,19 @@ class PrintJob:
         self.created_at = created_at or datetime.now()
         self.completed_at = completed_at
         self.error_message = error_message
+        self.cups_job_id = cups_job_id
+        self.cups_state = cups_state
+        self.started_at = started_at
     
-    def to_dict(self):
+    def is_finished(self) -> bool:
+        """任务是否已结束（完成/失败/取消）"""
+        return self.status in (
+            PrintJobStatus.COMPLETED,
+            PrintJobStatus.FAILED,
+            PrintJobStatus.CANCELLED
+        )
+    
+    def _build_dict(self):
         return {
             'job_id': self.job_id,
             'filename': self.filename,
@@ -49,12 +95,45 @@ class PrintJob:
             'page_range': self.page_range,
             'status': self.status.value,
             'printer_name': self.printer_name,
+            'cups_job_id': self.cups_job_id,
+            'cups_state': self.cups_state,
             'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'error_message': self.error_message
         }
+    
+    def to_record(self) -> dict:
+        """共享状态存储使用的完整记录（含文件路径）"""
+        record = dict(self.to_dict())
+        record['file_path'] = self.file_path
+        return record
+    
+    @classmethod
+    def from_record(cls, record: dict) -> 'PrintJob':
+        def parse_time(value):
+            return datetime.fromisoformat(value) if value else None
+        
+        return cls(
+            job_id=record['job_id'],
+            filename=record['filename'],
+            file_path=record['file_path'],
+            file_type=record['file_type'],
+            copies=record['copies'],
+            page_range=record['page_range'],
+            status=PrintJobStatus(record['status']),
+            printer_name=record['printer_name'],
+            created_at=parse_time(record['created_at']),
+            completed_at=parse_time(record['completed_at']),
+            error_message=record['error_message'],
+            cups_job_id=record['cups_job_id'],
+            cups_state=record['cups_state'],
+            started_at=parse_time(record['started_at'])
+        )
 
-class Printer:
+class Printer(_Model):
+    __slots__ = ('name', 'uri', 'device_id', 'state', 'is_shared', 'info')
+    
     def __init__(
         self,
         name: str,
@@ -71,7 +150,7 @@ class Printer:
         self.is_shared = is_shared
         self.info = info
     
-    def to_dict(self):
+    def _build_dict(self):
         return {
             'name': self.name,
             'uri': self.uri,
@@ -81,7 +160,9 @@ class Printer:
             'info': self.info
         }
 
-class FileInfo:
+class FileInfo(_Model):
+    __slots__ = ('filename', 'file_path', 'file_type', 'file_size', 'created_at', 'preview_path')
+    
     def __init__(
         self,
         filename: str,
@@ -98,7 +179,7 @@ class FileInfo:
         self.created_at = created_at
         self.preview_path = preview_path
     
-    def to_dict(self):
+    def _build_dict(self):
         return {
             'filename': self.filename,
             'file_type': self.file_type,
@@ -0,0 +1,397 @@
+"""
+上传文件和派生文件的对象存储
+
+OBJECT_STORAGE=local 时（默认）文件只保存在 UPLOAD_FOLDER。设置为
+directory 或 s3 时，上传文件、转换生成的PDF和预览图写入后同时保存到
+对象存储（共享目录或 S3 兼容服务，如 MinIO），UPLOAD_FOLDER 作为本地
+读穿缓存：
+
+- 读取时本地没有则从对象存储流式下载到缓存，CUPS、Pillow、LibreOffice
+  仍然处理本地文件
+- 本地缓存超过 OBJECT_CACHE_MAX_MB 时，按最近访问时间删除已在对象存储中
+  的上传文件和转换PDF的本地副本，正在打印的文件不会被删除。预览图体积小、
+  文件列表需要判断其是否存在，始终保留本地副本
+
+对象键为文件相对 UPLOAD_FOLDER 的路径（如 ab/cd/<uuid>_a.pdf、
+previews/ab/cd/<uuid>_a.png）。S3 上传大于 part_size 的文件时使用分段
+上传，每次只在内存中保留一个分段
+"""
+import os
+import time
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from backend.singleflight import SingleFlight, temp_path_for
+from backend.storage_layout import StorageLayout
+
+logger = logging.getLogger(__name__)
+
+# 流式复制的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class ObjectStorage(ABC):
+    """对象存储接口，键为 / 分隔的相对路径"""
+
+    @abstractmethod
+    def upload(self, key: str, fileobj: BinaryIO, mtime: float = None):
+        """从文件对象流式写入；mtime 随对象保存，下载时恢复"""
+
+    @abstractmethod
+    def download(self, key: str, fileobj: BinaryIO) -> Optional[float]:
+        """
+        流式读出到文件对象
+
+        Returns:
+            上传时保存的修改时间
+
+        Raises:
+            FileNotFoundError: 对象不存在
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """对象是否存在"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """删除对象，不存在时忽略"""
+
+    @abstractmethod
+    def keys(self, prefix: str = '') -> Iterator[str]:
+        """列出前缀下的所有键"""
+
+
+class DirectoryStorage(ObjectStorage):
+    """
+    以目录作为对象存储，适用于挂载的 NFS/SMB 等共享存储
+
+    写入先写临时文件再原子替换
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"无效的对象键: {key}")
+        return path
+
+    def upload(self, key: str, fileobj: BinaryIO, mtime: float = None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = temp_path_for(path)
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(fileobj, f, COPY_CHUNK_SIZE)
+            if mtime is not None:
+                os.utime(temp_path, (time.time(), mtime))
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def download(self, key: str, fileobj: BinaryIO) -> Optional[float]:
+        path = self._path(key)
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, fileobj, COPY_CHUNK_SIZE)
+            return os.fstat(f.fileno()).st_mtime
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix: str = '') -> Iterator[str]:
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                key = os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield key
+
+
+class S3Storage(ObjectStorage):
+    """
+    S3 兼容对象存储（AWS S3、MinIO 等），需要安装 boto3
+
+    Args:
+        bucket: 存储桶
+        prefix: 对象键前缀
+        endpoint_url: 服务地址，MinIO 等自建服务需要设置
+        part_size: 分段上传的分段大小，不小于 5MB（S3 的下限）
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = '',
+        endpoint_url: str = None,
+        access_key: str = None,
+        secret_key: str = None,
+        region: str = None,
+        part_size: int = 8 * 1024 * 1024
+    ):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            region_name=region or None
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def upload(self, key: str, fileobj: BinaryIO, mtime: float = None):
+        metadata = {'mtime': repr(mtime)} if mtime is not None else {}
+        first = fileobj.read(self.part_size)
+        if len(first) < self.part_size:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=first, Metadata=metadata)
+            return
+
+        # 大文件分段上传，失败时中止，避免残留未完成的分段
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key), Metadata=metadata
+        )['UploadId']
+        try:
+            parts = []
+            chunk = first
+            while chunk:
+                part_number = len(parts) + 1
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                    PartNumber=part_number, Body=chunk
+                )
+                parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+                chunk = fileobj.read(self.part_size)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+            raise
+
+    def download(self, key: str, fileobj: BinaryIO) -> Optional[float]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+        for chunk in response['Body'].iter_chunks(COPY_CHUNK_SIZE):
+            fileobj.write(chunk)
+        mtime = response.get('Metadata', {}).get('mtime')
+        return float(mtime) if mtime else None
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def keys(self, prefix: str = '') -> Iterator[str]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):]
+
+
+class CachedStorage:
+    """
+    以本地目录作为读穿缓存的对象存储
+
+    Args:
+        storage: 对象存储
+        layout: 本地目录布局，根目录即缓存目录
+        max_bytes: 本地缓存上限，0为不淘汰
+    """
+
+    def __init__(self, storage: ObjectStorage, layout: StorageLayout, max_bytes: int = 0):
+        self.storage = storage
+        self.layout = layout
+        self.root = layout.root
+        self.max_bytes = max_bytes
+        # 本地路径 -> 最近访问时间（单调时钟），未记录的按文件修改时间排序
+        self._accessed = {}
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def key_for(self, path: str) -> Optional[str]:
+        """本地路径对应的对象键，不在缓存目录下时返回None"""
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith('..') or os.path.isabs(relative):
+            return None
+        return relative.replace(os.sep, '/')
+
+    def persist(self, path: str) -> bool:
+        """把本地文件保存到对象存储"""
+        key = self.key_for(path)
+        if key is None:
+            return False
+        try:
+            with open(path, 'rb') as f:
+                self.storage.upload(key, f, os.fstat(f.fileno()).st_mtime)
+            self._touch(path)
+            return True
+        except Exception as e:
+            logger.error("保存到对象存储失败: %s: %s", key, e)
+            return False
+
+    def fetch(self, path: str) -> bool:
+        """
+        确保文件在本地缓存中，不在时从对象存储下载
+
+        Returns:
+            本地文件是否可用
+        """
+        if os.path.isfile(path):
+            self._touch(path)
+            return True
+        key = self.key_for(path)
+        if key is None:
+            return False
+        return self._flights.do(('fetch', path), self._download, key, path)
+
+    def _download(self, key: str, path: str) -> bool:
+        if os.path.isfile(path):
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = temp_path_for(path)
+        try:
+            started = time.monotonic()
+            with open(temp_path, 'wb') as f:
+                mtime = self.storage.download(key, f)
+            # 恢复修改时间，转换结果的新旧判断依赖它
+            if mtime is not None:
+                os.utime(temp_path, (time.time(), mtime))
+            os.replace(temp_path, path)
+            logger.info("从对象存储取回: %s (%.0f ms)", key, (time.monotonic() - started) * 1000)
+            self._touch(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error("从对象存储取回失败: %s: %s", key, e)
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def delete(self, paths: Iterable[str]):
+        """删除对象存储中的文件（本地副本由调用方删除）"""
+        for path in paths:
+            key = self.key_for(path)
+            if key is None:
+                continue
+            try:
+                self.storage.delete(key)
+            except Exception as e:
+                logger.error("删除对象失败: %s: %s", key, e)
+            with self._lock:
+                self._accessed.pop(path, None)
+
+    def stored_paths(self) -> set:
+        """对象存储中全部文件对应的本地路径"""
+        return {os.path.join(self.root, *key.split('/')) for key in self.storage.keys()}
+
+    def trim(self, busy: Iterable[str] = ()) -> int:
+        """
+        本地缓存超过上限时删除最久未访问的本地副本
+
+        只删除确认已在对象存储中的文件，未保存的先补传
+        """
+        if not self.max_bytes:
+            return 0
+        busy = set(busy)
+        files = []
+        total = 0
+        with self._lock:
+            accessed = dict(self._accessed)
+        now = time.monotonic()
+        for dir_entry in self.layout.iter_uploads():
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            total += stat.st_size
+            # 没有访问记录的文件按修改时间折算
+            last_used = accessed.get(dir_entry.path, now - (time.time() - stat.st_mtime))
+            files.append((last_used, stat.st_size, dir_entry.path))
+
+        evicted = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path in busy or os.path.splitext(path)[0] + '.pdf' in busy:
+                continue
+            key = self.key_for(path)
+            if not self.storage.exists(key) and not self.persist(path):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            with self._lock:
+                self._accessed.pop(path, None)
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info("本地缓存超过上限，移除 %s 个已保存到对象存储的文件", evicted)
+        return evicted
+
+    def _touch(self, path: str):
+        with self._lock:
+            self._accessed[path] = time.monotonic()
+
+
+def create_object_storage(
+    backend: str,
+    layout: StorageLayout,
+    cache_max_bytes: int = 0,
+    directory: str = '',
+    **s3_options
+) -> Optional[CachedStorage]:
+    """
+    按配置创建对象存储
+
+    Args:
+        backend: local（不使用对象存储）/ directory / s3
+        directory: directory 模式的目标目录
+        s3_options: S3Storage 的参数
+    """
+    if backend == 'local':
+        return None
+    if backend == 'directory':
+        storage = DirectoryStorage(directory)
+    elif backend == 's3':
+        try:
+            storage = S3Storage(**s3_options)
+        except ImportError:
+            logger.error("未安装 boto3，无法使用 S3 对象存储，文件只保存在本地")
+            return None
+    else:
+        raise ValueError(f"不支持的对象存储: {backend}")
+    logger.info("使用对象存储: %s，本地缓存上限 %s MB", backend, cache_max_bytes // (1024 * 1024))
+    return CachedStorage(storage, layout, cache_max_bytes)
@@ -0,0 +1,149 @@
+"""
+流式 PDF 写入
+
+每页一张图片，页面数据编码后立即写入文件，内存中只保留当前页，
+适合把大量图片或栅格化页面合成为 PDF
+"""
+import io
+import zlib
+from typing import BinaryIO, List, Tuple
+
+from PIL import Image
+
+# 纸张尺寸（毫米，纵向）
+PAPER_SIZES_MM = {
+    'A3': (297, 420),
+    'A4': (210, 297),
+    'A5': (148, 210),
+    'B5': (176, 250),
+    'LETTER': (215.9, 279.4),
+    'LEGAL': (215.9, 355.6)
+}
+
+POINTS_PER_INCH = 72
+MM_PER_INCH = 25.4
+
+
+def mm_to_pt(mm: float) -> float:
+    return mm / MM_PER_INCH * POINTS_PER_INCH
+
+
+def paper_size_pt(paper: str) -> Tuple[float, float]:
+    """纸张尺寸（磅），未知纸张按A4"""
+    width, height = PAPER_SIZES_MM.get(paper.upper(), PAPER_SIZES_MM['A4'])
+    return mm_to_pt(width), mm_to_pt(height)
+
+
+class StreamingPdfWriter:
+    """
+    逐页写入的 PDF
+
+    对象编号: 1 为 Catalog，2 为 Pages（最后写入），之后每页依次分配
+    图片、内容流、页面三个对象
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self._offsets = {}
+        self._page_ids: List[int] = []
+        self._next_id = 3
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data: bytes):
+        self.stream.write(data)
+
+    def _tell(self) -> int:
+        return self.stream.tell()
+
+    def _begin_object(self, object_id: int):
+        self._offsets[object_id] = self._tell()
+        self._write(f'{object_id} 0 obj\n'.encode('ascii'))
+
+    def _write_object(self, object_id: int, body: bytes):
+        self._begin_object(object_id)
+        self._write(body)
+        self._write(b'\nendobj\n')
+
+    def _write_stream_object(self, object_id: int, dictionary: str, data: bytes):
+        self._begin_object(object_id)
+        self._write(f'<< {dictionary} /Length {len(data)} >>\nstream\n'.encode('ascii'))
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+
+    def add_image_page(
+        self,
+        image: Image.Image,
+        page_size: Tuple[float, float],
+        margin: float = 0,
+        encoding: str = 'jpeg',
+        quality: int = 90
+    ):
+        """
+        添加一页，图片保持宽高比居中放在页边距以内
+
+        Args:
+            image: RGB 或 L 模式的图片
+            page_size: 页面尺寸（磅）
+            margin: 页边距（磅）
+            encoding: jpeg (DCTDecode) 或 flate (无损)
+        """
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        color_space = '/DeviceRGB' if image.mode == 'RGB' else '/DeviceGray'
+
+        if encoding == 'jpeg':
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=quality, optimize=False)
+            data = buffer.getvalue()
+            filter_name = '/DCTDecode'
+        else:
+            data = zlib.compress(image.tobytes(), 6)
+            filter_name = '/FlateDecode'
+
+        image_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+
+        self._write_stream_object(
+            image_id,
+            f'/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+            f'/ColorSpace {color_space} /BitsPerComponent 8 /Filter {filter_name}',
+            data
+        )
+        del data
+
+        page_width, page_height = page_size
+        box_width = page_width - 2 * margin
+        box_height = page_height - 2 * margin
+        scale = min(box_width / image.width, box_height / image.height)
+        draw_width = image.width * scale
+        draw_height = image.height * scale
+        x = (page_width - draw_width) / 2
+        y = (page_height - draw_height) / 2
+
+        content = f'q {draw_width:.3f} 0 0 {draw_height:.3f} {x:.3f} {y:.3f} cm /Im0 Do Q'.encode('ascii')
+        self._write_stream_object(content_id, '', content)
+
+        self._write_object(
+            page_id,
+            (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.3f} {page_height:.3f}] '
+             f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>').encode('ascii')
+        )
+        self._page_ids.append(page_id)
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+
+    def close(self):
+        """写入页面树、交叉引用表和尾部"""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+        self._write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>'.encode('ascii'))
+        self._write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self._tell()
+        size = self._next_id
+        lines = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+        for object_id in range(1, size):
+            lines.append(f'{self._offsets[object_id]:010d} 00000 n \n')
+        self._write(''.join(lines).encode('ascii'))
+        self._write(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii'))
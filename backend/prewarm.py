@@ -0,0 +1,227 @@
+"""
+预览和转换结果预热
+
+记录文件的访问热度（上传、预览请求、打印，按半衰期衰减），后台线程在
+服务空闲时为最热的文件补齐缺失的预览图，并为还没有PDF的Office文档预先
+转换（打印接口同步转换，等到打印时再预热已经晚了），第一次打印直接命中。热度按预览名（不含扩展名的文件名）记录，
+原文件和转换得到的PDF共用同一份热度
+
+预热只占用配置的CPU份额：每完成一项工作按耗时休眠，使工作时间占比不超过
+cpu_share；有上传/转换请求正在处理或系统负载较高时暂停
+"""
+import os
+import math
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.file_catalog import FileCatalog
+from backend.file_handler import FileHandler
+from backend.metrics import PREWARM_TASKS
+
+logger = logging.getLogger(__name__)
+
+# 各类访问的热度权重
+WEIGHTS = {
+    'upload': 1.0,
+    'preview': 1.0,
+    'print': 3.0
+}
+
+# 打印前需要转换为PDF的扩展名（与打印接口一致）
+OFFICE_EXTENSIONS = {'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'}
+
+
+class _Heat:
+    __slots__ = ('score', 'updated', 'failed')
+
+    def __init__(self):
+        self.score = 0.0
+        self.updated = time.time()
+        # 失败过的工作项（文件类型不支持等），不再重试
+        self.failed = set()
+
+
+class Prewarmer:
+    """
+    Args:
+        catalog: 文件索引
+        file_handler: 文件处理服务
+        preview_size: 预览尺寸 (宽, 高)
+        cpu_share: 预热工作允许占用的时间比例（0~1）
+        interval: 空闲检查间隔（秒）
+        half_life: 热度半衰期（秒）
+        top_n: 每轮检查的最热文件数
+        max_tracked: 最多跟踪的文件数，超出时丢弃最冷的
+        max_load: 每核平均负载超过此值时暂停
+        idle: 返回服务当前是否空闲（没有进行中的上传/转换）
+        leader: 多实例部署时返回本实例是否负责预热
+    """
+
+    def __init__(
+        self,
+        catalog: FileCatalog,
+        file_handler: FileHandler,
+        preview_size: Tuple[int, int],
+        cpu_share: float = 0.25,
+        interval: float = 5.0,
+        half_life: float = 3600,
+        top_n: int = 20,
+        max_tracked: int = 5000,
+        max_load: float = 0.7,
+        idle: Callable[[], bool] = None,
+        leader: Callable[[], bool] = None
+    ):
+        self.catalog = catalog
+        self.file_handler = file_handler
+        self.preview_size = preview_size
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        self.interval = interval
+        self.half_life = half_life
+        self.top_n = top_n
+        self.max_tracked = max_tracked
+        self.max_load = max_load
+        self.idle = idle or (lambda: True)
+        self.leader = leader
+        self._heat: Dict[str, _Heat] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='prewarm', daemon=True)
+        self._thread.start()
+        logger.info("预览预热已启动: CPU份额 %s", self.cpu_share)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def record(self, name: str, kind: str):
+        """记录预览名的一次访问（upload / preview / print）"""
+        now = time.time()
+        with self._lock:
+            heat = self._heat.get(name)
+            if heat is None:
+                heat = _Heat()
+                self._heat[name] = heat
+                if len(self._heat) > self.max_tracked:
+                    self._forget_coldest(now)
+            heat.score = self._decayed(heat, now) + WEIGHTS.get(kind, 1.0)
+            heat.updated = now
+        if kind == 'upload':
+            # 新上传的文件尽快补齐预览和PDF，赶在用户打印之前
+            self._wake.set()
+
+    def forget(self, name: str):
+        with self._lock:
+            self._heat.pop(name, None)
+
+    def hottest(self, limit: int) -> List[Tuple[str, float]]:
+        """当前最热的预览名及热度"""
+        now = time.time()
+        with self._lock:
+            scores = [(name, self._decayed(heat, now)) for name, heat in self._heat.items()]
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:limit]
+
+    def _decayed(self, heat: _Heat, now: float) -> float:
+        return heat.score * math.pow(0.5, (now - heat.updated) / self.half_life)
+
+    def _forget_coldest(self, now: float):
+        # 超出上限时丢弃最冷的十分之一，避免每次新增都排序
+        ranked = sorted(self._heat.items(), key=lambda item: self._decayed(item[1], now))
+        for name, _ in ranked[:max(1, len(ranked) // 10)]:
+            del self._heat[name]
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._can_run():
+                    self.run_once()
+            except Exception as e:
+                logger.error("预热失败: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _can_run(self) -> bool:
+        if self.leader is not None and not self.leader():
+            return False
+        if not self.idle():
+            return False
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return True
+        return load < self.max_load
+
+    def run_once(self) -> int:
+        """为最热的文件补齐预览和转换结果，返回完成的工作项数"""
+        done = 0
+        for name, _ in self.hottest(self.top_n):
+            if self._stop.is_set() or not self._can_run():
+                break
+            # 原文件和转换PDF同名时取原文件
+            entry = self.catalog.find_preview_source(name)
+            if entry is None:
+                self.forget(name)
+                continue
+            filename = entry.filename
+            for kind, task in self._pending_tasks(name, entry):
+                started = time.monotonic()
+                ok = task()
+                elapsed = time.monotonic() - started
+                PREWARM_TASKS.inc(kind=kind, result='ok' if ok else 'failed')
+                if not ok:
+                    self._mark_failed(name, kind)
+                else:
+                    done += 1
+                    logger.info("已预热%s: %s (%.0f ms)", '预览' if kind == 'preview' else 'PDF',
+                                filename, elapsed * 1000)
+                # 按耗时休眠，使预热工作时间占比不超过 cpu_share
+                if self._stop.wait(elapsed * (1 - self.cpu_share) / self.cpu_share):
+                    return done
+        return done
+
+    def _mark_failed(self, name: str, kind: str):
+        with self._lock:
+            heat = self._heat.get(name)
+            if heat is not None:
+                heat.failed.add(kind)
+
+    def _pending_tasks(self, name: str, entry) -> list:
+        with self._lock:
+            heat = self._heat.get(name)
+            if heat is None:
+                return []
+            failed = set(heat.failed)
+
+        tasks = []
+        if 'preview' not in failed and self.file_handler.layout.resolve_preview(name) is None:
+            tasks.append(('preview', lambda: self._render_preview(entry.path, name)))
+
+        extension = self.file_handler.get_file_extension(entry.filename).lower()
+        if 'convert' not in failed and extension in OFFICE_EXTENSIONS:
+            # 按索引判断，本地副本已淘汰到对象存储的PDF不必取回
+            pdf = self.catalog.get_entry(f"{name}.pdf")
+            if pdf is None or pdf.modified < entry.modified:
+                tasks.append(('convert', lambda: self._convert(entry.filename, entry.path)))
+        return tasks
+
+    def _render_preview(self, file_path: str, preview_name: str) -> bool:
+        width, height = self.preview_size
+        if not self.file_handler.generate_preview(file_path, preview_name, width, height):
+            return False
+        # 原文件和转换得到的PDF共用同一张预览
+        self.catalog.touch(os.path.basename(file_path))
+        self.catalog.touch(f"{preview_name}.pdf")
+        return True
+
+    def _convert(self, filename: str, file_path: str) -> bool:
+        pdf_path = self.file_handler.convert_to_pdf(file_path)
+        if not pdf_path or pdf_path == file_path:
+            return False
+        self.catalog.add(pdf_path, source=filename)
+        return True
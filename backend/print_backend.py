@@ -0,0 +1,88 @@
+"""
+打印后端接口
+
+CupsService 对接真实的 cupsd，SimulatedPrintBackend 在进程内模拟打印机，
+由 PRINT_BACKEND 配置选择
+"""
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from backend.models import Printer
+
+
+class PrintBackend(ABC):
+    """打印后端需要实现的接口"""
+
+    @abstractmethod
+    def get_printers(self) -> List[Printer]:
+        """获取所有可用打印机"""
+
+    @abstractmethod
+    def get_printer(self, printer_name: str) -> Optional[Printer]:
+        """获取指定打印机信息"""
+
+    @abstractmethod
+    def get_printer_status(self, printer_name: str) -> str:
+        """获取打印机状态: idle / processing / stopped / unknown / error"""
+
+    @abstractmethod
+    def print_file(
+        self,
+        printer_name: str,
+        file_path: str,
+        job_name: str = "Print Job",
+        copies: int = 1,
+        page_range: Optional[str] = None
+    ) -> int:
+        """提交打印作业，返回作业ID；失败时抛出异常"""
+
+    @abstractmethod
+    def get_jobs(self, printer_name: str = None) -> List[dict]:
+        """获取未完成的作业列表"""
+
+    @abstractmethod
+    def get_job_updates(self, first_job_id: int) -> List[dict]:
+        """
+        获取ID不小于 first_job_id 的作业状态
+
+        每项包含 job_id, state (IPP job-state), time_at_processing,
+        time_at_completed (Unix时间戳或None), message
+        """
+
+    @abstractmethod
+    def cancel_job(self, job_id: int) -> bool:
+        """取消作业"""
+
+    def get_printer_options(self, printer_name: str) -> dict:
+        """影响栅格化结果的打印机默认选项（分辨率、色彩模式、纸张等）"""
+        return {}
+
+
+def create_print_backend(name: str = None) -> PrintBackend:
+    """
+    按配置创建打印后端
+
+    Args:
+        name: cups / simulated，默认取 PRINT_BACKEND
+    """
+    from backend import config
+
+    name = (name or config.PRINT_BACKEND).lower()
+
+    if name == 'simulated':
+        from backend.simulated_backend import SimulatedPrintBackend
+        return SimulatedPrintBackend(
+            printer_names=config.SIM_PRINTERS,
+            pages_per_minute=config.SIM_PAGES_PER_MINUTE,
+            speedup=config.SIM_SPEEDUP,
+            job_failure_rate=config.SIM_JOB_FAILURE_RATE,
+            submit_failure_rate=config.SIM_SUBMIT_FAILURE_RATE,
+            submit_latency_ms=config.SIM_SUBMIT_LATENCY_MS,
+            seed=config.SIM_SEED
+        )
+
+    if name == 'cups':
+        from backend.cups_service import CupsService
+        return CupsService(server=config.CUPS_SERVER, port=config.CUPS_PORT)
+
+    raise ValueError(f"未知的打印后端: {name}")
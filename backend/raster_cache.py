@@ -0,0 +1,204 @@
+"""
+打印栅格缓存
+
+复杂PDF每次打印都要经过 CUPS 过滤链重新栅格化，重复打印时开销很大。
+开启后按打印机分辨率把PDF逐页渲染为图片PDF，以文档内容哈希、打印机
+和打印机选项为键缓存；再次打印同一文档时直接提交缓存结果，CUPS 只需
+做简单的图片过滤
+
+首次打印仍提交原文件，渲染在后台进行，不增加打印延迟。配置了隔离进程池
+时渲染在工作进程中执行，与预览生成一样受内存和CPU时间限制
+"""
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from backend.metrics import cache_result, timed
+from backend.pdf_writer import StreamingPdfWriter
+from backend.singleflight import atomic_output
+
+logger = logging.getLogger(__name__)
+
+# 计算文件哈希的读块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class RasterCache:
+    def __init__(
+        self,
+        cache_folder: str,
+        dpi: int = 300,
+        printers: Iterable[str] = None,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        sandbox=None
+    ):
+        """
+        Args:
+            cache_folder: 缓存目录
+            dpi: 打印机未报告分辨率时使用的渲染分辨率
+            printers: 启用缓存的打印机，为空时对所有打印机启用
+            max_bytes: 缓存总大小上限，超出时删除最久未使用的文件
+            sandbox: 可选的隔离进程池（Sandbox，目标为 FileHandler），渲染在其中执行
+        """
+        self.cache_folder = cache_folder
+        self.dpi = dpi
+        self.printers = set(printers or [])
+        self.max_bytes = max_bytes
+        self.sandbox = sandbox
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='raster')
+        self._lock = threading.Lock()
+        self._pending = set()
+        # (路径, 修改时间, 大小) -> 内容哈希，避免重复读取同一文件
+        self._hashes: Dict[Tuple[str, float, int], str] = {}
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def enabled_for(self, printer_name: str, file_path: str) -> bool:
+        if not file_path.lower().endswith('.pdf'):
+            return False
+        return not self.printers or printer_name in self.printers
+
+    def get_print_file(self, file_path: str, printer_name: str, printer_options: dict) -> str:
+        """
+        返回实际提交打印的文件
+
+        缓存命中时返回栅格化结果；未命中时返回原文件，并在后台渲染
+        """
+        if not self.enabled_for(printer_name, file_path):
+            return file_path
+
+        try:
+            dpi = _resolution_dpi(printer_options) or self.dpi
+            key = self._cache_key(file_path, printer_name, printer_options, dpi)
+        except OSError as e:
+            logger.error("计算栅格缓存键失败: %s", e)
+            return file_path
+
+        cached_path = os.path.join(self.cache_folder, f"{key}.pdf")
+        hit = os.path.exists(cached_path)
+        cache_result('raster', hit)
+
+        if hit:
+            # 更新访问时间，淘汰时按最近使用排序
+            try:
+                os.utime(cached_path)
+            except OSError:
+                pass
+            logger.info("使用栅格缓存打印: %s -> %s", os.path.basename(file_path), cached_path)
+            return cached_path
+
+        with self._lock:
+            if key not in self._pending:
+                self._pending.add(key)
+                self._executor.submit(self._render, file_path, cached_path, dpi, key)
+        return file_path
+
+    def _cache_key(self, file_path: str, printer_name: str, printer_options: dict, dpi: int) -> str:
+        options = ';'.join(f"{name}={printer_options[name]}" for name in sorted(printer_options))
+        digest = hashlib.sha256()
+        digest.update(self._file_hash(file_path).encode('ascii'))
+        digest.update(f"|{printer_name}|{dpi}|{options}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _file_hash(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        cache_key = (file_path, stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._hashes.get(cache_key)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()
+
+        with self._lock:
+            if len(self._hashes) > 10000:
+                self._hashes.clear()
+            self._hashes[cache_key] = value
+        return value
+
+    def _render(self, file_path: str, cached_path: str, dpi: int, key: str):
+        try:
+            self.rasterize(file_path, cached_path, dpi)
+            self._trim()
+        except Exception as e:
+            logger.error("栅格化失败: %s: %s", file_path, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    @timed('rasterize')
+    def rasterize(self, file_path: str, output_path: str, dpi: int) -> str:
+        """渲染PDF为图片PDF，有隔离进程池时在工作进程中执行"""
+        if self.sandbox is not None:
+            return self.sandbox.run('rasterize_pdf', file_path, output_path, dpi)
+        return rasterize_pdf(file_path, output_path, dpi)
+
+    def _trim(self):
+        """缓存超出上限时按最近使用时间淘汰"""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_folder) as it:
+            for entry in it:
+                # 跳过正在写入的临时文件（以 . 开头）
+                if entry.is_file() and entry.name.endswith('.pdf') and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+            if total <= self.max_bytes:
+                break
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def rasterize_pdf(file_path: str, output_path: str, dpi: int) -> str:
+    """
+    逐页渲染PDF并写入图片PDF，内存中只保留当前页
+
+    页面尺寸与原文档一致
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    page_count = int(pdfinfo_from_path(file_path)['Pages'])
+
+    with atomic_output(output_path) as temp_path, open(temp_path, 'wb') as f:
+        writer = StreamingPdfWriter(f)
+        for page in range(1, page_count + 1):
+            image = convert_from_path(file_path, dpi=dpi, first_page=page, last_page=page)[0]
+            page_size = (image.width / dpi * 72, image.height / dpi * 72)
+            writer.add_image_page(image, page_size, encoding='jpeg', quality=92)
+            image.close()
+        writer.close()
+
+    logger.info("栅格化完成: %s, %s 页, %s dpi", os.path.basename(file_path), page_count, dpi)
+    return output_path
+
+
+def _resolution_dpi(printer_options: dict) -> Optional[int]:
+    """从 printer-resolution-default 取得分辨率（dpi）"""
+    resolution = printer_options.get('printer-resolution-default')
+    if not resolution:
+        return None
+    try:
+        x, y, units = resolution
+        # IPP 单位: 3 = 每英寸点数, 4 = 每厘米点数
+        dpi = max(int(x), int(y))
+        return int(dpi * 2.54) if int(units) == 4 else dpi
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,262 @@
+"""
+文件转换隔离进程池
+
+预览生成和PDF转换在独立的工作进程中执行，每个进程启动时设置
+RLIMIT_AS（内存）上限，每个任务开始前把 RLIMIT_CPU 设为已用CPU时间
+加上单任务上限，解压炸弹或畸形文档最多拖垮一个工作进程：
+超过挂钟超时的任务直接杀掉进程，进程因超限退出时自动补充新进程。
+每个工作进程是独立会话的进程组组长，结束时按进程组一起杀掉它创建的
+子进程（如 DOCX 渲染进程池），不会留下孤儿进程。
+每个进程处理 max_tasks 个任务后回收，防止内存泄漏累积
+
+工作进程由 forkserver 启动，避免在多线程的 Web 进程中 fork
+"""
+import os
+import math
+import queue
+import signal
+import atexit
+import logging
+import threading
+import multiprocessing
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxError(Exception):
+    """任务在隔离进程中失败（异常、超限退出或超时）"""
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+def _apply_limits(memory_mb: int, cpu_seconds: int):
+    try:
+        import resource
+        if memory_mb > 0:
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning("无法设置隔离进程资源限制: %s", e)
+
+
+def _reset_cpu_limit(cpu_seconds: int):
+    """
+    RLIMIT_CPU 按进程累计，每个任务开始前按已用CPU时间重新设置，
+    使上限作用于单个任务而不是进程回收前的所有任务
+    """
+    if cpu_seconds <= 0:
+        return
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # 软限制触发 SIGXCPU 结束进程；硬限制不能再调高，保持不限
+        soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_seconds
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.RLIM_INFINITY))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning("无法设置隔离进程CPU时间限制: %s", e)
+
+
+def _worker_main(conn, factory: Callable, factory_args: tuple, limits: tuple, log_level: int):
+    """工作进程入口：建立目标对象后循环执行 (方法名, 参数)"""
+    # 新建会话，之后创建的子进程都在以本进程为组长的进程组中
+    os.setsid()
+    logging.basicConfig(
+        level=log_level,
+        format=f'%(asctime)s - %(name)s - %(levelname)s - [sandbox {os.getpid()}] %(message)s'
+    )
+    _apply_limits(*limits)
+    target = factory(*factory_args)
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        method, args = task
+        _reset_cpu_limit(limits[1])
+        try:
+            conn.send(('ok', getattr(target, method)(*args)))
+        except MemoryError:
+            # 内存耗尽后进程状态不可靠，退出由主进程补充新进程
+            conn.send(('fatal', '内存超出限制'))
+            break
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class SandboxWorker:
+    """一个工作进程及其通信管道"""
+
+    def __init__(self, context, factory: Callable, factory_args: tuple, limits: tuple):
+        parent_conn, child_conn = context.Pipe()
+        self.conn = parent_conn
+        # 非守护进程：DOCX 转换会在工作进程中再创建渲染进程池
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, factory, factory_args, limits, logging.getLogger().getEffectiveLevel()),
+            daemon=False
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks_done = 0
+        self.broken = False
+
+    def call(self, method: str, args: tuple, timeout: float):
+        try:
+            self.conn.send((method, args))
+            if not self.conn.poll(timeout):
+                raise SandboxTimeout(f"超过 {timeout:.0f} 秒未完成")
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            self.broken = True
+            self.process.join(1)
+            raise SandboxError(f"工作进程已退出 (exitcode={self.process.exitcode})")
+        self.tasks_done += 1
+        if status == 'fatal':
+            self.broken = True
+        if status != 'ok':
+            raise SandboxError(value)
+        return value
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, timeout: float = 2):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        try:
+            # 连同渲染进程等子进程一起结束；工作进程尚未建立进程组或已全部退出时
+            # 没有这个进程组
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class Sandbox:
+    """
+    隔离进程池
+
+    Args:
+        factory: 在工作进程中创建目标对象的模块级函数（需可pickle）
+        factory_args: factory 的参数
+        size: 工作进程数
+        memory_mb: 每个进程的地址空间上限，0为不限
+        cpu_seconds: 每个任务的CPU时间上限，0为不限
+        timeout: 单个任务的挂钟超时（秒）
+        max_tasks: 每个进程处理多少个任务后回收
+    """
+
+    def __init__(
+        self,
+        factory: Callable,
+        factory_args: tuple = (),
+        size: int = 2,
+        memory_mb: int = 1024,
+        cpu_seconds: int = 120,
+        timeout: float = 120,
+        max_tasks: int = 100
+    ):
+        self.factory = factory
+        self.factory_args = factory_args
+        self.size = size
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.limits = (memory_mb, cpu_seconds)
+        self._context = multiprocessing.get_context('forkserver')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            # 在 multiprocessing 自己的退出处理（等待非守护子进程）之后注册，
+            # 保证先于它执行，否则解释器退出时会一直等待工作进程
+            atexit.register(self.shutdown)
+
+    def _spawn(self) -> SandboxWorker:
+        return SandboxWorker(self._context, self.factory, self.factory_args, self.limits)
+
+    def run(self, method: str, *args):
+        """
+        在工作进程中调用目标对象的 method(*args)
+
+        Raises:
+            SandboxError: 任务异常、进程超限退出或超时
+        """
+        if self._closed:
+            raise SandboxError('隔离进程池已关闭')
+        self._start()
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise SandboxTimeout('没有空闲的隔离进程')
+
+        try:
+            result = worker.call(method, args, self.timeout)
+        except SandboxTimeout:
+            logger.error("隔离进程任务超时，终止进程 %s: %s%r", worker.process.pid, method, args)
+            self._replace(worker)
+            raise
+        except SandboxError:
+            if worker.broken or not worker.alive():
+                logger.error("隔离进程 %s 异常退出 (exitcode=%s): %s%r",
+                             worker.process.pid, worker.process.exitcode, method, args)
+                self._replace(worker)
+            else:
+                self._idle.put(worker)
+            raise
+        except Exception:
+            self._replace(worker)
+            raise
+
+        if worker.tasks_done >= self.max_tasks:
+            logger.info("隔离进程已处理 %s 个任务，回收重启", worker.tasks_done)
+            self._replace(worker, graceful=True)
+        else:
+            self._idle.put(worker)
+        return result
+
+    def _replace(self, worker: SandboxWorker, graceful: bool = False):
+        if graceful:
+            worker.stop()
+        else:
+            worker.kill()
+        if self._closed:
+            return
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            logger.error("启动隔离进程失败: %s", e)
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                worker: Optional[SandboxWorker] = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
@@ -0,0 +1,319 @@
+"""
+模拟打印后端
+
+在进程内模拟打印机和作业队列，用于压力测试和没有打印机的开发环境。
+不使用后台线程：每台打印机按提交顺序排定作业的开始/结束时间，查询时
+根据当前时间计算状态，因此上千个作业也不会带来额外开销
+"""
+import os
+import re
+import time
+import random
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from backend.models import Printer
+from backend.print_backend import PrintBackend
+
+logger = logging.getLogger(__name__)
+
+# 非PDF文件按大小估算页数
+BYTES_PER_PAGE = 100 * 1024
+
+_PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?!s)')
+
+
+class _SimJob:
+    __slots__ = (
+        'job_id', 'printer', 'name', 'file_name', 'size', 'pages', 'submitted_at',
+        'remaining', 'start', 'end', 'first_start', 'fail', 'cancelled_at'
+    )
+
+    def __init__(self, job_id, printer, name, file_name, size, pages, duration, fail, now):
+        self.job_id = job_id
+        self.printer = printer
+        self.name = name
+        self.file_name = file_name
+        self.size = size
+        self.pages = pages
+        self.submitted_at = now
+        # 剩余打印耗时（秒），只在打印机暂停时用于重新排期
+        self.remaining = duration
+        self.start = None
+        self.end = None
+        self.first_start = None
+        self.fail = fail
+        self.cancelled_at = None
+
+
+class _SimPrinter:
+    def __init__(self, name: str):
+        self.name = name
+        self.stopped = False
+        # 未结束的作业，按提交顺序
+        self.queue: List[_SimJob] = []
+
+
+class SimulatedPrintBackend(PrintBackend):
+    def __init__(
+        self,
+        printer_names: List[str],
+        pages_per_minute: float = 20,
+        speedup: float = 1.0,
+        job_failure_rate: float = 0.0,
+        submit_failure_rate: float = 0.0,
+        submit_latency_ms: float = 0,
+        seed: int = None
+    ):
+        """
+        Args:
+            printer_names: 模拟的打印机名称
+            pages_per_minute: 打印速度
+            speedup: 时间加速倍数，压测时可以让作业更快结束
+            job_failure_rate: 作业打印失败(aborted)的概率
+            submit_failure_rate: 提交作业时直接报错的概率
+            submit_latency_ms: 提交作业的模拟延迟
+            seed: 随机种子，便于复现
+        """
+        self.pages_per_minute = pages_per_minute
+        self.speedup = speedup
+        self.job_failure_rate = job_failure_rate
+        self.submit_failure_rate = submit_failure_rate
+        self.submit_latency_ms = submit_latency_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._printers: Dict[str, _SimPrinter] = {name: _SimPrinter(name) for name in printer_names}
+        # 作业ID从1开始连续分配，_jobs[job_id - 1]
+        self._jobs: List[_SimJob] = []
+        logger.info("使用模拟打印后端: %s (%s 页/分钟)", ', '.join(printer_names), pages_per_minute)
+
+    def get_printers(self) -> List[Printer]:
+        with self._lock:
+            names = list(self._printers)
+        return [self._make_printer(name) for name in names]
+
+    def get_printer(self, printer_name: str) -> Optional[Printer]:
+        with self._lock:
+            if printer_name not in self._printers:
+                return None
+        return self._make_printer(printer_name)
+
+    def get_printer_status(self, printer_name: str) -> str:
+        with self._lock:
+            printer = self._printers.get(printer_name)
+            if printer is None:
+                return "error"
+            return self._printer_status(printer, time.time())
+
+    def print_file(
+        self,
+        printer_name: str,
+        file_path: str,
+        job_name: str = "Print Job",
+        copies: int = 1,
+        page_range: Optional[str] = None
+    ) -> int:
+        if self.submit_latency_ms:
+            time.sleep(self.submit_latency_ms / 1000)
+
+        pages = _count_pages(file_path, page_range) * max(1, copies)
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+        with self._lock:
+            printer = self._printers.get(printer_name)
+            if printer is None:
+                raise Exception(f"打印失败: 打印机不存在 {printer_name}")
+            if self._rng.random() < self.submit_failure_rate:
+                raise Exception("打印失败: 模拟提交失败")
+
+            now = time.time()
+            self._prune(printer, now)
+
+            job = _SimJob(
+                job_id=len(self._jobs) + 1,
+                printer=printer_name,
+                name=job_name,
+                file_name=os.path.basename(file_path),
+                size=size,
+                pages=pages,
+                duration=pages * 60 / self.pages_per_minute / self.speedup,
+                fail=self._rng.random() < self.job_failure_rate,
+                now=now
+            )
+            self._jobs.append(job)
+            printer.queue.append(job)
+            if not printer.stopped:
+                self._reschedule(printer, now)
+
+        logger.info("模拟打印作业已提交: 作业ID=%s, 打印机=%s, %s 页", job.job_id, printer_name, pages)
+        return job.job_id
+
+    def get_jobs(self, printer_name: str = None) -> List[dict]:
+        with self._lock:
+            now = time.time()
+            jobs = []
+            for printer in self._printers.values():
+                if printer_name and printer.name != printer_name:
+                    continue
+                self._prune(printer, now)
+                for job in printer.queue:
+                    jobs.append({
+                        'job_id': job.job_id,
+                        'name': job.name,
+                        'printer': job.printer,
+                        'state': self._job_state(job, printer, now),
+                        'user': 'simulated',
+                        'size': job.size
+                    })
+            return jobs
+
+    def get_job_updates(self, first_job_id: int) -> List[dict]:
+        with self._lock:
+            now = time.time()
+            updates = []
+            for job in self._jobs[max(0, first_job_id - 1):]:
+                printer = self._printers[job.printer]
+                state = self._job_state(job, printer, now)
+                processing = self._processing_time(job, now)
+                completed = None
+                if state == 7:
+                    completed = job.cancelled_at
+                elif state in (8, 9):
+                    completed = job.end
+                updates.append({
+                    'job_id': job.job_id,
+                    'state': state,
+                    'time_at_processing': int(processing) if processing else None,
+                    'time_at_completed': int(completed) if completed else None,
+                    'message': '模拟打印失败' if state == 8 else ''
+                })
+            return updates
+
+    def cancel_job(self, job_id: int) -> bool:
+        with self._lock:
+            if not 0 < job_id <= len(self._jobs):
+                return False
+
+            job = self._jobs[job_id - 1]
+            printer = self._printers[job.printer]
+            now = time.time()
+            if self._job_state(job, printer, now) in (7, 8, 9):
+                return False
+
+            job.first_start = self._processing_time(job, now)
+            job.cancelled_at = now
+            printer.queue.remove(job)
+            if not printer.stopped:
+                self._reschedule(printer, now)
+
+        logger.info("已取消模拟作业: %s", job_id)
+        return True
+
+    def set_printer_stopped(self, printer_name: str, stopped: bool):
+        """暂停/恢复模拟打印机（故障注入）"""
+        with self._lock:
+            printer = self._printers[printer_name]
+            if printer.stopped == stopped:
+                return
+
+            now = time.time()
+            self._prune(printer, now)
+            if stopped:
+                # 冻结排期，记录正在打印的作业剩余耗时
+                for job in printer.queue:
+                    job.first_start = self._processing_time(job, now)
+                    if job.start is not None and job.start <= now:
+                        job.remaining = job.end - now
+                    job.start = job.end = None
+                printer.stopped = True
+            else:
+                printer.stopped = False
+                self._reschedule(printer, now)
+
+    def _make_printer(self, name: str) -> Printer:
+        state_map = {'idle': 3, 'processing': 4, 'stopped': 5}
+        return Printer(
+            name=name,
+            uri=f"simulated://{name}",
+            state=state_map[self.get_printer_status(name)],
+            info='模拟打印机'
+        )
+
+    def _printer_status(self, printer: _SimPrinter, now: float) -> str:
+        if printer.stopped:
+            return "stopped"
+        self._prune(printer, now)
+        if printer.queue and printer.queue[0].start <= now:
+            return "processing"
+        return "idle"
+
+    def _reschedule(self, printer: _SimPrinter, now: float):
+        """从当前时间起依次排定未开始作业的开始/结束时间"""
+        t = now
+        for job in printer.queue:
+            if job.start is not None and job.start <= now:
+                t = max(t, job.end)
+                continue
+            job.start = t
+            job.end = t + job.remaining
+            t = job.end
+
+    def _prune(self, printer: _SimPrinter, now: float):
+        """移除已经打印结束的作业"""
+        queue = printer.queue
+        index = 0
+        while index < len(queue) and queue[index].end is not None and queue[index].end <= now:
+            index += 1
+        if index:
+            del queue[:index]
+
+    def _processing_time(self, job: _SimJob, now: float) -> Optional[float]:
+        if job.first_start is not None:
+            return job.first_start
+        if job.start is not None and job.start <= now:
+            return job.start
+        return None
+
+    def _job_state(self, job: _SimJob, printer: _SimPrinter, now: float) -> int:
+        """按当前时间计算 IPP job-state"""
+        if job.cancelled_at is not None:
+            return 7
+        if job.end is not None and job.end <= now:
+            return 8 if job.fail else 9
+        if printer.stopped:
+            return 6 if job.first_start is not None else 3
+        if job.start is not None and job.start <= now:
+            return 5
+        return 3
+
+
+def _count_pages(file_path: str, page_range: Optional[str] = None) -> int:
+    """估算作业页数：PDF统计页对象，其他文件按大小估算"""
+    try:
+        if file_path.lower().endswith('.pdf'):
+            with open(file_path, 'rb') as f:
+                total = len(_PDF_PAGE_RE.findall(f.read()))
+        else:
+            total = os.path.getsize(file_path) // BYTES_PER_PAGE + 1
+    except OSError:
+        total = 1
+    total = max(1, total)
+
+    if not page_range:
+        return total
+
+    selected = set()
+    for part in page_range.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                first, last = part.split('-', 1)
+                selected.update(range(int(first), min(int(last), total) + 1))
+            else:
+                selected.add(int(part))
+        except ValueError:
+            continue
+    return max(1, len([p for p in selected if 1 <= p <= total]))
@@ -0,0 +1,84 @@
+"""
+派生文件的并发去重
+
+同一个键（源文件 + 选项）同时只执行一次计算，其余请求等待并共享结果；
+输出先写入同目录的临时文件，完成后 os.replace 原子替换，读者不会看到
+写了一半的文件
+"""
+import os
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        执行 func，同一键已有进行中的调用时等待其结果
+
+        func 抛出的异常同样传给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
+
+
+def temp_path_for(path: str) -> str:
+    """与目标同目录、同扩展名的隐藏临时文件路径"""
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{uuid.uuid4().hex[:8]}.tmp{ext}")
+
+
+@contextmanager
+def atomic_output(path: str):
+    """
+    产出临时文件路径，代码块正常结束后原子替换为 path
+
+    出错时删除临时文件，目标文件保持原样
+    """
+    temp_path = temp_path_for(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
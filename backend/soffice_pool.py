@@ -0,0 +1,245 @@
+"""
+LibreOffice 无头转换进程池
+
+预先启动若干 soffice --headless 进程（各自使用独立的用户配置目录），
+通过本地 UNO socket 分派转换请求，避免每个文档都付出数秒的启动开销，
+多个转换可以在不同进程中并行。单次转换超时会杀掉对应进程并重启；
+每个进程处理 max_jobs 个文档后回收重启，防止内存泄漏累积
+
+需要 soffice 可执行文件和 python3-uno（Dockerfile 构建参数
+INSTALL_LIBREOFFICE=true）；不可用时 available() 返回 False，
+调用方退回内置转换
+"""
+import os
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 扩展名 -> PDF导出过滤器
+PDF_FILTERS = {
+    'doc': 'writer_pdf_Export',
+    'docx': 'writer_pdf_Export',
+    'odt': 'writer_pdf_Export',
+    'rtf': 'writer_pdf_Export',
+    'xls': 'calc_pdf_Export',
+    'xlsx': 'calc_pdf_Export',
+    'ods': 'calc_pdf_Export',
+    'csv': 'calc_pdf_Export',
+    'ppt': 'impress_pdf_Export',
+    'pptx': 'impress_pdf_Export',
+    'odp': 'impress_pdf_Export'
+}
+
+
+def _property(name, value):
+    from com.sun.star.beans import PropertyValue
+
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class SofficeWorker:
+    """一个 soffice 进程及其 UNO 连接"""
+
+    def __init__(self, binary: str, port: int, startup_timeout: float):
+        self.binary = binary
+        self.port = port
+        self.startup_timeout = startup_timeout
+        self.profile_dir = tempfile.mkdtemp(prefix=f'soffice_{port}_')
+        self.process = None
+        self.desktop = None
+        self.jobs_done = 0
+
+    def start(self):
+        """启动进程并等待 UNO 连接可用"""
+        import uno
+
+        self.process = subprocess.Popen(
+            [
+                self.binary,
+                '--headless', '--invisible', '--nologo', '--nodefault',
+                '--norestore', '--nolockcheck',
+                f'-env:UserInstallation={uno.systemPathToFileUrl(self.profile_dir)}',
+                f'--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        self.jobs_done = 0
+        self.desktop = self._connect()
+        logger.info("soffice 进程已就绪: 端口 %s, pid %s", self.port, self.process.pid)
+
+    def _connect(self):
+        import uno
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                ctx = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+                )
+                return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"soffice 启动失败: 端口 {self.port}")
+                time.sleep(0.25)
+
+    def convert(self, file_path: str, output_path: str, pdf_filter: str):
+        """在本进程中转换一个文档"""
+        import uno
+
+        doc = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(file_path)),
+            "_blank", 0,
+            (_property("Hidden", True), _property("ReadOnly", True))
+        )
+        if doc is None:
+            raise RuntimeError("soffice 无法打开文档")
+        try:
+            doc.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(output_path)),
+                (_property("FilterName", pdf_filter),)
+            )
+        finally:
+            doc.close(True)
+        self.jobs_done += 1
+
+    def stop(self):
+        """结束进程（保留配置目录，重启时仍然是热的）"""
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.desktop = None
+
+    def destroy(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class SofficePool:
+    def __init__(
+        self,
+        size: int = 2,
+        binary: str = 'soffice',
+        base_port: int = 2002,
+        max_jobs: int = 50,
+        timeout: float = 120,
+        startup_timeout: float = 30
+    ):
+        self.size = size
+        self.binary = binary
+        self.base_port = base_port
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self._idle = queue.Queue()
+        self._workers = []
+        self._started = False
+
+    @staticmethod
+    def available(binary: str = 'soffice') -> bool:
+        """soffice 和 python3-uno 是否都可用"""
+        if not shutil.which(binary):
+            return False
+        try:
+            import uno  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def start(self):
+        """后台启动全部进程，已就绪的进程立即可用"""
+        if self._started:
+            return
+        self._started = True
+
+        for i in range(self.size):
+            worker = SofficeWorker(self.binary, self.base_port + i, self.startup_timeout)
+            self._workers.append(worker)
+            threading.Thread(target=self._start_worker, args=(worker,), daemon=True).start()
+
+    def _start_worker(self, worker: SofficeWorker):
+        try:
+            worker.start()
+            self._idle.put(worker)
+        except Exception as e:
+            logger.error("soffice 进程启动失败: %s", e)
+            worker.stop()
+            # 稍后重试，避免持续失败时占满CPU
+            timer = threading.Timer(10, self._start_worker, args=(worker,))
+            timer.daemon = True
+            timer.start()
+
+    def supports(self, extension: str) -> bool:
+        return extension.lower() in PDF_FILTERS
+
+    def convert(self, file_path: str, output_path: str) -> Optional[str]:
+        """
+        转换为PDF
+
+        Returns:
+            output_path；没有空闲进程、超时或转换失败时返回None
+        """
+        extension = file_path.rsplit('.', 1)[-1].lower()
+        pdf_filter = PDF_FILTERS.get(extension)
+        if pdf_filter is None:
+            return None
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            logger.warning("soffice 进程池无空闲进程")
+            return None
+
+        result = {}
+
+        def run():
+            try:
+                worker.convert(file_path, output_path, pdf_filter)
+                result['ok'] = True
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+
+        if thread.is_alive():
+            logger.error("soffice 转换超时(%ss): %s", self.timeout, file_path)
+            self._recycle(worker)
+            return None
+
+        if 'error' in result:
+            logger.error("soffice 转换失败: %s", result['error'])
+            self._recycle(worker)
+            return None
+
+        if worker.jobs_done >= self.max_jobs:
+            logger.info("soffice 进程已处理 %s 个文档，回收重启", worker.jobs_done)
+            self._recycle(worker)
+        else:
+            self._idle.put(worker)
+
+        return output_path
+
+    def _recycle(self, worker: SofficeWorker):
+        """杀掉进程并在后台重启"""
+        worker.stop()
+        threading.Thread(target=self._start_worker, args=(worker,), daemon=True).start()
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.destroy()
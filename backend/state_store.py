@@ -0,0 +1,313 @@
+"""
+多实例共享状态（SQLite）
+
+STATE_BACKEND=sqlite 时，多个服务实例通过共享卷上的同一个 SQLite 数据库
+（WAL 模式）共享打印任务和文件索引：
+
+- jobs / files 表保存任务和文件条目，写入时在 changes 表追加一条变更，
+  各实例按序号增量拉取其他实例的修改，合并到自己的内存索引
+- leases 表实现带过期时间的租约，只有持有 leader 租约的实例提交任务到
+  CUPS、同步CUPS状态和执行后台清理
+- 任务领取使用单条 UPDATE ... WHERE status='pending'，同一任务只会被
+  一个实例领取；之后的状态变化都以原状态为条件写入，已被取消的任务
+  不会被其他实例改回打印中
+
+WAL 依赖共享内存，数据库需位于同一台主机的卷上（多个容器挂载同一卷
+即可），不能放在 NFS 等网络文件系统上
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    origin TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    """
+    Args:
+        path: 数据库文件路径
+        instance_id: 本实例标识，用于变更来源和租约持有者
+        busy_timeout: 等待其他实例写锁的秒数
+    """
+
+    def __init__(self, path: str, instance_id: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.instance_id = instance_id
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接，自动提交模式，事务显式开始"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        # 立即取得写锁，避免读后升级写锁时与其他实例死锁
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _record_change(self, conn, kind: str, keys: Iterable[str]):
+        conn.executemany(
+            'INSERT INTO changes (kind, key, origin) VALUES (?, ?, ?)',
+            [(kind, key, self.instance_id) for key in keys]
+        )
+
+    # 打印任务
+
+    def put_job(self, record: dict):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (job_id, status, created_at, data) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (job_id) DO UPDATE SET status = excluded.status, data = excluded.data',
+                (record['job_id'], record['status'], record['created_at'], json.dumps(record))
+            )
+            self._record_change(conn, 'job', [record['job_id']])
+
+    def update_job(self, record: dict, expected_status: str) -> bool:
+        """
+        比较并交换：存储中的状态仍为 expected_status 时才写入
+
+        其他实例已改变状态（如用户在另一实例取消了任务）时返回 False，不覆盖
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, data = ? WHERE job_id = ? AND status = ?',
+                (record['status'], json.dumps(record), record['job_id'], expected_status)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._record_change(conn, 'job', [record['job_id']])
+        return True
+
+    def delete_jobs(self, job_ids: List[str]):
+        if not job_ids:
+            return
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM jobs WHERE job_id = ?', [(job_id,) for job_id in job_ids])
+            self._record_change(conn, 'job', job_ids)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = self._conn().execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def load_jobs(self) -> List[dict]:
+        rows = self._conn().execute('SELECT data FROM jobs ORDER BY created_at').fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def claim_pending_jobs(self, limit: int) -> List[dict]:
+        """领取最早的待提交任务，状态改为 processing"""
+        now = time.time()
+        claimed = []
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT data FROM jobs WHERE status = 'pending' ORDER BY created_at LIMIT ?",
+                (limit,)
+            ).fetchall()
+            for row in rows:
+                record = json.loads(row['data'])
+                record['status'] = 'processing'
+                conn.execute(
+                    "UPDATE jobs SET status = 'processing', claimed_by = ?, claimed_at = ?, data = ? "
+                    "WHERE job_id = ? AND status = 'pending'",
+                    (self.instance_id, now, json.dumps(record), record['job_id'])
+                )
+                claimed.append(record)
+            self._record_change(conn, 'job', [record['job_id'] for record in claimed])
+        return claimed
+
+    def stale_claims(self, older_than: float) -> List[dict]:
+        """已领取但迟迟没有提交到CUPS的任务（领取的实例可能已退出）"""
+        rows = self._conn().execute(
+            "SELECT data FROM jobs WHERE status = 'processing' AND claimed_at < ?",
+            (time.time() - older_than,)
+        ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    # 文件索引
+
+    def put_files(self, records: List[dict]):
+        if not records:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO files (filename, data) VALUES (?, ?) '
+                'ON CONFLICT (filename) DO UPDATE SET data = excluded.data',
+                [(record['filename'], json.dumps(record)) for record in records]
+            )
+            self._record_change(conn, 'file', [record['filename'] for record in records])
+
+    def delete_files(self, filenames: List[str]):
+        if not filenames:
+            return
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM files WHERE filename = ?', [(name,) for name in filenames])
+            self._record_change(conn, 'file', filenames)
+
+    def touch_file(self, filename: str):
+        """只记录变更（如预览已生成），让其他实例刷新该条目"""
+        with self._transaction() as conn:
+            self._record_change(conn, 'file', [filename])
+
+    def get_file(self, filename: str) -> Optional[dict]:
+        row = self._conn().execute('SELECT data FROM files WHERE filename = ?', (filename,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def load_files(self) -> List[dict]:
+        rows = self._conn().execute('SELECT data FROM files').fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    # 变更
+
+    def last_seq(self) -> int:
+        row = self._conn().execute('SELECT MAX(seq) FROM changes').fetchone()
+        return row[0] or 0
+
+    def changes_since(self, kind: str, seq: int) -> Optional[Tuple[int, List[str]]]:
+        """
+        序号之后其他实例修改过的键
+
+        Returns:
+            (最新序号, 键列表)；之后的变更已被清理时返回 None，调用方需完整重新加载
+        """
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            first, last = conn.execute('SELECT MIN(seq), MAX(seq) FROM changes').fetchone()
+            if first is not None and seq < first - 1:
+                return None
+            rows = conn.execute(
+                'SELECT DISTINCT key FROM changes WHERE kind = ? AND seq > ? AND origin != ?',
+                (kind, seq, self.instance_id)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return last or seq, [row['key'] for row in rows]
+
+    def changed_keys(self, kind: str, seq: int) -> Optional[List[str]]:
+        """
+        序号之后修改过的键（包括本实例的修改），用于列表接口的增量同步
+
+        Returns:
+            键列表；之后的变更已被清理时返回 None
+        """
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            first = conn.execute('SELECT MIN(seq) FROM changes').fetchone()[0]
+            if first is not None and seq < first - 1:
+                return None
+            rows = conn.execute(
+                'SELECT DISTINCT key FROM changes WHERE kind = ? AND seq > ?', (kind, seq)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return [row['key'] for row in rows]
+
+    def trim_changes(self, keep: int):
+        """只保留最近 keep 条变更"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?', (keep,))
+
+    # 租约
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """取得或续期租约；租约被其他实例持有且未过期时返回 False"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at '
+                'WHERE leases.holder = excluded.holder OR leases.expires_at < ?',
+                (name, self.instance_id, now + ttl, now)
+            )
+            return cursor.rowcount > 0
+
+    def release_lease(self, name: str):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, self.instance_id))
+
+
+class Lease:
+    """
+    带本地缓存的租约：续期间隔为 ttl 的三分之一，期间直接返回上次结果
+
+    持有者退出或失联超过 ttl 后，其他实例可以接管
+    """
+
+    def __init__(self, store: StateStore, name: str, ttl: float = 15):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self._held = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def held(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.ttl / 3:
+                return self._held
+            try:
+                held = self.store.acquire_lease(self.name, self.ttl)
+            except sqlite3.Error as e:
+                logger.error("续期租约 %s 失败: %s", self.name, e)
+                held = False
+            if held != self._held:
+                logger.info("%s 租约 %s", '取得' if held else '失去', self.name)
+            self._held = held
+            self._checked_at = now
+            return held
+
+    def release(self):
+        with self._lock:
+            if self._held:
+                try:
+                    self.store.release_lease(self.name)
+                except sqlite3.Error as e:
+                    logger.error("释放租约 %s 失败: %s", self.name, e)
+            self._held = False
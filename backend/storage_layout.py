@@ -0,0 +1,188 @@
+"""
+上传目录的分片布局
+
+文件按名称（不含扩展名）的哈希前缀分散到两级子目录:
+
+    UPLOAD_FOLDER/ab/cd/<uuid>_report.docx
+    UPLOAD_FOLDER/ab/cd/<uuid>_report.pdf        转换生成的PDF与原文件同目录
+    UPLOAD_FOLDER/previews/ab/cd/<uuid>_report.png
+
+单个目录的文件数保持在较小规模，数十万文件时目录操作仍然很快。
+旧版本平铺在根目录的文件仍然可以访问，可用迁移命令移动到分片目录:
+
+    python -m backend.storage_layout migrate [--dry-run]
+"""
+import os
+import sys
+import hashlib
+import logging
+import argparse
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIRNAME = 'previews'
+
+
+class StorageLayout:
+    def __init__(
+        self,
+        root: str,
+        preview_root: str = None,
+        sharded: bool = True,
+        depth: int = 2,
+        width: int = 2
+    ):
+        """
+        Args:
+            root: 上传目录
+            preview_root: 预览目录，默认为上传目录下的 previews
+            sharded: False 时使用旧的平铺布局
+            depth: 分片目录层数
+            width: 每层目录名的十六进制字符数
+        """
+        self.root = root
+        self.preview_root = preview_root or os.path.join(root, PREVIEW_DIRNAME)
+        self.sharded = sharded
+        self.depth = depth
+        self.width = width
+
+    def shard(self, name: str) -> str:
+        """文件对应的分片相对路径；原文件、转换PDF和预览按主文件名取同一分片"""
+        if not self.sharded:
+            return ''
+        stem = os.path.splitext(os.path.basename(name))[0]
+        digest = hashlib.sha1(stem.encode('utf-8')).hexdigest()
+        return os.path.join(*(digest[i * self.width:(i + 1) * self.width] for i in range(self.depth)))
+
+    def upload_dir(self, filename: str) -> str:
+        return os.path.join(self.root, self.shard(filename))
+
+    def upload_path(self, filename: str, create: bool = False) -> str:
+        """新文件的存放路径"""
+        directory = self.upload_dir(filename)
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def preview_path(self, preview_name: str, create: bool = False) -> str:
+        directory = os.path.join(self.preview_root, self.shard(preview_name))
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{preview_name}.png")
+
+    def resolve_upload(self, filename: str) -> Optional[str]:
+        """已有文件的路径（兼容平铺布局），不存在时返回None"""
+        if not _is_plain_name(filename):
+            return None
+        for path in (self.upload_path(filename), os.path.join(self.root, filename)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def resolve_preview(self, preview_name: str) -> Optional[str]:
+        if not _is_plain_name(preview_name):
+            return None
+        for path in (self.preview_path(preview_name), os.path.join(self.preview_root, f"{preview_name}.png")):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def upload_dirs(self) -> Iterator[str]:
+        """存放上传文件的全部目录（根目录和已存在的分片目录）"""
+        yield self.root
+        if self.sharded:
+            yield from self._shard_dirs(self.root)
+
+    def preview_dirs(self) -> Iterator[str]:
+        yield self.preview_root
+        if self.sharded:
+            yield from self._shard_dirs(self.preview_root)
+
+    def iter_uploads(self) -> Iterator[os.DirEntry]:
+        """逐个产出上传目录中的文件（跳过隐藏文件和临时文件）"""
+        for directory in self.upload_dirs():
+            yield from _iter_files(directory)
+
+    def iter_previews(self) -> Iterator[os.DirEntry]:
+        for directory in self.preview_dirs():
+            yield from _iter_files(directory)
+
+    def _shard_dirs(self, base: str, level: int = 0) -> Iterator[str]:
+        try:
+            with os.scandir(base) as it:
+                names = sorted(
+                    entry.name for entry in it
+                    if entry.is_dir() and len(entry.name) == self.width and _is_hex(entry.name)
+                )
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(base, name)
+            if level + 1 == self.depth:
+                yield path
+            else:
+                yield from self._shard_dirs(path, level + 1)
+
+    def migrate(self, dry_run: bool = False) -> int:
+        """把平铺在根目录的上传文件和预览移动到分片目录，返回移动的文件数"""
+        if not self.sharded:
+            return 0
+
+        moves = []
+        for entry in _iter_files(self.root):
+            moves.append((entry.path, self.upload_path(entry.name)))
+        for entry in _iter_files(self.preview_root):
+            if entry.name.endswith('.png'):
+                moves.append((entry.path, self.preview_path(entry.name[:-len('.png')])))
+
+        moved = 0
+        for source, target in moves:
+            if os.path.exists(target):
+                logger.warning("目标已存在，跳过: %s", target)
+                continue
+            if dry_run:
+                print(f"{source} -> {target}")
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(source, target)
+            moved += 1
+        return moved
+
+
+def _is_plain_name(name: str) -> bool:
+    return bool(name) and os.path.basename(name) == name and not name.startswith('.')
+
+
+def _is_hex(name: str) -> bool:
+    return all(c in '0123456789abcdef' for c in name)
+
+
+def _iter_files(directory: str) -> Iterator[os.DirEntry]:
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.name.startswith('.') and entry.is_file():
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+def main(argv: List[str] = None) -> int:
+    from backend.config import UPLOAD_FOLDER
+
+    parser = argparse.ArgumentParser(description='上传目录分片布局工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='把平铺目录迁移到分片布局')
+    migrate_parser.add_argument('--root', default=UPLOAD_FOLDER, help='上传目录')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='只打印将要移动的文件')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    moved = StorageLayout(args.root).migrate(dry_run=args.dry_run)
+    print(f"{'将移动' if args.dry_run else '已移动'} {moved} 个文件")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+请求级跟踪
+
+每个请求一个 Trace，处理阶段通过 span() 记录耗时；超过慢请求阈值时
+把各阶段耗时（以及可选的采样 profile）写入日志，并保留最近的慢请求
+供 /api/debug/traces 查询
+"""
+import io
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+from backend.config import (
+    TRACING_ENABLED, TRACE_SLOW_THRESHOLD_MS, TRACE_PROFILE_SAMPLE_RATE,
+    TRACE_PROFILER, TRACE_RECENT_LIMIT
+)
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+
+_recent_slow = deque(maxlen=TRACE_RECENT_LIMIT)
+_recent_lock = threading.Lock()
+
+# 同一时间只能有一个 profiler 工作（Python 3.12 起 cProfile 基于
+# sys.monitoring，第二个会抛 ValueError），已有请求在 profile 时跳过采样
+_profiler_lock = threading.Lock()
+
+
+class Trace:
+    """一次请求的跟踪记录"""
+
+    def __init__(self, trace_id: str, method: str, path: str):
+        self.trace_id = trace_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now()
+        self.duration_ms = None
+        self.status_code = None
+        self.spans = []
+        self.profile = None
+        self._start = time.perf_counter()
+        self._depth = 0
+        self._profiler = None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def breakdown(self) -> str:
+        """各阶段耗时的可读文本"""
+        lines = [f"{self.method} {self.path} {self.status_code} 耗时 {self.duration_ms:.1f}ms [{self.trace_id}]"]
+        for span in self.spans:
+            indent = '  ' * (span['depth'] + 1)
+            lines.append(f"{indent}{span['name']}: {span['duration_ms']:.1f}ms (+{span['offset_ms']:.1f}ms)")
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'method': self.method,
+            'path': self.path,
+            'status_code': self.status_code,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration_ms, 2) if self.duration_ms is not None else None,
+            'spans': self.spans,
+            'profile': self.profile
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    """当前请求的 Trace（不在请求中时为None）"""
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name: str):
+    """记录一个处理阶段；当前没有 Trace 时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    offset_ms = trace.elapsed_ms()
+    depth = trace._depth
+    trace._depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace._depth = depth
+        trace.spans.append({
+            'name': name,
+            'offset_ms': round(offset_ms, 2),
+            'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+            'depth': depth
+        })
+
+
+def start_trace(method: str, path: str, trace_id: str = None) -> Optional[Trace]:
+    """开始一个请求跟踪，按采样率决定是否同时做 profile"""
+    if not TRACING_ENABLED:
+        return None
+
+    trace = Trace(trace_id or uuid.uuid4().hex[:16], method, path)
+    if (
+        TRACE_PROFILE_SAMPLE_RATE > 0
+        and random.random() < TRACE_PROFILE_SAMPLE_RATE
+        and _profiler_lock.acquire(blocking=False)
+    ):
+        try:
+            trace._profiler = _start_profiler()
+        except Exception as e:
+            logger.warning("启动profile失败: %s", e)
+        if trace._profiler is None:
+            _profiler_lock.release()
+
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(status_code: int = None):
+    """结束当前请求跟踪，慢请求写入日志并保留"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    _current_trace.set(None)
+
+    trace.duration_ms = trace.elapsed_ms()
+    trace.status_code = status_code
+    # span 在结束时追加，按开始时间重新排序便于阅读
+    trace.spans.sort(key=lambda s: s['offset_ms'])
+
+    slow = trace.duration_ms >= TRACE_SLOW_THRESHOLD_MS
+    profile_text = None
+    if trace._profiler is not None:
+        try:
+            profile_text = _stop_profiler(trace._profiler, report=slow)
+        finally:
+            trace._profiler = None
+            _profiler_lock.release()
+
+    if not slow:
+        return
+
+    trace.profile = profile_text
+    message = f"慢请求:\n{trace.breakdown()}"
+    if profile_text:
+        message += f"\n{profile_text}"
+    logger.warning(message)
+
+    with _recent_lock:
+        _recent_slow.append(trace)
+
+
+def recent_slow_traces() -> List[dict]:
+    """最近的慢请求（新的在前）"""
+    with _recent_lock:
+        traces = list(_recent_slow)
+    return [trace.to_dict() for trace in reversed(traces)]
+
+
+def _start_profiler():
+    """启动采样 profile（优先 pyinstrument，不可用时退回 cProfile）"""
+    if TRACE_PROFILER == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        except ImportError:
+            logger.warning("pyinstrument未安装，使用cProfile")
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, report: bool = True) -> Optional[str]:
+    """停止 profile，report 为真时返回文本报告"""
+    try:
+        import cProfile
+        if isinstance(profiler, cProfile.Profile):
+            import pstats
+            profiler.disable()
+            if not report:
+                return None
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(25)
+            return output.getvalue()
+
+        profiler.stop()
+        if not report:
+            return None
+        return profiler.output_text(unicode=True, color=False)
+    except Exception as e:
+        logger.error("生成profile报告失败: %s", e)
+        return None
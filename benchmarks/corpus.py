@@ -0,0 +1,153 @@
+"""
+基准测试语料生成
+
+用固定随机种子生成各类测试文件，同一参数下内容完全一致，保证不同
+版本之间的测试结果可比较
+"""
+import os
+import random
+from typing import Dict
+
+# 用于正文的拉丁文词表
+WORDS = (
+    "print queue server document page paper toner driver spool job report "
+    "invoice contract student class schedule meeting summary figure table "
+    "chapter section appendix reference budget quarter annual review draft"
+).split()
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return ' '.join(_sentence(rng, rng.randint(8, 16)) for _ in range(sentences))
+
+
+def _cjk_line(rng: random.Random, length: int = 40) -> str:
+    return ''.join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(length))
+
+
+def make_pdf(path: str, pages: int, seed: int = 1):
+    """多页文字PDF"""
+    from weasyprint import HTML
+
+    rng = random.Random(seed)
+    parts = ["<html><head><meta charset='utf-8'></head><body>"]
+    for page in range(pages):
+        parts.append(f"<h2>Page {page + 1}</h2>")
+        for _ in range(6):
+            parts.append(f"<p>{_paragraph(rng)}</p>")
+        parts.append("<div style='page-break-after: always'></div>")
+    parts.append("</body></html>")
+    HTML(string=''.join(parts)).write_pdf(path)
+
+
+def make_docx(path: str, paragraphs: int, seed: int = 2):
+    """长DOCX（标题、正文、表格交替）"""
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    for i in range(paragraphs):
+        if i % 25 == 0:
+            doc.add_heading(f"Section {i // 25 + 1}", level=1)
+        doc.add_paragraph(_paragraph(rng))
+        if i % 50 == 49:
+            table = doc.add_table(rows=6, cols=4)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = rng.choice(WORDS)
+    doc.save(path)
+
+
+def make_xlsx(path: str, rows: int, cols: int = 12, seed: int = 3):
+    """大XLSX（write_only 模式写入，生成时不占大量内存）"""
+    import openpyxl
+
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Data')
+    ws.append([f"Column {c + 1}" for c in range(cols)])
+    for _ in range(rows):
+        ws.append([
+            rng.randint(0, 100000) if c % 3 else rng.choice(WORDS)
+            for c in range(cols)
+        ])
+    wb.save(path)
+
+
+def make_pptx(path: str, slides: int, seed: int = 4):
+    """PPTX演示文稿"""
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    rng = random.Random(seed)
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for i in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {i + 1}: {_sentence(rng, 4)}"
+        body = slide.placeholders[1].text_frame
+        body.text = _sentence(rng)
+        for _ in range(4):
+            body.add_paragraph().text = _sentence(rng)
+        slide.shapes.add_textbox(Inches(1), Inches(6), Inches(8), Inches(1)).text = _sentence(rng, 6)
+    prs.save(path)
+
+
+def make_image(path: str, width: int, height: int, seed: int = 5):
+    """大尺寸图片（随机色块，JPEG压缩后仍有一定体积）"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    for _ in range(400):
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        w, h = rng.randint(20, width // 4), rng.randint(20, height // 4)
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+        draw.rectangle((x, y, x + w, y + h), fill=color)
+    img.save(path, quality=90)
+
+
+def make_cjk_text(path: str, lines: int, seed: int = 6):
+    """中文文本"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(lines):
+            f.write(_cjk_line(rng, rng.randint(20, 60)) + '\n')
+
+
+def build_corpus(folder: str, scale: float = 1.0) -> Dict[str, str]:
+    """
+    生成整套语料，已存在的文件直接复用
+
+    Args:
+        folder: 输出目录
+        scale: 规模系数，1.0 为标准规模，CI 可用 0.1
+
+    Returns:
+        语料名 -> 文件路径
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    def n(value: int) -> int:
+        return max(1, int(value * scale))
+
+    specs = {
+        'pdf': (f"multipage_{n(50)}p.pdf", lambda p: make_pdf(p, n(50))),
+        'docx': (f"long_{n(1500)}para.docx", lambda p: make_docx(p, n(1500))),
+        'xlsx': (f"large_{n(20000)}rows.xlsx", lambda p: make_xlsx(p, n(20000))),
+        'pptx': (f"deck_{n(60)}slides.pptx", lambda p: make_pptx(p, n(60))),
+        'image': (f"photo_{n(6000)}px.jpg", lambda p: make_image(p, n(6000), n(4000))),
+        'cjk': (f"cjk_{n(5000)}lines.txt", lambda p: make_cjk_text(p, n(5000)))
+    }
+
+    corpus = {}
+    for name, (filename, builder) in specs.items():
+        path = os.path.join(folder, filename)
+        if not os.path.exists(path):
+            builder(path)
+        corpus[name] = path
+    return corpus
@@ -0,0 +1,261 @@
+"""
+基准测试入口
+
+    python -m benchmarks.run                       # 全部场景
+    python -m benchmarks.run -s upload -k pdf docx # 指定阶段/语料
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+
+每个场景在独立的子进程（spawn）中运行，峰值内存互不影响；峰值内存
+包括场景进程和它的子进程（隔离进程池等）。打印路径
+使用模拟打印后端（PRINT_BACKEND=simulated），不需要 cupsd 和打印机。与基线相比 p95 延迟、吞吐量
+或峰值内存变差超过 --tolerance 时返回非零退出码
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ('upload', 'preview', 'convert', 'print')
+KINDS = ('pdf', 'docx', 'xlsx', 'pptx', 'image', 'cjk')
+
+# 不需要转换的语料
+NO_CONVERT = {'pdf'}
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """最近秩百分位"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def _scenario_worker(stage: str, kind: str, source: str, iterations: int, warmup: int,
+                     concurrency: int, result_queue):
+    """子进程: 运行单个场景并回传结果"""
+    workdir = tempfile.mkdtemp(prefix=f'bench_{stage}_{kind}_')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['LOG_FILE'] = os.path.join(workdir, 'app.log')
+    os.environ['PRINT_BACKEND'] = 'simulated'
+    os.environ.setdefault('SIM_SPEEDUP', '1000')
+    sys.path.insert(0, ROOT)
+
+    import logging
+    import resource
+
+    from backend import app as app_module
+    from backend.config import PREVIEW_WIDTH, PREVIEW_HEIGHT, SIM_PRINTERS
+
+    logging.disable(logging.INFO)
+
+    flask_app = app_module.app
+    handler = app_module.file_handler
+    basename = os.path.basename(source)
+
+    def upload(client) -> dict:
+        with open(source, 'rb') as f:
+            response = client.post(
+                '/api/upload',
+                data={'file': (f, basename)},
+                content_type='multipart/form-data'
+            )
+        return response.get_json()['file']
+
+    if stage == 'upload':
+        def operation(client, i):
+            saved = upload(client)
+            return saved['saved_path']
+
+        def cleanup(saved_path):
+            handler.delete_file(saved_path)
+
+    elif stage == 'preview':
+        def operation(client, i):
+            return handler.generate_preview(source, f'bench_{i}', PREVIEW_WIDTH, PREVIEW_HEIGHT)
+
+        def cleanup(preview_path):
+            if preview_path:
+                os.remove(handler.layout.preview_path(os.path.basename(preview_path)[:-len('.png')]))
+
+    elif stage == 'convert':
+        def operation(client, i):
+            copy = os.path.join(handler.upload_folder, f'{i}_{basename}')
+            shutil.copyfile(source, copy)
+            start = time.perf_counter()
+            handler.convert_to_pdf(copy)
+            return copy, time.perf_counter() - start
+
+        def cleanup(result):
+            copy, _ = result
+            os.remove(copy)
+            pdf = os.path.splitext(copy)[0] + '.pdf'
+            if os.path.exists(pdf):
+                os.remove(pdf)
+
+    else:
+        with flask_app.test_client() as client:
+            stored = os.path.basename(upload(client)['saved_path'])
+
+        def operation(client, i):
+            response = client.post('/api/print', json={
+                'filename': stored,
+                'printer': SIM_PRINTERS[0]
+            })
+            if not response.get_json().get('success'):
+                raise RuntimeError(response.get_json().get('error'))
+
+        def cleanup(_):
+            pass
+
+    def run_one(i: int) -> float:
+        with flask_app.test_client() as client:
+            start = time.perf_counter()
+            result = operation(client, i)
+            elapsed = time.perf_counter() - start
+        # 转换场景只计转换本身，不计复制源文件
+        if stage == 'convert':
+            elapsed = result[1]
+        cleanup(result)
+        return elapsed
+
+    for i in range(warmup):
+        run_one(-1 - i)
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(run_one, range(iterations)))
+    else:
+        latencies = [run_one(i) for i in range(iterations)]
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    # 预览和转换在隔离进程中执行，先结束工作进程，RUSAGE_CHILDREN 才会计入它们
+    if handler.sandbox is not None:
+        handler.sandbox.shutdown()
+    result_queue.put({
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'throughput': iterations / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        # Linux 下 ru_maxrss 单位为KB；子进程部分为已结束子进程中最大的峰值
+        'peak_rss_mb': (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        ) / 1024
+    })
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_scenario(stage: str, kind: str, source: str, args) -> dict:
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(
+        target=_scenario_worker,
+        args=(stage, kind, source, args.iterations, args.warmup, args.concurrency, result_queue)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0 or result_queue.empty():
+        return {'error': f'子进程退出码 {process.exitcode}'}
+    return result_queue.get()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """与基线对比，返回退化项"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or 'error' in current or 'error' in previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {previous['throughput']:.2f}/s -> {current['throughput']:.2f}/s")
+        if current['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: 峰值内存 {previous['peak_rss_mb']:.0f}MB -> {current['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def print_table(results: dict):
+    header = f"{'场景':<18}{'吞吐/s':>10}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'RSS MB':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        if 'error' in r:
+            print(f"{name:<18}{r['error']}")
+            continue
+        print(f"{name:<18}{r['throughput']:>10.2f}{r['p50_ms']:>11.1f}{r['p95_ms']:>11.1f}"
+              f"{r['p99_ms']:>11.1f}{r['peak_rss_mb']:>10.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='远程打印服务基准测试')
+    parser.add_argument('-s', '--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('-k', '--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('-c', '--concurrency', type=int, default=1)
+    parser.add_argument('--scale', type=float, default=1.0, help='语料规模系数')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'print_bench_corpus'))
+    parser.add_argument('--output', help='结果写入JSON文件')
+    parser.add_argument('--baseline', help='与基线JSON对比')
+    parser.add_argument('--save-baseline', help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT)
+    from benchmarks.corpus import build_corpus
+
+    corpus_dir = os.path.join(args.corpus_dir, f'scale_{args.scale:g}')
+    print(f"生成语料: {corpus_dir}")
+    corpus = build_corpus(corpus_dir, args.scale)
+
+    results = {}
+    for stage in args.stages:
+        for kind in args.kinds:
+            if stage == 'convert' and kind in NO_CONVERT:
+                continue
+            name = f"{stage}/{kind}"
+            print(f"运行 {name} ...", flush=True)
+            results[name] = run_scenario(stage, kind, corpus[kind], args)
+
+    print()
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n基线已保存: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n性能退化 (容差 {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n与基线相比无退化 (容差 {args.tolerance:.0%})")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
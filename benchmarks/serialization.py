@@ -0,0 +1,104 @@
+"""
+列表接口序列化微基准
+
+    python -m benchmarks.serialization                 # 默认 5000 个任务/文件
+    python -m benchmarks.serialization -n 20000 -r 50
+
+分别测量 /api/jobs 和 /api/files 在标准库 json 与 orjson 下的耗时，
+以及模型 to_dict() 缓存命中/未命中的开销。打印后端使用模拟后端
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _measure(func, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'median_ms': statistics.median(samples),
+        'min_ms': samples[0]
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='列表接口序列化微基准')
+    parser.add_argument('-n', '--count', type=int, default=5000, help='任务和文件数量')
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench_json_')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['LOG_FILE'] = os.path.join(workdir, 'app.log')
+    os.environ['PRINT_BACKEND'] = 'simulated'
+    os.environ['JANITOR_ENABLED'] = 'false'
+    os.environ['JOB_HISTORY_LIMIT'] = str(args.count)
+    sys.path.insert(0, ROOT)
+
+    import logging
+    from flask.json.provider import DefaultJSONProvider
+
+    from backend import app as app_module
+    from backend.json_provider import OrjsonProvider, orjson
+    from backend.models import PrintJob, PrintJobStatus
+
+    logging.disable(logging.INFO)
+    flask_app = app_module.app
+
+    # 构造任务和文件
+    for i in range(args.count):
+        app_module.job_tracker.add(PrintJob(
+            job_id=f"{i:08x}",
+            filename=f"document_{i}.pdf",
+            file_path=f"/tmp/document_{i}.pdf",
+            file_type='application/pdf',
+            printer_name='Bench',
+            status=PrintJobStatus.COMPLETED
+        ))
+        path = app_module.storage_layout.upload_path(f"{i:08x}_document.pdf", create=True)
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+        app_module.file_catalog.add(path)
+
+    jobs = list(app_module.job_tracker._jobs.values())
+    results = {
+        'to_dict (未缓存)': _measure(
+            lambda: [job._build_dict() for job in jobs], args.repeat
+        ),
+        'to_dict (缓存)': _measure(
+            lambda: [job.to_dict() for job in jobs], args.repeat
+        )
+    }
+
+    providers = [('stdlib', DefaultJSONProvider)]
+    if orjson is not None:
+        providers.append(('orjson', OrjsonProvider))
+    else:
+        print("未安装 orjson，只测量标准库 json")
+
+    for name, provider_class in providers:
+        flask_app.json = provider_class(flask_app)
+        with flask_app.test_client() as client:
+            for endpoint in ('/api/jobs', '/api/files'):
+                results[f"{endpoint} [{name}]"] = _measure(
+                    lambda: client.get(endpoint), args.repeat
+                )
+
+    print(f"\n{args.count} 个任务/文件，每项 {args.repeat} 次")
+    print(f"{'场景':<28}{'中位数(ms)':>12}{'最小(ms)':>12}")
+    for name, result in results.items():
+        print(f"{name:<28}{result['median_ms']:>12.2f}{result['min_ms']:>12.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,30 +2,231 @@
  * 远程打印服务 - 前端应用
  */
 
+/**
+ * 自适应轮询
+ * - 页面隐藏时暂停，重新显示时立即刷新
+ * - 结果没有变化时间隔按倍数增加，直到 maxDelay；有变化时恢复基础间隔
+ * - 服务器通过 X-Poll-Interval 建议基础间隔，429/503 时按 Retry-After 退避
+ * - 同一浏览器的多个标签页通过 BroadcastChannel 共享结果：任一标签页
+ *   请求后广播结果和下一次间隔，其他标签页直接使用并推迟自己的请求
+ */
+class AdaptivePoller {
+    /**
+     * @param {string} name 轮询名称（广播消息的类型）
+     * @param {Function} task 执行一次请求，返回 {changed, active, interval, retryAfter, data}
+     * @param {Function} onShared 收到其他标签页广播的 data 时调用
+     * @param {Object} options baseDelay / maxDelay / factor（毫秒）
+     */
+    constructor(name, task, onShared, options = {}) {
+        this.name = name;
+        this.task = task;
+        this.onShared = onShared;
+        this.baseDelay = options.baseDelay || 5000;
+        this.maxDelay = options.maxDelay || 60000;
+        this.factor = options.factor || 2;
+        this.delay = this.baseDelay;
+        this.timer = null;
+        this.running = false;
+        
+        this.channel = 'BroadcastChannel' in window ? new BroadcastChannel('print-service-poll') : null;
+        if (this.channel) {
+            this.channel.addEventListener('message', (e) => {
+                if (!e.data || e.data.name !== this.name) return;
+                if (e.data.data !== undefined) {
+                    this.onShared(e.data.data);
+                }
+                // 比发送方稍晚一些，下一次仍由发送方请求，避免多个标签页同时请求
+                this.delay = e.data.delay;
+                this.schedule(e.data.delay * (1.1 + Math.random() * 0.1));
+            });
+        }
+        
+        document.addEventListener('visibilitychange', () => {
+            if (document.hidden) {
+                this.cancel();
+            } else {
+                this.trigger();
+            }
+        });
+    }
+
+    start() {
+        this.trigger();
+    }
+
+    /** 立即执行一次并恢复基础间隔（用户操作后调用） */
+    trigger() {
+        this.delay = this.baseDelay;
+        this.run();
+    }
+
+    cancel() {
+        clearTimeout(this.timer);
+        this.timer = null;
+    }
+
+    schedule(delay) {
+        this.cancel();
+        if (document.hidden) return;
+        this.timer = setTimeout(() => this.run(), delay);
+    }
+
+    async run() {
+        if (this.running || document.hidden) return;
+        this.running = true;
+        this.cancel();
+        
+        let outcome = {};
+        try {
+            outcome = (await this.task()) || {};
+        } catch (error) {
+            outcome = { changed: false };
+        } finally {
+            this.running = false;
+        }
+        
+        this.delay = this.nextDelay(outcome);
+        if (this.channel) {
+            this.channel.postMessage({ name: this.name, data: outcome.data, delay: this.delay });
+        }
+        this.schedule(this.delay);
+    }
+
+    nextDelay({ changed, active, interval, retryAfter }) {
+        if (interval) {
+            this.baseDelay = interval * 1000;
+        }
+        let delay;
+        if (active || changed) {
+            delay = this.baseDelay;
+        } else {
+            delay = Math.min(Math.max(this.delay, this.baseDelay) * this.factor, Math.max(this.maxDelay, this.baseDelay));
+        }
+        if (retryAfter) {
+            delay = Math.max(delay, retryAfter * 1000);
+        }
+        return delay;
+    }
+}
+
+/** 从响应头读取轮询提示 */
+function pollHints(response) {
+    const interval = parseFloat(response.headers.get('X-Poll-Interval'));
+    const retryAfter = parseFloat(response.headers.get('Retry-After'));
+    return {
+        interval: Number.isFinite(interval) && interval > 0 ? interval : null,
+        retryAfter: Number.isFinite(retryAfter) && retryAfter > 0 ? retryAfter : null
+    };
+}
+
+/**
+ * 在 Web Worker 中计算文件 SHA-256，浏览器不支持 Worker 时返回 null（不去重）
+ */
+class FileHasher {
+    constructor(url) {
+        this.url = url;
+        this.worker = undefined;
+        this.pending = new Map();
+        this.nextId = 0;
+    }
+
+    /** 首次使用时创建 Worker */
+    getWorker() {
+        if (this.worker !== undefined) return this.worker;
+        try {
+            this.worker = new Worker(this.url);
+        } catch (error) {
+            console.warn('无法创建哈希 Worker:', error);
+            this.worker = null;
+            return null;
+        }
+        this.worker.addEventListener('message', (e) => {
+            const { id, hash, error } = e.data;
+            const resolve = this.pending.get(id);
+            if (!resolve) return;
+            this.pending.delete(id);
+            if (error) console.warn('计算文件哈希失败:', error);
+            resolve(error ? null : hash);
+        });
+        this.worker.addEventListener('error', (e) => {
+            console.warn('哈希 Worker 出错:', e.message);
+            this.worker.terminate();
+            this.worker = null;
+            this.pending.forEach((resolve) => resolve(null));
+            this.pending.clear();
+        });
+        return this.worker;
+    }
+
+    hash(blob) {
+        const worker = this.getWorker();
+        if (!worker) return Promise.resolve(null);
+        const id = this.nextId++;
+        return new Promise((resolve) => {
+            this.pending.set(id, resolve);
+            worker.postMessage({ id, file: blob });
+        });
+    }
+}
+
+/** 以不超过 limit 的并发对 items 执行 task */
+async function runLimited(items, limit, task) {
+    let next = 0;
+    const workers = Array.from({ length: Math.min(limit, items.length) }, async () => {
+        while (next < items.length) {
+            await task(items[next++]);
+        }
+    });
+    await Promise.all(workers);
+}
+
 class PrintService {
     constructor() {
         this.apiBase = '/api';
         this.files = [];
+        // 增量同步：本地条目和服务器返回的版本令牌
+        this.fileMap = new Map();
+        this.fileToken = null;
+        this.jobMap = new Map();
+        this.jobToken = null;
         this.selectedFile = null;
         this.currentPreviewFile = null;
+        this.printerStatus = null;
+        
+        // 上传：并发数、进行中的条目（总进度按字节计算）
+        this.uploadConcurrency = 3;
+        this.uploads = new Set();
+        // 服务器要求退避时整个上传队列暂停到此时间（毫秒时间戳）
+        this.uploadResumeAt = 0;
+        this.uploadBackoff = 0;
+        this.hasher = new FileHasher('/static/js/hash-worker.js');
+        // 超过打印分辨率（A4 300dpi 的长边）的图片可在上传前缩小
+        this.downscaleMaxEdge = 3508;
+        this.downscaleTypes = new Set(['image/jpeg', 'image/png', 'image/bmp']);
         
         this.init();
     }
 
     init() {
         this.bindEvents();
-        this.loadPrinterStatus();
         this.loadPrinters();
         this.loadFiles();
-        this.loadJobs();
         
-        // 定时刷新状态（不中断初始化）
-        setInterval(() => {
-            this.loadPrinterStatus().catch(() => {});
-        }, 10000);
-        setInterval(() => {
-            this.loadJobs().catch(() => {});
-        }, 5000);
+        // 自适应轮询任务和打印机状态
+        this.jobPoller = new AdaptivePoller(
+            'jobs',
+            () => this.loadJobs(),
+            (data) => this.applySharedJobs(data),
+            { baseDelay: 5000, maxDelay: 60000 }
+        );
+        this.statusPoller = new AdaptivePoller(
+            'printer-status',
+            () => this.loadPrinterStatus(),
+            (data) => this.renderPrinterStatus(data),
+            { baseDelay: 10000, maxDelay: 120000 }
+        );
+        this.jobPoller.start();
+        this.statusPoller.start();
     }
 
     bindEvents() {
@@ -62,7 +263,7 @@ class PrintService {
         });
         
         document.getElementById('refreshJobsBtn').addEventListener('click', () => {
-            this.loadJobs();
+            this.jobPoller.trigger();
         });
 
         // 预览模态框
@@ -90,53 +291,275 @@ class PrintService {
         });
     }
 
+    /**
+     * 上传文件
+     * 1. 按需缩小超大图片，在 Worker 中计算内容哈希
+     * 2. 向服务器查询哪些内容已经上传过，跳过这些文件（同一批中的重复文件只传一次）
+     * 3. 其余文件并发上传，每个文件单独显示进度，429/503 时整个队列按 Retry-After 暂停后重试
+     */
     async uploadFiles(files) {
         if (!files || files.length === 0) return;
         
-        const uploadProgress = document.getElementById('uploadProgress');
-        const progressFill = document.getElementById('progressFill');
-        const progressText = document.getElementById('progressText');
+        if (this.uploads.size === 0) {
+            this.uploadBackoff = 0;
+        }
+        const uploadList = document.getElementById('uploadList');
+        uploadList.querySelectorAll('.upload-item.failed').forEach((row) => row.remove());
+        document.getElementById('uploadProgress').style.display = 'flex';
         
-        uploadProgress.style.display = 'flex';
+        const items = Array.from(files).map((file) => {
+            const item = { name: file.name, blob: file, loaded: 0, total: file.size, row: this.createUploadRow(file) };
+            uploadList.appendChild(item.row);
+            this.uploads.add(item);
+            return item;
+        });
+        this.updateUploadProgress();
         
-        for (let i = 0; i < files.length; i++) {
-            const file = files[i];
-            const formData = new FormData();
-            formData.append('file', file);
-            
-            try {
-                const response = await fetch(`${this.apiBase}/upload`, {
-                    method: 'POST',
-                    body: formData
-                });
-                
-                const result = await response.json();
-                
-                if (result.success) {
-                    this.showNotification(`文件 "${file.name}" 上传成功`, 'success');
-                    this.loadFiles();
-                } else {
-                    this.showNotification(`文件 "${file.name}" 上传失败: ${result.error}`, 'error');
-                }
-                
-                // 更新进度
-                const progress = ((i + 1) / files.length) * 100;
-                progressFill.style.width = `${progress}%`;
-                progressText.textContent = `${Math.round(progress)}%`;
-                
-            } catch (error) {
-                this.showNotification(`文件 "${file.name}" 上传失败: ${error.message}`, 'error');
+        // 缩小图片占用内存较多，逐个处理；哈希在 Worker 中依次计算
+        for (const item of items) {
+            this.setUploadState(item, 'preparing', '准备中');
+            item.blob = await this.downscaleImage(item.blob);
+            item.total = item.blob.size;
+            item.hash = await this.hasher.hash(item.blob);
+        }
+        
+        const existing = await this.findExisting(items.map((item) => item.hash).filter(Boolean));
+        const seen = new Map();
+        const pending = [];
+        let skipped = 0;
+        for (const item of items) {
+            const found = item.hash && (existing[item.hash] || seen.get(item.hash));
+            if (found) {
+                item.loaded = item.total;
+                this.setUploadState(item, 'skipped', found.filename ? '已存在，跳过' : `与 "${found.name}" 相同，跳过`);
+                skipped++;
+            } else {
+                if (item.hash) seen.set(item.hash, item);
+                pending.push(item);
             }
         }
+        this.updateUploadProgress();
         
-        // 重置进度条
+        let failed = 0;
+        await runLimited(pending, this.uploadConcurrency, async (item) => {
+            if (!await this.uploadOne(item)) failed++;
+        });
+        
+        const uploaded = pending.length - failed;
+        if (failed === 0) {
+            const message = items.length === 1 && uploaded === 1
+                ? `文件 "${items[0].name}" 上传成功`
+                : `已上传 ${uploaded} 个文件${skipped ? `，跳过 ${skipped} 个已存在的文件` : ''}`;
+            this.showNotification(message, 'success');
+        } else {
+            this.showNotification(`${failed} 个文件上传失败，已上传 ${uploaded} 个${skipped ? `，跳过 ${skipped} 个` : ''}`, 'error');
+        }
+        if (uploaded > 0 || skipped > 0) {
+            this.loadFiles();
+        }
+        
+        // 保留失败的条目，其余条目和进度条稍后清除
         setTimeout(() => {
-            uploadProgress.style.display = 'none';
-            progressFill.style.width = '0%';
-            progressText.textContent = '0%';
+            items.forEach((item) => {
+                this.uploads.delete(item);
+                if (!item.row.classList.contains('failed')) item.row.remove();
+            });
+            if (this.uploads.size === 0) {
+                document.getElementById('uploadProgress').style.display = 'none';
+            }
+            this.updateUploadProgress();
         }, 1000);
     }
 
+    /**
+     * 上传单个文件，返回是否成功
+     * 429/503 时暂停整个上传队列（所有并发上传）到 Retry-After 之后再重试，
+     * 不设重试次数上限，避免多个并发上传争抢限速令牌导致批量上传中途失败
+     */
+    async uploadOne(item) {
+        for (let attempt = 0; ; attempt++) {
+            await this.waitUploadResume(item);
+            this.setUploadState(item, 'uploading', '上传中');
+            const { status, retryAfter, result } = await this.sendUpload(item);
+            
+            if (status === 429 || status === 503) {
+                const wait = retryAfter || Math.min(Math.pow(2, attempt), 60);
+                this.uploadBackoff = wait * 1000;
+                this.uploadResumeAt = Math.max(this.uploadResumeAt, Date.now() + this.uploadBackoff);
+                item.loaded = 0;
+                this.updateUploadProgress();
+                continue;
+            }
+            
+            item.loaded = item.total;
+            this.updateUploadProgress();
+            if (result.success) {
+                this.setUploadState(item, 'done', '完成');
+                return true;
+            }
+            this.setUploadState(item, 'failed', result.error || '上传失败');
+            return false;
+        }
+    }
+
+    /**
+     * 上传队列暂停期间等待（其他上传可能在等待期间再次延长暂停）
+     * 被限速后本批其余上传按退避间隔依次发出，不同时争抢刚补充的令牌，
+     * 也避免被拒绝的请求重复发送整个文件
+     */
+    async waitUploadResume(item) {
+        while (Date.now() < this.uploadResumeAt) {
+            const wait = this.uploadResumeAt - Date.now();
+            this.setUploadState(item, 'waiting', `服务繁忙，${Math.ceil(wait / 1000)} 秒后重试`);
+            await new Promise((resolve) => setTimeout(resolve, Math.min(wait, 1000)));
+        }
+        if (this.uploadBackoff > 0) {
+            this.uploadResumeAt = Date.now() + this.uploadBackoff;
+        }
+    }
+
+    /** 用 XHR 发送（fetch 不提供上传进度） */
+    sendUpload(item) {
+        return new Promise((resolve) => {
+            const xhr = new XMLHttpRequest();
+            xhr.open('POST', `${this.apiBase}/upload`);
+            
+            xhr.upload.addEventListener('progress', (e) => {
+                if (!e.lengthComputable) return;
+                // 请求体还包含表单字段，按比例折算到文件大小
+                item.loaded = item.total * e.loaded / e.total;
+                item.row.querySelector('.upload-item-fill').style.width = `${e.loaded / e.total * 100}%`;
+                this.updateUploadProgress();
+            });
+            
+            xhr.addEventListener('load', () => {
+                let result;
+                try {
+                    result = JSON.parse(xhr.responseText);
+                } catch (error) {
+                    result = { success: false, error: `HTTP ${xhr.status}` };
+                }
+                const retryAfter = parseFloat(xhr.getResponseHeader('Retry-After'));
+                resolve({
+                    status: xhr.status,
+                    retryAfter: Number.isFinite(retryAfter) && retryAfter > 0 ? retryAfter : null,
+                    result
+                });
+            });
+            
+            xhr.addEventListener('error', () => {
+                resolve({ status: 0, retryAfter: null, result: { success: false, error: '网络错误' } });
+            });
+            
+            const formData = new FormData();
+            formData.append('file', item.blob, item.name);
+            xhr.send(formData);
+        });
+    }
+
+    /** 查询已上传过的内容，返回 {哈希: 文件条目}；查询失败时按都不存在处理 */
+    async findExisting(hashes) {
+        const unique = [...new Set(hashes)];
+        if (unique.length === 0) return {};
+        try {
+            const response = await fetch(`${this.apiBase}/files/exists`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ hashes: unique })
+            });
+            const result = await response.json();
+            return result.success ? result.files : {};
+        } catch (error) {
+            console.warn('查询已上传文件失败:', error);
+            return {};
+        }
+    }
+
+    /**
+     * 按需把超过打印分辨率的图片缩小到 downscaleMaxEdge
+     * 缩小后没有变小、浏览器不支持或解码失败时返回原文件
+     */
+    async downscaleImage(file) {
+        const option = document.getElementById('downscaleImages');
+        if (!option || !option.checked || !this.downscaleTypes.has(file.type) || !window.createImageBitmap) {
+            return file;
+        }
+        
+        let bitmap;
+        try {
+            // 按 EXIF 方向旋转，画布输出不保留 EXIF
+            bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        } catch (error) {
+            return file;
+        }
+        
+        const scale = this.downscaleMaxEdge / Math.max(bitmap.width, bitmap.height);
+        if (scale >= 1) {
+            bitmap.close();
+            return file;
+        }
+        
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+        
+        const type = file.type === 'image/png' ? 'image/png' : 'image/jpeg';
+        const blob = await new Promise((resolve) => canvas.toBlob(resolve, type, 0.92));
+        if (!blob || blob.size >= file.size) {
+            return file;
+        }
+        // BMP 转为 JPEG 后扩展名随之改变
+        const name = file.type === 'image/bmp' ? file.name.replace(/\.bmp$/i, '.jpg') : file.name;
+        return new File([blob], name, { type, lastModified: file.lastModified });
+    }
+
+    createUploadRow(file) {
+        const row = document.createElement('li');
+        row.className = 'upload-item';
+        
+        const name = document.createElement('span');
+        name.className = 'upload-item-name';
+        name.textContent = file.name;
+        name.title = file.name;
+        
+        const bar = document.createElement('div');
+        bar.className = 'upload-item-bar';
+        const fill = document.createElement('div');
+        fill.className = 'upload-item-fill';
+        bar.appendChild(fill);
+        
+        const status = document.createElement('span');
+        status.className = 'upload-item-status';
+        
+        row.append(name, bar, status);
+        return row;
+    }
+
+    setUploadState(item, state, text) {
+        item.row.className = `upload-item ${state}`;
+        item.row.querySelector('.upload-item-status').textContent = text;
+        if (state === 'done' || state === 'skipped') {
+            item.row.querySelector('.upload-item-fill').style.width = '100%';
+        } else if (state !== 'uploading') {
+            item.row.querySelector('.upload-item-fill').style.width = '0%';
+        }
+    }
+
+    /** 总进度：所有进行中条目已发送的字节数占比 */
+    updateUploadProgress() {
+        let loaded = 0;
+        let total = 0;
+        this.uploads.forEach((item) => {
+            loaded += item.loaded;
+            total += item.total;
+        });
+        const progress = total > 0 ? loaded / total * 100 : 0;
+        document.getElementById('progressFill').style.width = `${progress}%`;
+        document.getElementById('progressText').textContent = `${Math.round(progress)}%`;
+    }
+
     async loadPrinters() {
         try {
             const controller = new AbortController();
@@ -177,6 +600,8 @@ class PrintService {
     }
 
     async loadPrinterStatus() {
+        let hints = {};
+        let result;
         try {
             const controller = new AbortController();
             const timeoutId = setTimeout(() => controller.abort(), 5000);
@@ -185,40 +610,44 @@ class PrintService {
                 signal: controller.signal
             });
             clearTimeout(timeoutId);
+            hints = pollHints(response);
             
-            const result = await response.json();
-            
-            const statusDot = document.getElementById('statusDot');
-            const statusText = document.getElementById('statusText');
-            
-            if (result.success) {
-                statusDot.className = 'status-dot';
-                
-                switch (result.status) {
-                    case 'idle':
-                        statusDot.classList.add('online');
-                        statusText.textContent = '就绪';
-                        break;
-                    case 'processing':
-                        statusDot.classList.add('busy');
-                        statusText.textContent = '工作中';
-                        break;
-                    case 'stopped':
-                        statusDot.classList.add('offline');
-                        statusText.textContent = '已停止';
-                        break;
-                    default:
-                        statusDot.classList.add('offline');
-                        statusText.textContent = '未知状态';
-                }
-            } else {
-                statusDot.classList.add('offline');
-                statusText.textContent = '连接失败';
-            }
-            
+            result = await response.json();
         } catch (error) {
-            const statusDot = document.getElementById('statusDot');
-            const statusText = document.getElementById('statusText');
+            result = { success: false };
+        }
+        
+        const changed = JSON.stringify(result) !== JSON.stringify(this.printerStatus);
+        this.renderPrinterStatus(result);
+        return { changed, ...hints, data: result };
+    }
+
+    renderPrinterStatus(result) {
+        this.printerStatus = result;
+        const statusDot = document.getElementById('statusDot');
+        const statusText = document.getElementById('statusText');
+        
+        statusDot.className = 'status-dot';
+        
+        if (result.success) {
+            switch (result.status) {
+                case 'idle':
+                    statusDot.classList.add('online');
+                    statusText.textContent = '就绪';
+                    break;
+                case 'processing':
+                    statusDot.classList.add('busy');
+                    statusText.textContent = '工作中';
+                    break;
+                case 'stopped':
+                    statusDot.classList.add('offline');
+                    statusText.textContent = '已停止';
+                    break;
+                default:
+                    statusDot.classList.add('offline');
+                    statusText.textContent = '未知状态';
+            }
+        } else {
             statusDot.classList.add('offline');
             statusText.textContent = '连接失败';
         }
@@ -226,13 +655,16 @@ class PrintService {
 
     async loadFiles() {
         try {
-            const response = await fetch(`${this.apiBase}/files`);
+            const response = await fetch(this.syncUrl('files', this.fileToken));
             const result = await response.json();
             console.log('[Files] 响应数据:', result);
             
             if (result.success) {
-                this.files = result.files;
-                this.renderFiles(result.files);
+                this.fileToken = result.token;
+                if (this.applySync(this.fileMap, result, 'files', 'filename')) {
+                    this.files = this.sortedValues(this.fileMap, 'created');
+                    this.renderFiles(this.files);
+                }
             } else {
                 console.warn('[Files] 获取失败:', result.error);
             }
@@ -406,7 +838,7 @@ class PrintService {
             
             if (result.success) {
                 this.showNotification(`打印任务已提交: ${result.job.job_id}`, 'success');
-                this.loadJobs();
+                this.jobPoller.trigger();
                 
                 // 清空页码范围输入
                 document.getElementById('pageRangeInput').value = '';
@@ -443,21 +875,31 @@ class PrintService {
         }
     }
 
+    /**
+     * 同步任务列表，返回轮询结果：是否有变化、是否有未结束任务和服务器提示
+     */
     async loadJobs() {
+        let hints = {};
+        let changed = false;
         try {
             const controller = new AbortController();
             const timeoutId = setTimeout(() => controller.abort(), 5000);
             
-            const response = await fetch(`${this.apiBase}/jobs`, {
+            const response = await fetch(this.syncUrl('jobs', this.jobToken), {
                 signal: controller.signal
             });
             clearTimeout(timeoutId);
+            hints = pollHints(response);
             
             const result = await response.json();
             console.log('[Jobs] 响应数据:', result);
             
             if (result.success) {
-                this.renderJobs(result.cups_jobs || []);
+                this.jobToken = result.token;
+                changed = this.applySync(this.jobMap, result, 'jobs', 'job_id');
+                if (changed) {
+                    this.renderJobs(this.sortedValues(this.jobMap, 'created_at'));
+                }
             } else {
                 console.warn('[Jobs] 获取失败:', result.error);
             }
@@ -471,6 +913,54 @@ class PrintService {
                 console.error('[Jobs] 加载失败:', error);
             }
         }
+        
+        // 有变化时把完整列表广播给其他标签页（各标签页的增量令牌互不通用）
+        return {
+            changed,
+            active: this.hasActiveJobs(),
+            ...hints,
+            data: changed ? { token: this.jobToken, jobs: Array.from(this.jobMap.values()) } : undefined
+        };
+    }
+
+    applySharedJobs(data) {
+        this.jobToken = data.token;
+        this.applySync(this.jobMap, { delta: false, jobs: data.jobs }, 'jobs', 'job_id');
+        this.renderJobs(this.sortedValues(this.jobMap, 'created_at'));
+    }
+
+    hasActiveJobs() {
+        return Array.from(this.jobMap.values()).some(job =>
+            ['pending', 'processing', 'printing'].includes(job.status)
+        );
+    }
+
+    syncUrl(resource, token) {
+        const url = `${this.apiBase}/${resource}`;
+        return token ? `${url}?since=${encodeURIComponent(token)}` : url;
+    }
+
+    /**
+     * 将列表响应合并到本地 Map，返回是否有变化
+     * 增量响应只更新/删除变化的条目，完整响应替换全部条目
+     */
+    applySync(map, result, listKey, idKey) {
+        if (!result.delta) {
+            map.clear();
+            (result[listKey] || []).forEach(item => map.set(item[idKey], item));
+            return true;
+        }
+        
+        (result.deleted || []).forEach(id => map.delete(id));
+        (result.updated || []).forEach(item => map.set(item[idKey], item));
+        return (result.deleted || []).length > 0 || (result.updated || []).length > 0;
+    }
+
+    sortedValues(map, dateKey) {
+        // ISO 时间字符串可以直接按字典序比较
+        return Array.from(map.values()).sort((a, b) =>
+            (b[dateKey] || '').localeCompare(a[dateKey] || '')
+        );
     }
 
     renderJobs(jobs) {
@@ -488,21 +978,22 @@ class PrintService {
             const item = document.createElement('div');
             item.className = 'job-item';
             
-            const statusClass = this.getJobStatusClass(job.state);
+            const cancellable = ['pending', 'processing', 'printing'].includes(job.status);
             
             item.innerHTML = `
                 <div class="job-info">
                     <div class="job-name">
-                        ${job.name || '未知任务'}
-                        <span class="job-status ${statusClass}">${this.getJobStatusText(job.state)}</span>
+                        ${job.filename || '未知任务'}
+                        <span class="job-status ${job.status}">${this.getJobStatusText(job)}</span>
                     </div>
                     <div class="job-meta">
-                        打印机: ${job.printer || '未知'} | 
-                        用户: ${job.user || '未知'} | 
-                        大小: ${this.formatSize(job.size)}
+                        打印机: ${job.printer_name || '未知'} | 
+                        份数: ${job.copies || 1} | 
+                        提交: ${this.formatTime(job.created_at)}${job.completed_at ? ` | 结束: ${this.formatTime(job.completed_at)}` : ''}
+                        ${job.error_message ? ` | 错误: ${job.error_message}` : ''}
                     </div>
                 </div>
-                ${job.state === 3 ? `<button class="btn btn-danger btn-sm cancel-job-btn" data-job-id="${job.job_id}">取消</button>` : ''}
+                ${cancellable ? `<button class="btn btn-danger btn-sm cancel-job-btn" data-job-id="${job.job_id}">取消</button>` : ''}
             `;
             
             // 取消任务按钮
@@ -517,34 +1008,31 @@ class PrintService {
         });
     }
 
-    getJobStatusClass(state) {
-        const stateMap = {
-            1: 'pending',
-            2: 'pending',
-            3: 'completed',
-            4: 'pending',
-            5: 'cancelled',
-            6: 'cancelled',
-            7: 'cancelled',
-            8: 'failed',
-            9: 'failed'
-        };
-        return stateMap[state] || 'pending';
-    }
-
-    getJobStatusText(state) {
-        const stateMap = {
-            1: '等待中',
-            2: '排队中',
-            3: '完成',
-            4: '处理中',
-            5: '已停止',
-            6: '已取消',
-            7: '已中止',
-            8: '失败',
-            9: '失败'
+    getJobStatusText(job) {
+        // 打印中的任务按CUPS状态细分
+        if (job.status === 'printing') {
+            const cupsStateMap = {
+                3: '排队中',
+                4: '已挂起',
+                5: '打印中',
+                6: '已暂停'
+            };
+            return cupsStateMap[job.cups_state] || '打印中';
+        }
+        
+        const statusMap = {
+            'pending': '等待中',
+            'processing': '处理中',
+            'completed': '完成',
+            'failed': '失败',
+            'cancelled': '已取消'
         };
-        return stateMap[state] || '未知';
+        return statusMap[job.status] || '未知';
+    }
+
+    formatTime(isoString) {
+        if (!isoString) return '-';
+        return new Date(isoString).toLocaleTimeString();
     }
 
     async cancelJob(jobId) {
@@ -561,7 +1049,7 @@ class PrintService {
             
             if (result.success) {
                 this.showNotification('任务已取消', 'success');
-                this.loadJobs();
+                this.jobPoller.trigger();
             } else {
                 this.showNotification(`取消失败: ${result.error}`, 'error');
             }
@@ -7,9 +7,11 @@ import sys
 # 确保backend模块可以被导入
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from backend.app import app
-
 if __name__ == '__main__':
+    # 转换隔离进程和DOCX渲染进程（forkserver）会以 __mp_main__ 重新导入本脚本，
+    # 只在直接运行时初始化应用
+    from backend.app import app
+    
     port = int(os.environ.get('SERVICE_PORT', 5000))
     host = os.environ.get('SERVICE_HOST', '0.0.0.0')
     debug = os.environ.get('DEBUG_MODE', 'false').lower() == 'true'
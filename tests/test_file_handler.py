@@ -0,0 +1,39 @@
+"""图片转PDF的页面方向"""
+import re
+
+from PIL import Image
+
+from backend.file_handler import FileHandler, EXIF_ORIENTATION
+
+
+def _media_box(pdf_path):
+    with open(pdf_path, 'rb') as f:
+        match = re.search(rb'/MediaBox\s*\[\s*([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)', f.read())
+    return [float(value) for value in match.groups()]
+
+
+def test_exif_rotated_portrait_photo_uses_portrait_page(tmp_path):
+    # 传感器方向为横向，EXIF 标记顺时针旋转90度，实际是竖拍照片
+    source = tmp_path / 'photo.jpg'
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    Image.new('RGB', (2400, 1800), 'red').save(source, exif=exif)
+
+    handler = FileHandler(str(tmp_path / 'uploads'), str(tmp_path / 'previews'))
+    output = tmp_path / 'photo.pdf'
+    handler._image_to_pdf(str(source), str(output))
+
+    _, _, width, height = _media_box(output)
+    assert width < height
+
+
+def test_landscape_photo_uses_landscape_page(tmp_path):
+    source = tmp_path / 'wide.jpg'
+    Image.new('RGB', (2400, 1800), 'blue').save(source)
+
+    handler = FileHandler(str(tmp_path / 'uploads'), str(tmp_path / 'previews'))
+    output = tmp_path / 'wide.pdf'
+    handler._image_to_pdf(str(source), str(output))
+
+    _, _, width, height = _media_box(output)
+    assert width > height